@@ -1,6 +1,6 @@
 from functools import lru_cache
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
 from pydantic import AnyHttpUrl, BaseSettings, Field
 
@@ -12,8 +12,123 @@ class Settings(BaseSettings):
     secret_key: str = Field("change-me", description="Secret key for signing JWT tokens")
     access_token_expire_minutes: int = Field(60 * 8, description="Access token lifetime in minutes")
     algorithm: str = Field("HS256", description="JWT signing algorithm")
+    principal_cache_ttl_seconds: int = Field(
+        30, description="Seconds an authenticated principal is cached per token (0 disables the cache)"
+    )
+    principal_cache_max_entries: int = Field(10_000, description="Maximum number of cached principals")
+    token_embed_permissions: bool = Field(
+        False, description="Embed user id, member and permissions in access tokens to authorize without queries"
+    )
+    permission_version_check_seconds: int = Field(
+        5, description="How long the current permission version is trusted before it is re-read"
+    )
     database_url: str = Field("sqlite:///./data/app.db", description="Database URL")
+    database_profile: str = Field(
+        "tuned", description="'tuned' applies the SQLite and pool settings below; 'default' keeps driver defaults"
+    )
+    sqlite_journal_mode: str = Field("wal", description="SQLite journal mode; WAL lets readers run alongside a writer")
+    sqlite_synchronous: str = Field("normal", description="SQLite synchronous level (NORMAL is durable in WAL mode)")
+    sqlite_busy_timeout_ms: int = Field(5000, description="How long SQLite waits for a lock before failing")
+    sqlite_mmap_size: int = Field(256 * 1024 * 1024, description="Bytes of the SQLite database file memory-mapped")
+    sqlite_cache_size_kib: int = Field(16 * 1024, description="SQLite page cache per connection in KiB")
+    db_pool_size: int = Field(10, description="Connections kept open in the pool")
+    db_max_overflow: int = Field(20, description="Extra connections opened under load beyond DB_POOL_SIZE")
+    db_pool_timeout_seconds: float = Field(30, description="How long a request waits for a free pooled connection")
+    db_pool_recycle_seconds: int = Field(
+        30 * 60, description="Age after which pooled connections are replaced (-1 never replaces them)"
+    )
+    db_pool_pre_ping: bool = Field(True, description="Check server connections are alive before handing them out")
+    db_statement_timeout_ms: int = Field(0, description="PostgreSQL statement_timeout in milliseconds (0 disables)")
+    database_replica_urls: List[str] = Field(
+        default_factory=list, description="Read replicas serving GET list and download endpoints"
+    )
+    replica_max_lag_seconds: float = Field(5.0, description="Replicas further behind the primary are not read from")
+    replica_check_interval_seconds: float = Field(1.0, description="How often replica health and lag are measured")
+    password_hash_workers: int = Field(4, description="Threads dedicated to bcrypt hashing and verification")
+    password_hash_queue_size: int = Field(
+        64, description="Hashing requests allowed to wait for a worker before new ones are rejected"
+    )
+    storage_backend: str = Field("local", description="Where file content is stored: 'local' or 's3'")
     upload_dir: Path = Field(Path("storage/files"), description="Filesystem directory for uploaded files")
+    s3_bucket: str = Field("", description="Bucket used by the s3 storage backend")
+    s3_prefix: str = Field("", description="Key prefix for objects in the S3 bucket")
+    s3_endpoint_url: Optional[str] = Field(None, description="Endpoint of an S3-compatible service such as MinIO")
+    s3_region: Optional[str] = Field(None, description="S3 region name")
+    s3_access_key_id: Optional[str] = Field(None, description="S3 access key (defaults to the boto3 credential chain)")
+    s3_secret_access_key: Optional[str] = Field(None, description="S3 secret key")
+    s3_part_size: int = Field(8 * 1024 * 1024, description="Multipart upload part size for S3 (at least 5 MiB)")
+    storage_presigned_downloads: bool = Field(
+        False, description="Redirect downloads to presigned URLs when the storage backend supports them"
+    )
+    presign_expires_seconds: int = Field(300, description="Lifetime of presigned download URLs")
+    content_addressed_storage: bool = Field(
+        False, description="Store uploads once per SHA-256 and share them between identical files"
+    )
+    storage_fanout_levels: int = Field(
+        0, description="Levels of hash-prefix subdirectories under UPLOAD_DIR (0 keeps a flat directory)"
+    )
+    storage_fanout_width: int = Field(2, description="Hex characters per fan-out directory level")
+    storage_codec: str = Field(
+        "none", description="Compress stored files with 'gzip' or 'zstd' (requires zstandard), or 'none'"
+    )
+    storage_codec_level: Optional[int] = Field(None, description="Compression level (the codec's default if unset)")
+    storage_codec_frame_size: int = Field(
+        1024 * 1024, description="Bytes of a file compressed as one independently decodable frame"
+    )
+    upload_buffer_size: int = Field(1024 * 1024, description="Chunk size in bytes used when streaming uploads to disk")
+    upload_digest_algorithms: List[str] = Field(
+        default_factory=lambda: ["sha256"],
+        description="hashlib algorithms computed while an upload is written (sha256 is always included)",
+    )
+    upload_max_file_size: int = Field(0, description="Largest file a single upload may store in bytes (0 is unlimited)")
+    member_storage_quota_bytes: int = Field(
+        0, description="Total size of the files a member may store in bytes (0 is unlimited)"
+    )
+    total_storage_quota_bytes: int = Field(0, description="Total size of all stored files in bytes (0 is unlimited)")
+    upload_part_size: int = Field(8 * 1024 * 1024, description="Default part size for resumable uploads")
+    upload_max_part_size: int = Field(64 * 1024 * 1024, description="Largest part size a client may request")
+    upload_session_ttl_seconds: int = Field(
+        24 * 60 * 60, description="Idle time after which an unfinished resumable upload is discarded"
+    )
+    upload_session_gc_interval_seconds: int = Field(
+        10 * 60, description="How often abandoned resumable uploads and unreferenced blobs are garbage-collected"
+    )
+    blocking_pool_size: int = Field(
+        40, description="Maximum worker threads running blocking database and storage calls concurrently"
+    )
+    audit_strict: bool = Field(
+        False, description="Write audit entries in the same transaction as the change they record"
+    )
+    audit_queue_size: int = Field(10_000, description="Audit entries buffered in memory before writers wait")
+    audit_batch_size: int = Field(500, description="Maximum audit entries inserted per transaction")
+    audit_flush_interval_seconds: float = Field(
+        0.5, description="Longest time a queued audit entry waits before its batch is written"
+    )
+    audit_enqueue_timeout_seconds: float = Field(
+        1.0, description="How long a request waits for room in a full audit queue before writing directly"
+    )
+    audit_retention_days: int = Field(
+        0, description="Age in days after which audit entries move to monthly archive tables (0 keeps them live)"
+    )
+    audit_archive_batch_size: int = Field(1000, description="Audit entries moved to the archive per transaction")
+    audit_archive_interval_seconds: int = Field(60 * 60, description="How often expired audit entries are archived")
+    metrics_enabled: bool = Field(True, description="Record request, database and storage metrics served at /metrics")
+    metrics_require_auth: bool = Field(
+        True, description="Serve /metrics only to MANAGE_SETTINGS tokens; disable for scrapers on a trusted network"
+    )
+    profiling_enabled: bool = Field(False, description="Record stack samples and SQL timings of selected requests")
+    profiling_sample_rate: float = Field(
+        0.0, ge=0, le=1, description="Fraction of requests whose profile is kept regardless of duration"
+    )
+    profiling_slow_request_ms: float = Field(
+        1000, description="Keep the profile of any request slower than this (0 keeps only sampled requests)"
+    )
+    profiling_paths: List[str] = Field(
+        default_factory=list, description="Path prefixes to profile, e.g. [\"/files/\", \"/users/\"]; empty profiles all"
+    )
+    profiling_sample_interval_ms: float = Field(5.0, description="Interval between stack samples of profiled requests")
+    profiling_max_profiles: int = Field(50, description="Most recent profiles kept in memory")
+    profiling_max_queries: int = Field(1000, description="SQL statements recorded per profile")
     cors_origins: List[AnyHttpUrl] = Field(default_factory=list, description="Allowed CORS origins")
     initial_admin_username: str = Field("admin", description="Username for the bootstrap admin user")
     initial_admin_password: str = Field("admin", description="Password for the bootstrap admin user")
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import functools
+from typing import Callable, TypeVar
+
+import anyio.to_thread
+
+from ..config import get_settings
+
+settings = get_settings()
+
+T = TypeVar("T")
+
+
+def configure_threadpool() -> None:
+    """Bound the worker threadpool used for blocking database and storage work.
+
+    Route handlers and dependencies that touch the database or the filesystem are plain
+    ``def`` functions, which FastAPI executes on this pool so the event loop stays free to
+    serve other requests (``/health`` in particular) while uploads or SQLite locks block.
+    """
+
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = settings.blocking_pool_size
+
+
+async def run_blocking(func: Callable[..., T], *args, **kwargs) -> T:
+    """Run ``func`` on the bounded worker threadpool from async code."""
+
+    return await anyio.to_thread.run_sync(functools.partial(func, *args, **kwargs))
@@ -0,0 +1,278 @@
+"""In-process metrics rendered in the Prometheus text exposition format.
+
+Counters and histograms are plain dictionaries guarded by a lock, so recording a sample
+costs a dictionary lookup and a bisect. Values owned by other components (cache hit
+counts, audit writer counters) are read only when ``/metrics`` is scraped, through
+collectors registered with :func:`register_collector`.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; spans fast cached requests up to slow uploads.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+Labels = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Sequence[str]) -> Labels:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(label) for label in labels)
+
+    def samples(self) -> Iterable[Sample]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, *labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: a count per bucket (the last one is +Inf), then the sum.
+        self._values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            values = [(key, list(counts), total[0]) for key, (counts, total) in self._values.items()]
+        for key, counts, total in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield f"{self.name}_count", labels, cumulative
+            yield f"{self.name}_sum", labels, total
+
+
+@dataclass
+class CollectedMetric:
+    """A metric read from its owner at scrape time."""
+
+    name: str
+    help: str
+    kind: str
+    samples: List[Sample]
+
+
+Collector = Callable[[], Iterable[CollectedMetric]]
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Collector] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def register_collector(self, collector: Collector) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        families = [CollectedMetric(m.name, m.help, m.kind, list(m.samples())) for m in self._metrics.values()]
+        for collector in self._collectors:
+            families.extend(collector())
+        for family in families:
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for name, labels, value in family.samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+    return registry.register(Counter(name, help_text, labelnames))  # type: ignore[return-value]
+
+
+def histogram(name: str, help_text: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, help_text, labelnames, buckets))  # type: ignore[return-value]
+
+
+def register_collector(collector: Collector) -> None:
+    registry.register_collector(collector)
+
+
+def gauge(name: str, help_text: str, samples: Iterable[Sample]) -> CollectedMetric:
+    return CollectedMetric(name, help_text, "gauge", list(samples))
+
+
+def counter_family(name: str, help_text: str, samples: Iterable[Sample]) -> CollectedMetric:
+    return CollectedMetric(name, help_text, "counter", list(samples))
+
+
+REQUEST_SECONDS = histogram(
+    "http_request_duration_seconds", "Time to serve a request, by route template", ("method", "route", "status")
+)
+REQUEST_QUERIES = histogram(
+    "http_request_db_queries", "SQL statements executed per request", ("method", "route"), COUNT_BUCKETS
+)
+REQUEST_DB_SECONDS = histogram(
+    "http_request_db_seconds", "Time spent executing SQL per request", ("method", "route")
+)
+QUERY_SECONDS = histogram("db_query_duration_seconds", "Duration of individual SQL statements", ("operation",))
+STORAGE_BYTES = counter("storage_bytes_total", "Bytes written to and served from file storage", ("direction",))
+STORAGE_WRITE_SECONDS = histogram("storage_object_write_seconds", "Time from opening to committing a stored object")
+PASSWORD_HASH_SECONDS = histogram(
+    "password_hash_seconds", "bcrypt work on the hashing pool, queue wait and compute", ("operation", "phase")
+)
+AUTH_SECONDS = histogram("auth_step_seconds", "Time spent resolving the caller, per step", ("step",))
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db_seconds: float = 0.0
+
+
+# Set for the duration of each HTTP request; threadpool workers inherit a copy of the
+# context, and mutate the shared stats object in place.
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+_OPERATIONS = {"SELECT": "select", "INSERT": "insert", "UPDATE": "update", "DELETE": "delete"}
+
+
+def statement_operation(statement: str) -> str:
+    """The ``operation`` label of a SQL statement: its leading keyword, or ``other``."""
+
+    words = statement.split(None, 1)
+    return _OPERATIONS.get(words[0].upper(), "other") if words else "other"
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Time every statement ``engine`` executes and add it to the current request's stats."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany) -> None:
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        QUERY_SECONDS.observe(elapsed, statement_operation(statement))
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+
+
+def route_label(scope) -> str:
+    route = scope.get("route")
+    # Unmatched paths share one label so scanners cannot inflate the series count.
+    return getattr(route, "path", None) or "<unmatched>"
+
+
+class MetricsMiddleware:
+    """Record latency, status and SQL work of every HTTP request by route template."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+            method, route = scope["method"], route_label(scope)
+            REQUEST_SECONDS.observe(time.perf_counter() - started, method, route, str(status_code))
+            REQUEST_QUERIES.observe(stats.queries, method, route)
+            REQUEST_DB_SECONDS.observe(stats.db_seconds, method, route)
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Generic, List, Optional, Sequence, Tuple, TypeVar
+
+from sqlalchemy import tuple_
+
+T = TypeVar("T")
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+@dataclass
+class Page(Generic[T]):
+    items: List[T] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode the sort key of the last row of a page as an opaque, URL-safe token."""
+
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str, types: Sequence[type]) -> Tuple[Any, ...]:
+    """Decode a token from :func:`encode_cursor`, converting each value to ``types``."""
+
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise InvalidCursor("Invalid cursor") from exc
+    if not isinstance(payload, list) or len(payload) != len(types):
+        raise InvalidCursor("Invalid cursor")
+    try:
+        return tuple(
+            datetime.fromisoformat(value) if kind is datetime else kind(value)
+            for kind, value in zip(types, payload)
+        )
+    except (TypeError, ValueError) as exc:
+        raise InvalidCursor("Invalid cursor") from exc
+
+
+def keyset_before(columns: Sequence[Any], values: Sequence[Any]):
+    """Filter for rows sorting after ``values`` in descending ``columns`` order.
+
+    A row-value comparison lets PostgreSQL and SQLite seek straight to the position in a
+    matching composite index, so every page costs the same however deep it is.
+    """
+
+    return tuple_(*columns) < tuple_(*values)
+
+
+def paginate(rows: Sequence[T], limit: int, key) -> Page[T]:
+    """Build a page from up to ``limit + 1`` rows; the extra row signals a next page."""
+
+    items = list(rows[:limit])
+    next_cursor = encode_cursor(key(items[-1])) if len(rows) > limit else None
+    return Page(items=items, next_cursor=next_cursor)
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import FrozenSet, Iterable, Optional
+
+from ..config import get_settings
+from . import metrics
+from .cache import CachedValue, TTLCache
+
+settings = get_settings()
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Authenticated caller resolved from an access token.
+
+    Holds only plain values so it can be cached across requests and sessions; handlers
+    that need the full ``User`` row load it explicitly.
+    """
+
+    id: int
+    username: str
+    is_active: bool
+    member_id: Optional[int]
+    permissions: FrozenSet[str] = field(default_factory=frozenset)
+
+    @classmethod
+    def from_user(cls, user, permissions: Iterable[str]) -> "Principal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            is_active=user.is_active,
+            member_id=user.member_id,
+            permissions=frozenset(permissions),
+        )
+
+    @classmethod
+    def from_claims(cls, claims) -> "Principal":
+        """Build a principal from the signed claims of a permission-carrying token."""
+
+        from ..security import decode_permissions
+
+        return cls(
+            id=claims.uid,
+            username=claims.sub,
+            is_active=True,
+            member_id=claims.mid,
+            permissions=decode_permissions(claims.perm or 0, claims.xperm or []),
+        )
+
+    def has_permission(self, permission: str) -> bool:
+        return permission in self.permissions
+
+
+# Keyed by the raw access token. The cache is per process: other workers pick up changes
+# once their entries expire, so keep the TTL short.
+principal_cache: TTLCache[str, Principal] = TTLCache(
+    max_entries=settings.principal_cache_max_entries,
+    ttl_seconds=settings.principal_cache_ttl_seconds,
+)
+
+# Current ``PermissionVersion``; tokens issued at an older version fall back to a lookup.
+permission_version: CachedValue[int] = CachedValue(ttl_seconds=settings.permission_version_check_seconds)
+
+
+def invalidate_user(user_id: int) -> None:
+    """Drop cached principals of a single user after their row or role links changed."""
+
+    principal_cache.discard_where(lambda principal: principal.id == user_id)
+    permission_version.expire()
+
+
+def invalidate_all() -> None:
+    """Drop every cached principal, e.g. after a role's permissions changed."""
+
+    principal_cache.clear()
+    permission_version.expire()
+
+
+def _collect_cache_metrics():
+    caches = {"principal": principal_cache}
+    yield metrics.counter_family(
+        "cache_hits_total", "Cache lookups answered from the cache",
+        (("cache_hits_total", {"cache": name}, cache.hits) for name, cache in caches.items()),
+    )
+    yield metrics.counter_family(
+        "cache_misses_total", "Cache lookups that fell through to the database",
+        (("cache_misses_total", {"cache": name}, cache.misses) for name, cache in caches.items()),
+    )
+    yield metrics.gauge(
+        "cache_hit_ratio", "Share of cache lookups answered from the cache since start",
+        (("cache_hit_ratio", {"cache": name}, cache.hits / ((cache.hits + cache.misses) or 1))
+         for name, cache in caches.items()),
+    )
+    yield metrics.gauge(
+        "cache_entries", "Entries currently cached",
+        (("cache_entries", {"cache": name}, len(cache)) for name, cache in caches.items()),
+    )
+
+
+metrics.register_collector(_collect_cache_metrics)
@@ -0,0 +1,295 @@
+"""Opt-in request profiling: stack samples and SQL timings of sampled or slow requests.
+
+Handlers and response validation run on worker threads while the rest of a request runs
+on the event loop, so a per-thread profiler such as cProfile sees only part of it. A
+single sampler thread instead snapshots every thread's stack each
+``PROFILING_SAMPLE_INTERVAL_MS`` and charges each sample to the request that thread is
+serving: the running task on the event loop, or the context a worker was handed.
+Statements are timed with engine events. A request's profile is kept when it was picked
+by ``PROFILING_SAMPLE_RATE`` or took longer than ``PROFILING_SLOW_REQUEST_MS``; the most
+recent ``PROFILING_MAX_PROFILES`` are held in memory.
+"""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import Context, ContextVar
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from ..config import get_settings
+from .metrics import route_label
+
+settings = get_settings()
+
+_WORKER_MODULES = frozenset({"queue", "threading", "asyncio.base_events"})
+
+Frame = Tuple[str, str]
+
+
+@dataclass
+class QueryTiming:
+    statement: str
+    started_ms: float
+    duration_ms: float
+
+
+@dataclass
+class Profile:
+    id: int
+    method: str
+    path: str
+    route: str
+    status_code: int
+    reason: str
+    started_at: datetime
+    duration_ms: float
+    sample_interval_ms: float
+    queries: List[QueryTiming]
+    dropped_queries: int
+    stacks: Dict[Tuple[Frame, ...], int]
+
+    @property
+    def query_ms(self) -> float:
+        return sum(query.duration_ms for query in self.queries)
+
+    @property
+    def sample_count(self) -> int:
+        return sum(self.stacks.values())
+
+    def collapsed_stacks(self) -> List[str]:
+        """Stacks in the collapsed format read by flame graph tools, hottest first."""
+
+        return [
+            f"{';'.join(f'{module}:{function}' for module, function in stack)} {count}"
+            for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1])
+        ]
+
+    def top_functions(self, limit: int = 25) -> List[Tuple[str, int, int]]:
+        """``(function, self samples, total samples)``, by total samples."""
+
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for frame in set(stack):
+                total[frame] += count
+        return [
+            (f"{module}:{function}", own[(module, function)], count)
+            for (module, function), count in total.most_common(limit)
+        ]
+
+
+class _Recording:
+    """A request being recorded; shared by the threads that serve it."""
+
+    def __init__(self, method: str, path: str, sampled: bool) -> None:
+        self.method = method
+        self.path = path
+        self.sampled = sampled
+        self.started_at = datetime.utcnow()
+        self.started = time.perf_counter()
+        self.queries: List[QueryTiming] = []
+        self.dropped_queries = 0
+        self.stacks: Counter = Counter()
+        self.lock = threading.Lock()
+
+    def add_query(self, statement: str, started: float, duration: float) -> None:
+        with self.lock:
+            if len(self.queries) >= settings.profiling_max_queries:
+                self.dropped_queries += 1
+                return
+            self.queries.append(QueryTiming(
+                statement=statement,
+                started_ms=round((started - self.started) * 1000, 3),
+                duration_ms=round(duration * 1000, 3),
+            ))
+
+
+_current: ContextVar[Optional[_Recording]] = ContextVar("profiling_recording", default=None)
+
+
+def _frame_key(frame) -> Frame:
+    code = frame.f_code
+    # ``co_qualname`` (with the class name) exists from Python 3.11.
+    return frame.f_globals.get("__name__", code.co_filename), getattr(code, "co_qualname", code.co_name)
+
+
+def _is_worker_root(frame) -> bool:
+    # anyio's worker loop calls ``context.run(func, *args)`` for each job it is handed.
+    return frame.f_code.co_name == "run" and "anyio" in frame.f_code.co_filename
+
+
+class StackSampler:
+    """Charges periodic stack snapshots of all threads to the requests being recorded."""
+
+    def __init__(self, interval_seconds: float) -> None:
+        self.interval = interval_seconds
+        self._tasks: Dict[asyncio.Task, _Recording] = {}
+        self._loops: Dict[int, asyncio.AbstractEventLoop] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def track(self, task: asyncio.Task, recording: _Recording) -> None:
+        with self._lock:
+            self._tasks[task] = recording
+            self._loops[threading.get_ident()] = task.get_loop()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def untrack(self, task: asyncio.Task) -> None:
+        with self._lock:
+            self._tasks.pop(task, None)
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while True:
+            if not self._tasks:
+                self._wake.clear()
+                self._wake.wait()
+            time.sleep(self.interval)
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own:
+                    self._sample(thread_id, frame)
+
+    def _sample(self, thread_id: int, frame) -> None:
+        loop = self._loops.get(thread_id)
+        stack: List[Frame] = []
+        recording = None
+        if loop is not None:
+            task = asyncio.current_task(loop)
+            recording = self._tasks.get(task) if task is not None else None
+            if recording is None:
+                return
+        while frame is not None:
+            if loop is None and _is_worker_root(frame):
+                # An idle worker still holds the context of its last job; only a worker
+                # inside a job (not waiting for or reporting one) is serving a request.
+                context = frame.f_locals.get("context")
+                if isinstance(context, Context) and stack and stack[-1][0] not in _WORKER_MODULES:
+                    recording = context.get(_current)
+                break
+            stack.append(_frame_key(frame))
+            frame = frame.f_back
+        if recording is None or not stack:
+            return
+        stack.reverse()
+        with recording.lock:
+            recording.stacks[tuple(stack)] += 1
+
+
+class ProfileStore:
+    def __init__(self, max_profiles: int) -> None:
+        self._profiles: Deque[Profile] = deque(maxlen=max_profiles)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, recording: _Recording, route: str, status_code: int, duration: float) -> Profile:
+        with self._lock:
+            profile = Profile(
+                id=next(self._ids),
+                method=recording.method,
+                path=recording.path,
+                route=route,
+                status_code=status_code,
+                reason="sampled" if recording.sampled else "slow",
+                started_at=recording.started_at,
+                duration_ms=round(duration * 1000, 3),
+                sample_interval_ms=settings.profiling_sample_interval_ms,
+                queries=recording.queries,
+                dropped_queries=recording.dropped_queries,
+                stacks=dict(recording.stacks),
+            )
+            self._profiles.append(profile)
+        return profile
+
+    def list(self) -> List[Profile]:
+        """Stored profiles, newest first."""
+
+        with self._lock:
+            return list(reversed(self._profiles))
+
+    def get(self, profile_id: int) -> Optional[Profile]:
+        with self._lock:
+            return next((profile for profile in self._profiles if profile.id == profile_id), None)
+
+    def clear(self) -> int:
+        with self._lock:
+            count = len(self._profiles)
+            self._profiles.clear()
+        return count
+
+
+profiles = ProfileStore(settings.profiling_max_profiles)
+sampler = StackSampler(settings.profiling_sample_interval_ms / 1000)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Record statements ``engine`` executes on behalf of a request being profiled."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany) -> None:
+        if _current.get() is not None:
+            conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany) -> None:
+        recording = _current.get()
+        if recording is not None and conn.info.get("profile_started"):
+            started = conn.info["profile_started"].pop()
+            recording.add_query(statement, started, time.perf_counter() - started)
+
+
+class ProfilingMiddleware:
+    """Record requests under ``PROFILING_PATHS`` and keep the sampled and slow ones."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+        self.sample_rate = settings.profiling_sample_rate
+        self.slow_seconds = settings.profiling_slow_request_ms / 1000
+        self.paths = tuple(settings.profiling_paths)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or not self._wanted(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        sampled = random.random() < self.sample_rate
+        if not sampled and self.slow_seconds <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        recording = _Recording(scope["method"], scope["path"], sampled)
+        status_code = 500
+
+        async def send_wrapper(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        task = asyncio.current_task()
+        token = _current.set(recording)
+        sampler.track(task, recording)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.untrack(task)
+            _current.reset(token)
+            duration = time.perf_counter() - recording.started
+            if sampled or duration >= self.slow_seconds:
+                profiles.add(recording, route_label(scope), status_code, duration)
+
+    def _wanted(self, path: str) -> bool:
+        return not self.paths or path.startswith(self.paths)
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, List
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+@dataclass
+class QueryCounter:
+    """SQL statements executed while a :func:`count_queries` block was active."""
+
+    statements: List[str] = field(default_factory=list)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+
+@contextmanager
+def count_queries(engine: Engine) -> Iterator[QueryCounter]:
+    """Record every statement ``engine`` executes inside the block, from any thread.
+
+    Request handlers run on the threadpool, so the listener is engine-wide rather than
+    tied to the calling thread; use it where nothing else is querying concurrently.
+    """
+
+    counter = QueryCounter()
+
+    def _record(conn, cursor, statement, parameters, context, executemany) -> None:
+        counter.statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _record)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", _record)
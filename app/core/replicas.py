@@ -0,0 +1,234 @@
+"""Routing of read-only sessions to database replicas.
+
+The primary stamps ``ReplicationHeartbeat`` every ``REPLICA_CHECK_INTERVAL_SECONDS``
+and each replica's lag is the age of the stamp it has replayed, which works the same
+for PostgreSQL streaming replicas and copied SQLite files. Reads go to a replica only
+while it answers and is at most ``REPLICA_MAX_LAG_SECONDS`` behind; otherwise, and for
+callers that recently wrote, they go to the primary.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import itertools
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session
+
+from .. import models
+from ..config import get_settings
+from ..database import create_db_engine, engine as primary_engine
+from . import metrics
+from .cache import TTLCache
+from .concurrency import run_blocking
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+class ReadOnlySessionError(RuntimeError):
+    """Raised when a session handed out for reads tries to flush changes."""
+
+
+@event.listens_for(OrmSession, "before_flush")
+def _reject_read_only_flush(session, _flush_context, _instances) -> None:
+    if session.info.get("read_only") and (session.new or session.dirty or session.deleted):
+        raise ReadOnlySessionError("Read-only session cannot write")
+
+
+@dataclass
+class Replica:
+    name: str
+    engine: Engine
+    lag_seconds: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def usable(self) -> bool:
+        return (
+            self.error is None
+            and self.lag_seconds is not None
+            and self.lag_seconds <= settings.replica_max_lag_seconds
+        )
+
+
+class ReplicaSet:
+    """Replicas of the primary database plus the state needed to route reads to them."""
+
+    def __init__(self, primary: Engine, replicas: List[Replica]) -> None:
+        self.primary = primary
+        self.replicas = replicas
+        self.primary_reads = 0
+        self.replica_reads = 0
+        # A write is visible on every usable replica once it is older than the lag bound
+        # plus the time until that lag is next measured.
+        self.recent_writers: TTLCache[str, bool] = TTLCache(
+            max_entries=100_000,
+            ttl_seconds=settings.replica_max_lag_seconds + settings.replica_check_interval_seconds,
+        )
+        self._cycle = itertools.cycle(replicas) if replicas else None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "ReplicaSet":
+        replicas = [
+            Replica(name=make_url(url).render_as_string(hide_password=True), engine=create_db_engine(url))
+            for url in settings.database_replica_urls
+        ]
+        return cls(primary_engine, replicas)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def check(self) -> None:
+        """Stamp the heartbeat on the primary, then measure each replica's lag.
+
+        Replicas are measured even when stamping fails; their lag is then the age of an
+        older stamp, which can only overstate it. A replica that cannot be measured has an
+        unknown lag and is not read from until it can.
+        """
+
+        try:
+            with Session(self.primary) as session:
+                session.merge(models.ReplicationHeartbeat(id=1, beat_at=datetime.utcnow()))
+                session.commit()
+        except Exception:
+            logger.exception("Failed to stamp the replication heartbeat on the primary")
+        for replica in self.replicas:
+            try:
+                with replica.engine.connect() as connection:
+                    beat_at = connection.execute(select(models.ReplicationHeartbeat.beat_at)).scalar()
+            except Exception as exc:
+                replica.lag_seconds = None
+                self._mark_down(replica, exc)
+                continue
+            replica.lag_seconds = None if beat_at is None else (datetime.utcnow() - beat_at).total_seconds()
+            replica.error = None
+
+    def choose(self) -> Optional[Replica]:
+        """Next usable replica in round-robin order, or ``None`` to read from the primary."""
+
+        if self._cycle is None:
+            return None
+        with self._lock:
+            for _ in range(len(self.replicas)):
+                replica = next(self._cycle)
+                if replica.usable:
+                    return replica
+        return None
+
+    def note_write(self, key: str) -> None:
+        self.recent_writers.set(key, True)
+
+    def wrote_recently(self, key: Optional[str]) -> bool:
+        return key is not None and self.recent_writers.get(key) is not None
+
+    @contextmanager
+    def read_session(self, primary: bool = False) -> Iterator[Session]:
+        """Read-only session on a usable replica, or on the primary when ``primary`` is set
+        or no replica qualifies. A replica that fails to connect is taken out of rotation
+        until the next successful check and the read falls back to the primary.
+        """
+
+        replica = None if primary else self.choose()
+        session = None
+        if replica is not None:
+            session = Session(replica.engine)
+            try:
+                session.connection()
+            except Exception as exc:
+                session.close()
+                session = None
+                self._mark_down(replica, exc)
+        if session is None:
+            session = Session(self.primary)
+            self.primary_reads += 1
+        else:
+            self.replica_reads += 1
+        session.info["read_only"] = True
+        with session:
+            yield session
+
+    def _mark_down(self, replica: Replica, exc: Exception) -> None:
+        if replica.error is None:
+            logger.warning("Replica %s unavailable, reading from the primary: %s", replica.name, exc)
+        replica.error = str(exc)
+
+
+def writer_key(authorization: Optional[str]) -> Optional[str]:
+    """Key identifying a caller for read-your-writes stickiness, without keeping the token."""
+
+    if not authorization:
+        return None
+    return hashlib.sha256(authorization.encode()).hexdigest()
+
+
+class ReadYourWritesMiddleware:
+    """Remember callers whose mutating request succeeded so their next reads use the primary.
+
+    The caller is marked as soon as the response starts, before the client can issue a
+    follow-up read.
+    """
+
+    def __init__(self, app, replica_set: ReplicaSet) -> None:
+        self.app = app
+        self.replica_set = replica_set
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        key = writer_key(headers.get(b"authorization", b"").decode("latin-1"))
+
+        async def send_wrapper(message) -> None:
+            if key is not None and message["type"] == "http.response.start" and message["status"] < 400:
+                self.replica_set.note_write(key)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+replicas = ReplicaSet.from_settings()
+
+
+def _collect_replica_metrics():
+    yield metrics.counter_family(
+        "db_read_sessions_total", "Read-only sessions by the database that served them",
+        [
+            ("db_read_sessions_total", {"target": "primary"}, replicas.primary_reads),
+            ("db_read_sessions_total", {"target": "replica"}, replicas.replica_reads),
+        ],
+    )
+    if replicas.enabled:
+        yield metrics.gauge(
+            "db_replica_lag_seconds", "Replica lag at the last check (-1 when unknown or unavailable)",
+            [
+                ("db_replica_lag_seconds", {"replica": replica.name},
+                 -1 if replica.error or replica.lag_seconds is None else replica.lag_seconds)
+                for replica in replicas.replicas
+            ],
+        )
+
+
+metrics.register_collector(_collect_replica_metrics)
+
+
+async def run_replica_monitor() -> None:
+    while True:
+        try:
+            await run_blocking(replicas.check)
+        except Exception:  # pragma: no cover - keep the loop alive
+            logger.exception("Failed to check database replicas")
+        await asyncio.sleep(settings.replica_check_interval_seconds)
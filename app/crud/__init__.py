@@ -1,9 +1,14 @@
-from . import audit, file, member, role, user
+from . import audit, audit_archive, blob, file, links, member, permission, role, upload, user
 
 __all__ = [
     "audit",
+    "audit_archive",
+    "blob",
     "file",
+    "links",
     "member",
+    "permission",
     "role",
+    "upload",
     "user",
 ]
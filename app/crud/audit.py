@@ -1,32 +1,132 @@
 from __future__ import annotations
 
-from typing import Optional, Sequence
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
 
+from sqlalchemy import insert
+from sqlalchemy.engine import Row
 from sqlmodel import Session, select
 
 from .. import models
+from ..config import get_settings
+from ..core.pagination import Page, decode_cursor, keyset_before, paginate
+from ..database import commit, on_commit
+from ..services.audit import audit_writer
+from . import audit_archive
 
+settings = get_settings()
 
-def create_log(session: Session, *, actor_id: Optional[int], action: str, target_type: str,
-               target_id: Optional[int], details: Optional[str] = None) -> models.AuditLog:
-    log_entry = models.AuditLog(
+
+def record(session: Session, *, actor_id: Optional[int], action: str, target_type: str,
+           target_id: Optional[int], details: Optional[str] = None) -> None:
+    """Record an audit entry describing a change made through ``session``.
+
+    With ``AUDIT_STRICT`` the entry is inserted in the same transaction as the change.
+    Otherwise it is handed to the background writer once the change has committed, so the
+    request does not pay for a second transaction.
+    """
+
+    entry = dict(
         actor_id=actor_id,
         action=action,
         target_type=target_type,
         target_id=target_id,
         details=details,
+        created_at=datetime.utcnow(),
     )
-    session.add(log_entry)
-    session.commit()
-    session.refresh(log_entry)
-    return log_entry
+    if settings.audit_strict:
+        session.add(models.AuditLog(**entry))
+        commit(session)
+    else:
+        on_commit(session, audit_writer.submit, entry)
+
+
+def record_many(session: Session, entries: List[Dict[str, Any]]) -> None:
+    """Record several audit entries (keyword arguments of :func:`record`) as one batch."""
+
+    if not entries:
+        return
+    created_at = datetime.utcnow()
+    rows = [{"details": None, **entry, "created_at": created_at} for entry in entries]
+    if settings.audit_strict:
+        session.execute(insert(models.AuditLog), rows)
+        commit(session)
+    else:
+        on_commit(session, audit_writer.submit_many, rows)
+
+
+@dataclass
+class AuditLogFilter:
+    """Filters shared by audit listing, export and archive search.
+
+    ``since`` is inclusive and ``until`` exclusive; both are naive UTC like ``created_at``.
+    """
+
+    actor_id: Optional[int] = None
+    action: Optional[str] = None
+    target_type: Optional[str] = None
+    target_id: Optional[int] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+
+    def apply(self, statement, columns=None):
+        """Add the filters to ``statement``, on the live table unless archive ``columns`` are given."""
+
+        columns = models.AuditLog.__table__.c if columns is None else columns
+        if self.actor_id is not None:
+            statement = statement.where(columns.actor_id == self.actor_id)
+        if self.action is not None:
+            statement = statement.where(columns.action == self.action)
+        if self.target_type is not None:
+            statement = statement.where(columns.target_type == self.target_type)
+        if self.target_id is not None:
+            statement = statement.where(columns.target_id == self.target_id)
+        if self.since is not None:
+            statement = statement.where(columns.created_at >= self.since)
+        if self.until is not None:
+            statement = statement.where(columns.created_at < self.until)
+        return statement
+
+
+def list_logs(session: Session, filters: Optional[AuditLogFilter] = None, *, cursor: Optional[str] = None,
+              limit: int = 100, include_archived: bool = False) -> Page[models.AuditLog]:
+    """Return a page of audit entries, newest first.
+
+    Every filter combination is served by a composite index ending in
+    ``(created_at, id)``, so a page costs the same however deep the cursor points. With
+    ``include_archived`` the listing continues into the archive tables once the live
+    table is exhausted. Raises ``InvalidCursor`` for a malformed cursor.
+    """
+
+    log = models.AuditLog
+    before = decode_cursor(cursor, (datetime, int)) if cursor else None
+    statement = (filters or AuditLogFilter()).apply(select(log))
+    if before is not None:
+        statement = statement.where(keyset_before((log.created_at, log.id), before))
+    statement = statement.order_by(log.created_at.desc(), log.id.desc()).limit(limit + 1)
+    rows = list(session.exec(statement).all())
+    if include_archived and len(rows) <= limit:
+        rows.extend(audit_archive.search(session, filters, before=before, limit=limit + 1 - len(rows)))
+    return paginate(rows, limit, key=lambda row: (row.created_at, row.id))
+
+
+def iter_log_rows(session: Session, filters: Optional[AuditLogFilter] = None, *,
+                  batch_size: int = 1000, include_archived: bool = False) -> Iterator[Row]:
+    """Yield matching audit rows oldest first as plain rows, ``batch_size`` at a time.
+
+    Rows are fetched with ``yield_per`` (a server-side cursor where the driver supports
+    it) and never become ORM objects, so memory stays constant however many match.
+    Archived rows, being the oldest, come first when ``include_archived`` is set.
+    """
 
+    if include_archived:
+        yield from audit_archive.iter_rows(session, filters, batch_size=batch_size)
 
-def list_logs(session: Session, skip: int = 0, limit: int = 100) -> Sequence[models.AuditLog]:
     statement = (
-        select(models.AuditLog)
-        .order_by(models.AuditLog.created_at.desc())
-        .offset(skip)
-        .limit(limit)
+        (filters or AuditLogFilter())
+        .apply(select(*models.AuditLog.__table__.c))
+        .order_by(models.AuditLog.created_at, models.AuditLog.id)
+        .execution_options(yield_per=batch_size)
     )
-    return session.exec(statement).all()
+    yield from session.execute(statement)
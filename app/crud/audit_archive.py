@@ -0,0 +1,156 @@
+"""Monthly archive tables for audit entries past the retention period.
+
+Archived rows keep their columns and ids and live in ``auditlog_archive_YYYYMM`` tables
+keyed by the month of ``created_at``. Every archived row is older than every live row,
+so a newest-first search simply continues from the live table into the archives.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, delete, inspect, insert, select
+from sqlalchemy.engine import Row
+from sqlmodel import Session
+
+from .. import models
+from ..core.pagination import keyset_before
+
+if TYPE_CHECKING:
+    from .audit import AuditLogFilter
+
+ARCHIVE_PREFIX = "auditlog_archive_"
+
+archive_metadata = MetaData()
+_tables: Dict[str, Table] = {}
+
+
+def archive_table(period: str) -> Table:
+    """Return the archive table for ``period`` (``YYYYMM``)."""
+
+    table = _tables.get(period)
+    if table is None:
+        name = f"{ARCHIVE_PREFIX}{period}"
+        table = Table(
+            name,
+            archive_metadata,
+            # Not a primary key: SQLite may reuse ids once the live table has been emptied.
+            Column("id", Integer, nullable=False),
+            Column("actor_id", Integer),
+            Column("action", String, nullable=False),
+            Column("target_type", String, nullable=False),
+            Column("target_id", Integer),
+            Column("details", String),
+            Column("created_at", DateTime, nullable=False),
+            Index(f"ix_{name}_created_at_id", "created_at", "id"),
+            Index(f"ix_{name}_actor_id_created_at_id", "actor_id", "created_at", "id"),
+            Index(f"ix_{name}_action_created_at_id", "action", "created_at", "id"),
+            Index(f"ix_{name}_target_created_at_id", "target_type", "target_id", "created_at", "id"),
+        )
+        _tables[period] = table
+    return table
+
+
+def period_of(moment: datetime) -> str:
+    return f"{moment.year:04d}{moment.month:02d}"
+
+
+def archive_periods(session: Session) -> List[str]:
+    """Existing archive periods, newest first."""
+
+    names = inspect(session.get_bind()).get_table_names()
+    return sorted((name[len(ARCHIVE_PREFIX):] for name in names if name.startswith(ARCHIVE_PREFIX)), reverse=True)
+
+
+def create_missing_indexes(session: Session) -> None:
+    """Add indexes introduced since existing archive tables were created."""
+
+    for period in archive_periods(session):
+        for index in archive_table(period).indexes:
+            index.create(session.connection(), checkfirst=True)
+    session.commit()
+
+
+def _period_bounds(period: str) -> Tuple[datetime, datetime]:
+    year, month = int(period[:4]), int(period[4:])
+    start = datetime(year, month, 1)
+    end = datetime(year + month // 12, month % 12 + 1, 1)
+    return start, end
+
+
+def archive_batch(session: Session, cutoff: datetime, batch_size: int) -> int:
+    """Move up to ``batch_size`` of the oldest entries created before ``cutoff``.
+
+    Each call is one short transaction touching at most ``batch_size`` live rows, so the
+    live table is never locked for long. Returns the number of rows moved.
+    """
+
+    live = models.AuditLog.__table__
+    rows = session.execute(
+        select(*live.c).where(live.c.created_at < cutoff).order_by(live.c.created_at, live.c.id).limit(batch_size)
+    ).all()
+    if not rows:
+        return 0
+
+    by_period: Dict[str, List[dict]] = defaultdict(list)
+    for row in rows:
+        by_period[period_of(row.created_at)].append(dict(row._mapping))
+    for period, entries in by_period.items():
+        table = archive_table(period)
+        table.create(session.connection(), checkfirst=True)
+        session.execute(insert(table), entries)
+    session.execute(delete(live).where(live.c.id.in_([row.id for row in rows])))
+    session.commit()
+    return len(rows)
+
+
+def _searchable_periods(session: Session, filters: Optional["AuditLogFilter"],
+                        before: Optional[Sequence]) -> List[str]:
+    periods = []
+    for period in archive_periods(session):
+        start, end = _period_bounds(period)
+        if filters is not None and filters.since is not None and end <= filters.since:
+            continue
+        if filters is not None and filters.until is not None and start >= filters.until:
+            continue
+        if before is not None and start > before[0]:
+            continue
+        periods.append(period)
+    return periods
+
+
+def search(session: Session, filters: Optional["AuditLogFilter"] = None, *,
+           before: Optional[Sequence] = None, limit: int = 100) -> List[Row]:
+    """Return up to ``limit`` archived entries newest first, older than the ``before`` key.
+
+    Only partitions overlapping the filter's time window are queried, newest first,
+    stopping as soon as ``limit`` rows have been found.
+    """
+
+    found: List[Row] = []
+    for period in _searchable_periods(session, filters, before):
+        table = archive_table(period)
+        statement = select(*table.c)
+        if filters is not None:
+            statement = filters.apply(statement, table.c)
+        if before is not None:
+            statement = statement.where(keyset_before((table.c.created_at, table.c.id), before))
+        statement = statement.order_by(table.c.created_at.desc(), table.c.id.desc()).limit(limit - len(found))
+        found.extend(session.execute(statement).all())
+        if len(found) >= limit:
+            break
+    return found
+
+
+def iter_rows(session: Session, filters: Optional["AuditLogFilter"] = None, *,
+              batch_size: int = 1000) -> Iterator[Row]:
+    """Yield matching archived entries oldest first, streaming each partition."""
+
+    for period in reversed(_searchable_periods(session, filters, None)):
+        table = archive_table(period)
+        statement = select(*table.c)
+        if filters is not None:
+            statement = filters.apply(statement, table.c)
+        statement = statement.order_by(table.c.created_at, table.c.id).execution_options(yield_per=batch_size)
+        yield from session.execute(statement)
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from typing import Callable, List, Optional
+
+from sqlalchemy import case
+from sqlmodel import Session, delete, select, update
+
+from .. import models
+from ..database import commit, upsert_insert
+
+
+def get_blob(session: Session, checksum: str) -> Optional[models.StorageBlob]:
+    return session.get(models.StorageBlob, checksum)
+
+
+def acquire_blob(session: Session, *, checksum: str, path: str, size: int, codec: Optional[str] = None,
+                 stored_size: Optional[int] = None, frame_size: Optional[int] = None) -> models.StorageBlob:
+    """Add a reference to a blob, creating it on first use, within the caller's transaction.
+
+    Returns the blob; one created earlier keeps the encoding it was stored with, unless it
+    is an unreferenced tombstone whose object may already be gone, which takes the new
+    copy's encoding so the new copy is placed.
+    """
+
+    table = models.StorageBlob
+    unreferenced = table.ref_count <= 0
+    encoding = {
+        "codec": case((unreferenced, codec), else_=table.codec),
+        "stored_size": case((unreferenced, stored_size), else_=table.stored_size),
+        "frame_size": case((unreferenced, frame_size), else_=table.frame_size),
+    }
+    insert = upsert_insert(session, table)
+    if insert is not None:
+        session.exec(
+            insert.values(checksum=checksum, path=path, size=size, ref_count=1, codec=codec,
+                          stored_size=stored_size, frame_size=frame_size).on_conflict_do_update(
+                index_elements=[table.checksum],
+                set_={**encoding, "ref_count": table.ref_count + 1},
+            )
+        )
+        return session.get(table, checksum, populate_existing=True)
+
+    result = session.exec(
+        update(table).where(table.checksum == checksum).values(**encoding, ref_count=table.ref_count + 1)
+    )
+    if result.rowcount:
+        return session.get(table, checksum, populate_existing=True)
+    stored_blob = table(checksum=checksum, path=path, size=size, ref_count=1, codec=codec,
+                        stored_size=stored_size, frame_size=frame_size)
+    session.add(stored_blob)
+    session.flush()
+    return stored_blob
+
+
+def release_blob(session: Session, checksum: str) -> bool:
+    """Drop a reference to a blob; returns True when it was the last one.
+
+    The row stays behind as a tombstone with no references until :func:`purge_blob`
+    removes it together with its object.
+    """
+
+    table = models.StorageBlob
+    session.exec(update(table).where(table.checksum == checksum).values(ref_count=table.ref_count - 1))
+    stored_blob = session.get(table, checksum, populate_existing=True)
+    return stored_blob is not None and stored_blob.ref_count <= 0
+
+
+def purge_blob(session: Session, checksum: str, remove: Callable[[str], None]) -> bool:
+    """Delete an unreferenced blob row and, through ``remove``, its object.
+
+    Touching the row first holds its lock until commit, so an upload acquiring the same
+    content meanwhile waits and then stores it anew rather than having its object removed
+    under it. Returns False when the blob was referenced again or is already gone.
+    """
+
+    table = models.StorageBlob
+    result = session.exec(
+        update(table).where(table.checksum == checksum, table.ref_count <= 0).values(ref_count=table.ref_count)
+    )
+    if not result.rowcount:
+        commit(session)
+        return False
+    path = session.get(table, checksum, populate_existing=True).path
+    session.exec(delete(table).where(table.checksum == checksum))
+    remove(path)
+    commit(session)
+    return True
+
+
+def get_unreferenced_blobs(session: Session, limit: int = 100) -> List[str]:
+    statement = select(models.StorageBlob.checksum).where(models.StorageBlob.ref_count <= 0).limit(limit)
+    return list(session.exec(statement).all())
@@ -1,83 +1,211 @@
 from __future__ import annotations
 
-import hashlib
-from pathlib import Path
-from typing import Iterable, Sequence
+from datetime import datetime
+from pathlib import PurePosixPath
+from typing import Dict, Iterable, List, Optional
 
+from sqlalchemy import insert, union_all
+from sqlalchemy.orm import selectinload
 from sqlmodel import Session, delete, select
 
 from .. import models
-
-
-def _calculate_checksum(path: Path) -> str:
-    sha256 = hashlib.sha256()
-    with path.open("rb") as handle:
-        for chunk in iter(lambda: handle.read(8192), b""):
-            sha256.update(chunk)
-    return sha256.hexdigest()
+from ..core.pagination import Page, decode_cursor, keyset_before, paginate
+from ..database import commit
+from . import blob, links, member
 
 
 def get_file(session: Session, file_id: int) -> Optional[models.FileAsset]:
     return session.get(models.FileAsset, file_id)
 
 
-def get_files_for_member(session: Session, member_id: int, *, include_shared: bool = True) -> Sequence[models.FileAsset]:
-    statement = select(models.FileAsset).where(models.FileAsset.member_id == member_id)
-    owned = session.exec(statement).all()
-    if not include_shared:
-        return owned
+def get_files(session: Session, file_ids: Iterable[int]) -> Dict[int, models.FileAsset]:
+    """Load several files by id with a single ``IN`` query."""
 
-    shared_statement = (
-        select(models.FileAsset)
-        .join(models.FileShare)
-        .where(models.FileShare.member_id == member_id)
-    )
-    shared = session.exec(shared_statement).all()
-    return list({file.id: file for file in owned + shared}.values())
+    ids = set(file_ids)
+    if not ids:
+        return {}
+    files = session.exec(select(models.FileAsset).where(models.FileAsset.id.in_(ids))).all()
+    return {file.id: file for file in files}
+
+
+# Eager-loading profile matching ``schemas.FileRead`` (shares and their members).
+FILE_READ_OPTIONS = (selectinload(models.FileAsset.shares).joinedload(models.FileShare.member),)
 
 
-def create_file(session: Session, *, file_path: Path, owner_id: int, member_id: int,
-                original_filename: str, size: int) -> models.FileAsset:
-    checksum = _calculate_checksum(file_path)
+def get_file_for_read(session: Session, file_id: int) -> Optional[models.FileAsset]:
+    """Load a file with everything ``schemas.FileRead`` serializes, replacing stale state."""
+
+    statement = (
+        select(models.FileAsset)
+        .where(models.FileAsset.id == file_id)
+        .options(*FILE_READ_OPTIONS)
+        .execution_options(populate_existing=True)
+    )
+    return session.exec(statement).first()
+
+
+def get_files_for_member(session: Session, member_id: int, *, scope: str = "all",
+                         name_prefix: Optional[str] = None, min_size: Optional[int] = None,
+                         max_size: Optional[int] = None, owner_id: Optional[int] = None,
+                         cursor: Optional[str] = None, limit: int = 100) -> Page[models.FileAsset]:
+    """Return a page of files owned by (``scope="owned"``) and/or shared with (``"shared"``)
+    a member, newest first.
+
+    Both sources are combined in one statement: a ``UNION ALL`` of file ids where each
+    branch seeks its composite index to the cursor and reads at most ``limit + 1`` rows.
+    Raises ``InvalidCursor`` for a malformed cursor.
+    """
+
+    file = models.FileAsset
+    order = (file.uploaded_at.desc(), file.id.desc())
+    conditions = []
+    if name_prefix:
+        conditions.append(file.original_filename.startswith(name_prefix, autoescape=True))
+    if min_size is not None:
+        conditions.append(file.size >= min_size)
+    if max_size is not None:
+        conditions.append(file.size <= max_size)
+    if owner_id is not None:
+        conditions.append(file.owner_id == owner_id)
+    if cursor:
+        conditions.append(keyset_before((file.uploaded_at, file.id), decode_cursor(cursor, (datetime, int))))
+
+    branches = []
+    if scope in ("all", "owned"):
+        branches.append(select(file.id).where(file.member_id == member_id, *conditions))
+    if scope in ("all", "shared"):
+        branches.append(
+            select(file.id)
+            .join(models.FileShare, models.FileShare.file_id == file.id)
+            # Files of the member's own that it also shares with itself are already owned.
+            .where(models.FileShare.member_id == member_id, file.member_id != member_id, *conditions)
+        )
+    # Wrapping each branch lets it keep its own ORDER BY / LIMIT inside the union.
+    subqueries = [branch.order_by(*order).limit(limit + 1).subquery() for branch in branches]
+    ids = union_all(*(select(subquery.c.id) for subquery in subqueries)).subquery()
+
+    statement = (
+        select(file)
+        .join(ids, ids.c.id == file.id)
+        .order_by(*order)
+        .limit(limit + 1)
+        .options(*FILE_READ_OPTIONS)
+    )
+    rows = session.exec(statement).all()
+    return paginate(rows, limit, key=lambda row: (row.uploaded_at, row.id))
+
+
+def create_file(session: Session, *, key: str, owner_id: int, member_id: int,
+                original_filename: str, size: int, checksum: str, digests: Optional[Dict[str, str]] = None,
+                content_addressed: bool = False, storage_quota: Optional[int] = None,
+                total_storage_quota: Optional[int] = None, codec: Optional[str] = None,
+                stored_size: Optional[int] = None, frame_size: Optional[int] = None) -> models.FileAsset:
+    """Record a stored file and charge its size to the member's storage usage.
+
+    Raises ``member.StorageQuotaExceeded`` before anything is written when the file does
+    not fit ``storage_quota`` (per member) or ``total_storage_quota``. ``digests`` maps
+    hash algorithm names to the hex digests computed while storing it. ``codec``,
+    ``stored_size`` and ``frame_size`` describe how the content is compressed; a
+    content-addressed file takes them from its blob, which may predate this upload.
+    """
+
+    member.add_storage_used(session, member_id, size, quota=storage_quota, total_quota=total_storage_quota)
+    if content_addressed:
+        stored_blob = blob.acquire_blob(session, checksum=checksum, path=key, size=size, codec=codec,
+                                        stored_size=stored_size, frame_size=frame_size)
+        codec, stored_size, frame_size = stored_blob.codec, stored_blob.stored_size, stored_blob.frame_size
     db_file = models.FileAsset(
-        filename=file_path.name,
+        filename=PurePosixPath(key).name,
         original_filename=original_filename,
-        path=str(file_path),
+        path=key,
         size=size,
         checksum=checksum,
+        digests=digests,
+        blob_checksum=checksum if content_addressed else None,
         owner_id=owner_id,
         member_id=member_id,
+        codec=codec,
+        stored_size=stored_size,
+        frame_size=frame_size,
     )
     session.add(db_file)
-    session.commit()
+    commit(session)
     session.refresh(db_file)
     return db_file
 
 
 def share_file_with_members(session: Session, file: models.FileAsset, member_ids: Iterable[int], granted_by: int) -> models.FileAsset:
-    session.exec(delete(models.FileShare).where(models.FileShare.file_id == file.id))
-    session.flush()
-
-    for member_id in member_ids:
-        session.add(
-            models.FileShare(
-                file_id=file.id,
-                member_id=member_id,
-                granted_by_id=granted_by,
-            )
-        )
+    """Make the file shared with exactly ``member_ids``; shares that stay keep their grant."""
 
-    session.commit()
+    links.set_links(session, models.FileShare, "file_id", file.id, "member_id", member_ids, granted_by_id=granted_by,
+                    created_at=datetime.utcnow())
+    commit(session)
     session.refresh(file)
     return file
 
 
+def update_file_shares(session: Session, file: models.FileAsset, *, add: Iterable[int] = (),
+                       remove: Iterable[int] = (), granted_by: int) -> links.LinkChanges:
+    """Share the file with ``add`` and stop sharing it with ``remove``, leaving other shares as they are."""
+
+    changes = links.LinkChanges(
+        removed=links.remove_links(session, models.FileShare, "file_id", file.id, "member_id", remove),
+        added=links.add_links(session, models.FileShare, "file_id", file.id, "member_id", add,
+                              granted_by_id=granted_by, created_at=datetime.utcnow()),
+    )
+    commit(session)
+    session.refresh(file)
+    return changes
+
+
+def grant_shares(session: Session, file_ids: Iterable[int], member_ids: Iterable[int],
+                 granted_by: int) -> Dict[int, int]:
+    """Share every file with every member, keeping existing shares.
+
+    Existing pairs are found with one query and the missing ones inserted with one
+    multi-row statement. Returns the number of new shares per file id.
+    """
+
+    file_ids, member_ids = list(dict.fromkeys(file_ids)), list(dict.fromkeys(member_ids))
+    wanted = [(file_id, member_id) for file_id in file_ids for member_id in member_ids]
+    granted: Dict[int, int] = dict.fromkeys(file_ids, 0)
+    if not wanted:
+        return granted
+    share = models.FileShare
+    existing = set(
+        session.exec(
+            select(share.file_id, share.member_id).where(share.file_id.in_(file_ids), share.member_id.in_(member_ids))
+        ).all()
+    )
+    created_at = datetime.utcnow()
+    rows: List[dict] = []
+    for file_id, member_id in wanted:
+        if (file_id, member_id) not in existing:
+            rows.append({"file_id": file_id, "member_id": member_id, "granted_by_id": granted_by,
+                         "created_at": created_at})
+            granted[file_id] += 1
+    if rows:
+        session.execute(insert(share), rows)
+    commit(session)
+    return granted
+
+
 def revoke_file_shares(session: Session, file: models.FileAsset) -> None:
     session.exec(delete(models.FileShare).where(models.FileShare.file_id == file.id))
-    session.commit()
+    commit(session)
 
 
-def delete_file(session: Session, file: models.FileAsset) -> None:
+def delete_file(session: Session, file: models.FileAsset) -> bool:
+    """Delete a file record; returns True when its stored content is no longer referenced."""
+
     session.exec(delete(models.FileShare).where(models.FileShare.file_id == file.id))
+    blob_checksum = file.blob_checksum
+    member.add_storage_used(session, file.member_id, -file.size)
+    # The row goes first: it references the blob, which is purged once unreferenced.
     session.delete(file)
-    session.commit()
+    session.flush()
+    unreferenced = True
+    if blob_checksum:
+        unreferenced = blob.release_blob(session, blob_checksum)
+    commit(session)
+    return unreferenced
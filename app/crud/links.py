@@ -0,0 +1,90 @@
+"""Incremental updates of association rows: file shares, role permissions and user roles.
+
+Rows are added with ``INSERT ... ON CONFLICT DO NOTHING RETURNING`` and removed with
+``DELETE ... RETURNING``, so the set difference is computed by the database, unchanged
+rows (and their ``created_at``/``granted_by_id``) are never touched, and concurrent
+edits of the same set cannot collide on the primary key. Dialects without those
+features fall back to reading the affected rows first.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Iterable, List
+
+from sqlalchemy import delete, insert, select
+from sqlmodel import Session
+
+from ..database import upsert_insert
+
+
+@dataclass
+class LinkChanges:
+    added: List[Any] = field(default_factory=list)
+    removed: List[Any] = field(default_factory=list)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.removed)
+
+
+def add_links(session: Session, model, owner_column: str, owner_id: Any, value_column: str,
+              values: Iterable[Any], **extra: Any) -> List[Any]:
+    """Link ``values`` to the owner, skipping existing links; returns the values added.
+
+    ``extra`` holds the remaining columns of new rows, e.g. ``granted_by_id``.
+    """
+
+    values = list(dict.fromkeys(values))
+    if not values:
+        return []
+    table = model.__table__
+    value = table.c[value_column]
+    rows = [{owner_column: owner_id, value_column: item, **extra} for item in values]
+
+    statement = upsert_insert(session, table)
+    if statement is not None and session.get_bind().dialect.insert_returning:
+        statement = statement.values(rows).on_conflict_do_nothing().returning(value)
+        return list(session.execute(statement).scalars())
+
+    existing = set(session.execute(
+        select(value).where(table.c[owner_column] == owner_id, value.in_(values))
+    ).scalars())
+    missing = [row for row in rows if row[value_column] not in existing]
+    if missing:
+        session.execute(insert(table), missing)
+    return [row[value_column] for row in missing]
+
+
+def remove_links(session: Session, model, owner_column: str, owner_id: Any, value_column: str,
+                 values: Iterable[Any]) -> List[Any]:
+    """Unlink ``values`` from the owner; returns the values that were linked."""
+
+    values = list(dict.fromkeys(values))
+    if not values:
+        return []
+    table = model.__table__
+    return _delete(session, table, table.c[value_column],
+                   table.c[owner_column] == owner_id, table.c[value_column].in_(values))
+
+
+def set_links(session: Session, model, owner_column: str, owner_id: Any, value_column: str,
+              values: Iterable[Any], **extra: Any) -> LinkChanges:
+    """Make the owner's links exactly ``values``, touching only the rows that differ."""
+
+    values = list(dict.fromkeys(values))
+    table = model.__table__
+    criteria = [table.c[owner_column] == owner_id]
+    if values:
+        criteria.append(table.c[value_column].not_in(values))
+    removed = _delete(session, table, table.c[value_column], *criteria)
+    added = add_links(session, model, owner_column, owner_id, value_column, values, **extra)
+    return LinkChanges(added=added, removed=removed)
+
+
+def _delete(session: Session, table, value, *criteria) -> List[Any]:
+    if session.get_bind().dialect.delete_returning:
+        return list(session.execute(delete(table).where(*criteria).returning(value)).scalars())
+    removed = list(session.execute(select(value).where(*criteria)).scalars())
+    if removed:
+        session.execute(delete(table).where(*criteria))
+    return removed
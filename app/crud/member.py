@@ -1,16 +1,36 @@
 from __future__ import annotations
 
-from typing import Optional, Sequence
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set
 
-from sqlmodel import Session, select
+from sqlalchemy import func, insert
+from sqlmodel import Session, select, update
 
 from .. import models
+from ..core.bulk import ItemOutcome
+from ..database import commit
+
+
+# Primary key of the only PortalUsage row.
+PORTAL_USAGE_ID = 1
+
+
+class StorageQuotaExceeded(ValueError):
+    """Raised when storing a file would take a member or the portal over its storage quota."""
 
 
 def get_member(session: Session, member_id: int) -> Optional[models.Member]:
     return session.get(models.Member, member_id)
 
 
+def get_existing_member_ids(session: Session, member_ids: Iterable[int]) -> Set[int]:
+    """Return which of ``member_ids`` exist, with a single ``IN`` query."""
+
+    ids = set(member_ids)
+    if not ids:
+        return set()
+    return set(session.exec(select(models.Member.id).where(models.Member.id.in_(ids))).all())
+
+
 def get_member_by_name(session: Session, name: str) -> Optional[models.Member]:
     statement = select(models.Member).where(models.Member.name == name)
     return session.exec(statement).first()
@@ -33,11 +53,43 @@ def create_member(session: Session, name: str, description: Optional[str], api_k
         security_server_ip=security_server_ip,
     )
     session.add(member)
-    session.commit()
+    commit(session)
     session.refresh(member)
     return member
 
 
+def create_members(session: Session, members: Sequence[Dict[str, Any]]) -> List[ItemOutcome]:
+    """Create many members with one uniqueness query and one multi-row insert.
+
+    ``members`` holds the keyword arguments of :func:`create_member`. Items whose name
+    exists, or repeats an earlier item, are rejected; the rest are inserted together.
+    """
+
+    names = {member["name"] for member in members}
+    taken = set(session.exec(select(models.Member.name).where(models.Member.name.in_(names))).all())
+    outcomes: List[ItemOutcome] = []
+    accepted: List[Dict[str, Any]] = []
+    for member in members:
+        if member["name"] in taken:
+            outcomes.append(ItemOutcome(error="Member already exists"))
+            continue
+        taken.add(member["name"])
+        outcomes.append(ItemOutcome())
+        accepted.append(member)
+
+    if accepted:
+        # Ids are matched back by the unique name: asking for rows in parameter order
+        # makes some dialects fall back to one INSERT per row.
+        ids = dict(
+            session.execute(insert(models.Member).returning(models.Member.name, models.Member.id), accepted).all()
+        )
+        for member, outcome in zip(members, outcomes):
+            if outcome.ok:
+                outcome.id = ids[member["name"]]
+        commit(session)
+    return outcomes
+
+
 def update_member(session: Session, member: models.Member, *, description: Optional[str], api_key: Optional[str],
                   security_server_ip: Optional[str]) -> models.Member:
     if description is not None:
@@ -48,11 +100,66 @@ def update_member(session: Session, member: models.Member, *, description: Optio
         member.security_server_ip = security_server_ip
 
     session.add(member)
-    session.commit()
+    commit(session)
     session.refresh(member)
     return member
 
 
 def delete_member(session: Session, member: models.Member) -> None:
     session.delete(member)
-    session.commit()
+    commit(session)
+
+
+def get_storage_used(session: Session, member_id: int) -> int:
+    statement = select(models.Member.storage_used).where(models.Member.id == member_id)
+    return session.exec(statement).first() or 0
+
+
+def get_total_storage_used(session: Session) -> int:
+    statement = select(models.PortalUsage.storage_used).where(models.PortalUsage.id == PORTAL_USAGE_ID)
+    return session.exec(statement).first() or 0
+
+
+def add_storage_used(session: Session, member_id: int, size: int, *, quota: Optional[int] = None,
+                     total_quota: Optional[int] = None) -> None:
+    """Add ``size`` bytes to the member's and the portal's usage within the caller's transaction.
+
+    Each increment is a single ``UPDATE`` guarded by its quota, so concurrent uploads
+    cannot together overshoot either. Raises :class:`StorageQuotaExceeded` when ``quota``
+    or ``total_quota`` would be exceeded; a negative ``size`` releases usage.
+    """
+
+    member = models.Member
+    statement = update(member).where(member.id == member_id).values(storage_used=member.storage_used + size)
+    if quota is not None and size > 0:
+        statement = statement.where(member.storage_used + size <= quota)
+    if not session.exec(statement).rowcount and quota is not None:
+        raise StorageQuotaExceeded(f"Member storage quota of {quota} bytes exceeded")
+
+    # The portal row is updated last, as every upload locks it until its transaction ends.
+    portal = models.PortalUsage
+    statement = update(portal).where(portal.id == PORTAL_USAGE_ID).values(storage_used=portal.storage_used + size)
+    if total_quota is not None and size > 0:
+        statement = statement.where(portal.storage_used + size <= total_quota)
+    if not session.exec(statement).rowcount and total_quota is not None:
+        raise StorageQuotaExceeded(f"Portal storage quota of {total_quota} bytes exceeded")
+
+
+def ensure_portal_usage(session: Session) -> None:
+    """Create the portal usage row from the members' usage if it does not exist yet."""
+
+    if session.get(models.PortalUsage, PORTAL_USAGE_ID) is None:
+        used = session.exec(select(func.coalesce(func.sum(models.Member.storage_used), 0))).one()
+        session.add(models.PortalUsage(id=PORTAL_USAGE_ID, storage_used=used))
+        commit(session)
+
+
+def recalculate_storage_used(session: Session) -> None:
+    """Recompute every member's usage, and the portal's, from ``FileAsset.size``."""
+
+    file = models.FileAsset
+    used = select(func.coalesce(func.sum(file.size), 0)).where(file.member_id == models.Member.id).scalar_subquery()
+    session.exec(update(models.Member).values(storage_used=used))
+    total = select(func.coalesce(func.sum(models.Member.storage_used), 0)).scalar_subquery()
+    session.exec(update(models.PortalUsage).where(models.PortalUsage.id == PORTAL_USAGE_ID).values(storage_used=total))
+    commit(session)
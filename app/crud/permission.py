@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlmodel import Session, select, update
+
+from .. import models
+
+
+def get_version(session: Session) -> int:
+    version = session.exec(select(models.PermissionVersion.version)).first()
+    return version or 0
+
+
+def bump_version(session: Session) -> None:
+    """Increment the permission version as part of the caller's transaction.
+
+    Callers evict the local principal cache after committing, which also forces the
+    cached version to be reloaded.
+    """
+
+    result = session.exec(
+        update(models.PermissionVersion)
+        .where(models.PermissionVersion.id == 1)
+        .values(version=models.PermissionVersion.version + 1, updated_at=datetime.utcnow())
+    )
+    if not result.rowcount:
+        session.add(models.PermissionVersion(id=1, version=1))
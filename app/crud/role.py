@@ -1,23 +1,42 @@
 from __future__ import annotations
 
-from typing import List, Optional, Sequence
+from typing import Iterable, List, Optional, Sequence, Set
 
-from sqlmodel import Session, delete, select
+from sqlalchemy.orm import selectinload
+from sqlmodel import Session, select
 
 from .. import models
+from ..core import principals
+from ..database import commit, on_commit
+from . import links, permission
 
 
 def get_role(session: Session, role_id: int) -> Optional[models.Role]:
     return session.get(models.Role, role_id)
 
 
+def get_existing_role_ids(session: Session, role_ids: Iterable[int]) -> Set[int]:
+    """Return which of ``role_ids`` exist, with a single ``IN`` query."""
+
+    ids = set(role_ids)
+    if not ids:
+        return set()
+    return set(session.exec(select(models.Role.id).where(models.Role.id.in_(ids))).all())
+
+
 def get_role_by_name(session: Session, name: str) -> Optional[models.Role]:
     statement = select(models.Role).where(models.Role.name == name)
     return session.exec(statement).first()
 
 
 def get_roles(session: Session, skip: int = 0, limit: int = 100) -> Sequence[models.Role]:
-    statement = select(models.Role).offset(skip).limit(limit)
+    statement = (
+        select(models.Role)
+        .order_by(models.Role.id)
+        .offset(skip)
+        .limit(limit)
+        .options(selectinload(models.Role.permissions))
+    )
     return session.exec(statement).all()
 
 
@@ -32,7 +51,7 @@ def create_role(session: Session, name: str, description: Optional[str], permiss
     for perm in permissions:
         session.add(models.RolePermission(role_id=role.id, permission=perm))
 
-    session.commit()
+    commit(session)
     session.refresh(role)
     return role
 
@@ -42,17 +61,40 @@ def update_role(session: Session, role: models.Role, description: Optional[str],
         role.description = description
     session.add(role)
 
+    permissions_changed = False
     if permissions is not None:
-        session.exec(delete(models.RolePermission).where(models.RolePermission.role_id == role.id))
-        session.flush()
-        for perm in permissions:
-            session.add(models.RolePermission(role_id=role.id, permission=perm))
-
-    session.commit()
+        changes = links.set_links(session, models.RolePermission, "role_id", role.id, "permission", permissions)
+        permissions_changed = changes.changed
+
+    # A new description leaves cached principals and issued tokens valid.
+    if permissions_changed:
+        permission.bump_version(session)
+    commit(session)
+    if permissions_changed:
+        on_commit(session, principals.invalidate_all)
     session.refresh(role)
     return role
 
 
+def update_role_permissions(session: Session, role: models.Role, *, add: Iterable[str] = (),
+                            remove: Iterable[str] = ()) -> links.LinkChanges:
+    """Grant ``add`` and revoke ``remove`` without touching the role's other permissions."""
+
+    changes = links.LinkChanges(
+        removed=links.remove_links(session, models.RolePermission, "role_id", role.id, "permission", remove),
+        added=links.add_links(session, models.RolePermission, "role_id", role.id, "permission", add),
+    )
+    if changes.changed:
+        permission.bump_version(session)
+    commit(session)
+    if changes.changed:
+        on_commit(session, principals.invalidate_all)
+    session.refresh(role)
+    return changes
+
+
 def delete_role(session: Session, role: models.Role) -> None:
     session.delete(role)
-    session.commit()
+    permission.bump_version(session)
+    commit(session)
+    on_commit(session, principals.invalidate_all)
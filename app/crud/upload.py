@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import math
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+from sqlmodel import Session, delete, select, update
+
+from .. import models
+from ..database import commit, upsert_insert
+
+
+class UploadNotFound(ValueError):
+    """The upload session was completed, aborted or garbage-collected meanwhile."""
+
+
+def part_count(upload: models.UploadSession) -> int:
+    return math.ceil(upload.size / upload.part_size) if upload.size else 0
+
+
+def expected_part_size(upload: models.UploadSession, part_number: int) -> int:
+    offset = (part_number - 1) * upload.part_size
+    return min(upload.part_size, upload.size - offset)
+
+
+def get_upload(session: Session, upload_id: str) -> Optional[models.UploadSession]:
+    return session.get(models.UploadSession, upload_id)
+
+
+def create_upload(session: Session, *, owner_id: int, member_id: int, original_filename: str, size: int,
+                  part_size: int, ttl: timedelta) -> models.UploadSession:
+    upload = models.UploadSession(
+        id=uuid.uuid4().hex,
+        owner_id=owner_id,
+        member_id=member_id,
+        original_filename=original_filename,
+        size=size,
+        part_size=part_size,
+        expires_at=datetime.utcnow() + ttl,
+    )
+    session.add(upload)
+    commit(session)
+    session.refresh(upload)
+    return upload
+
+
+def received_parts(session: Session, upload: models.UploadSession) -> List[int]:
+    statement = (
+        select(models.UploadPart.part_number)
+        .where(models.UploadPart.upload_id == upload.id)
+        .order_by(models.UploadPart.part_number)
+    )
+    return list(session.exec(statement).all())
+
+
+def missing_parts(session: Session, upload: models.UploadSession) -> List[int]:
+    received = set(received_parts(session, upload))
+    return [number for number in range(1, part_count(upload) + 1) if number not in received]
+
+
+def part_checksums(session: Session, upload: models.UploadSession) -> Dict[int, str]:
+    statement = select(models.UploadPart.part_number, models.UploadPart.checksum).where(
+        models.UploadPart.upload_id == upload.id
+    )
+    return dict(session.exec(statement).all())
+
+
+def record_part(session: Session, upload: models.UploadSession, *, part_number: int, size: int, checksum: str,
+                ttl: timedelta) -> models.UploadPart:
+    """Record a received part, replacing an earlier copy; concurrent copies of a part are upserted."""
+
+    now = datetime.utcnow()
+    sessions = models.UploadSession
+    result = session.exec(update(sessions).where(sessions.id == upload.id).values(expires_at=now + ttl))
+    if not result.rowcount:
+        raise UploadNotFound(upload.id)
+
+    table = models.UploadPart
+    insert = upsert_insert(session, table)
+    if insert is not None:
+        session.exec(
+            insert.values(upload_id=upload.id, part_number=part_number, size=size, checksum=checksum,
+                          received_at=now).on_conflict_do_update(
+                index_elements=[table.upload_id, table.part_number],
+                set_={"size": size, "checksum": checksum, "received_at": now},
+            )
+        )
+    else:
+        part = session.get(table, (upload.id, part_number)) or table(upload_id=upload.id, part_number=part_number)
+        part.size = size
+        part.checksum = checksum
+        part.received_at = now
+        session.add(part)
+    commit(session)
+    return session.get(table, (upload.id, part_number), populate_existing=True)
+
+
+def forget_parts(session: Session, upload: models.UploadSession, part_numbers: List[int]) -> None:
+    """Mark parts as missing again, e.g. after a failed rewrite left their staged bytes unknown."""
+
+    session.exec(
+        delete(models.UploadPart).where(
+            models.UploadPart.upload_id == upload.id, models.UploadPart.part_number.in_(part_numbers)
+        )
+    )
+    commit(session)
+
+
+def claim_completion(session: Session, upload: models.UploadSession) -> bool:
+    """Mark the upload as being completed; False when another request already claimed it."""
+
+    sessions = models.UploadSession
+    result = session.exec(
+        update(sessions)
+        .where(sessions.id == upload.id, sessions.completing_at.is_(None))
+        .values(completing_at=datetime.utcnow())
+    )
+    commit(session)
+    return bool(result.rowcount)
+
+
+def release_completion(session: Session, upload: models.UploadSession) -> None:
+    sessions = models.UploadSession
+    session.exec(update(sessions).where(sessions.id == upload.id).values(completing_at=None))
+    commit(session)
+
+
+def delete_upload(session: Session, upload: models.UploadSession) -> None:
+    # Statements rather than ``session.delete`` so a session already removed by a
+    # concurrent request is not an error.
+    session.exec(delete(models.UploadPart).where(models.UploadPart.upload_id == upload.id))
+    session.exec(delete(models.UploadSession).where(models.UploadSession.id == upload.id))
+    commit(session)
+
+
+def get_expired_uploads(session: Session, now: Optional[datetime] = None,
+                        limit: int = 100) -> Sequence[models.UploadSession]:
+    statement = (
+        select(models.UploadSession)
+        .where(models.UploadSession.expires_at < (now or datetime.utcnow()))
+        .limit(limit)
+    )
+    return session.exec(statement).all()
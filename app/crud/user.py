@@ -1,11 +1,26 @@
 from __future__ import annotations
 
-from typing import List, Optional, Sequence
+from typing import Any, Dict, Iterable, List, Optional, Sequence
 
+from sqlalchemy import insert, or_
+from sqlalchemy.orm import joinedload, selectinload
 from sqlmodel import Session, delete, select
 
 from .. import models
-from ..security import get_password_hash
+from ..core import principals
+from ..core.bulk import ItemOutcome
+from ..database import commit, on_commit
+from . import links, member as member_crud, permission, role as role_crud
+from ..security import get_password_hash, get_password_hashes
+
+
+# Eager-loading profile matching ``schemas.UserRead`` (member, roles and their permissions).
+USER_READ_OPTIONS = (
+    joinedload(models.User.member),
+    selectinload(models.User.roles)
+    .joinedload(models.UserRoleLink.role)
+    .selectinload(models.Role.permissions),
+)
 
 
 def get_user_by_username(session: Session, username: str) -> Optional[models.User]:
@@ -23,7 +38,13 @@ def get_user(session: Session, user_id: int) -> Optional[models.User]:
 
 
 def get_users(session: Session, skip: int = 0, limit: int = 100) -> Sequence[models.User]:
-    statement = select(models.User).offset(skip).limit(limit)
+    statement = (
+        select(models.User)
+        .order_by(models.User.id)
+        .offset(skip)
+        .limit(limit)
+        .options(*USER_READ_OPTIONS)
+    )
     return session.exec(statement).all()
 
 
@@ -48,11 +69,83 @@ def create_user(session: Session, *, username: str, email: str, password: str, f
         for role_id in role_ids:
             session.add(models.UserRoleLink(user_id=db_user.id, role_id=role_id))
 
-    session.commit()
+    commit(session)
     session.refresh(db_user)
     return db_user
 
 
+def create_users(session: Session, users: Sequence[Dict[str, Any]]) -> List[ItemOutcome]:
+    """Create many users at once; ``users`` holds the keyword arguments of :func:`create_user`.
+
+    Usernames, emails, member ids and role ids of the whole batch are each checked with
+    one query. Accepted passwords are hashed in parallel before any row is written, and
+    users and their role links are inserted with one multi-row statement each.
+    """
+
+    usernames = {user["username"] for user in users}
+    emails = {user["email"] for user in users}
+    taken = session.exec(
+        select(models.User.username, models.User.email).where(
+            or_(models.User.username.in_(usernames), models.User.email.in_(emails))
+        )
+    ).all()
+    taken_usernames = {username for username, _ in taken}
+    taken_emails = {email for _, email in taken}
+    members = member_crud.get_existing_member_ids(
+        session, (user["member_id"] for user in users if user.get("member_id") is not None)
+    )
+    roles = role_crud.get_existing_role_ids(session, (role_id for user in users for role_id in user.get("role_ids") or ()))
+
+    outcomes: List[ItemOutcome] = []
+    accepted: List[Dict[str, Any]] = []
+    for user in users:
+        missing_roles = set(user.get("role_ids") or ()) - roles
+        if user["username"] in taken_usernames:
+            error = "Username already exists"
+        elif user["email"] in taken_emails:
+            error = "Email already exists"
+        elif user.get("member_id") is not None and user["member_id"] not in members:
+            error = f"Member {user['member_id']} not found"
+        elif missing_roles:
+            error = f"Roles {sorted(missing_roles)} not found"
+        else:
+            error = None
+        outcomes.append(ItemOutcome(error=error))
+        if error is None:
+            taken_usernames.add(user["username"])
+            taken_emails.add(user["email"])
+            accepted.append(user)
+    if not accepted:
+        return outcomes
+
+    hashes = get_password_hashes([user["password"] for user in accepted])
+    rows = [
+        {
+            "username": user["username"],
+            "email": user["email"],
+            "full_name": user.get("full_name"),
+            "hashed_password": hashed,
+            "is_active": user.get("is_active", True),
+            "member_id": user.get("member_id"),
+        }
+        for user, hashed in zip(accepted, hashes)
+    ]
+    # Ids are matched back by the unique username, see ``member.create_members``.
+    ids = dict(session.execute(insert(models.User).returning(models.User.username, models.User.id), rows).all())
+    links = [
+        {"user_id": ids[user["username"]], "role_id": role_id}
+        for user in accepted
+        for role_id in dict.fromkeys(user.get("role_ids") or ())
+    ]
+    if links:
+        session.execute(insert(models.UserRoleLink), links)
+    for user, outcome in zip(users, outcomes):
+        if outcome.ok:
+            outcome.id = ids[user["username"]]
+    commit(session)
+    return outcomes
+
+
 def update_user(session: Session, db_user: models.User, *, email: Optional[str] = None,
                 full_name: Optional[str] = None, is_active: Optional[bool] = None,
                 password: Optional[str] = None, member_id: Optional[int] = None,
@@ -71,18 +164,45 @@ def update_user(session: Session, db_user: models.User, *, email: Optional[str]
     if member_id is not None:
         db_user.member_id = member_id
 
+    roles_changed = False
     if role_ids is not None:
-        session.exec(delete(models.UserRoleLink).where(models.UserRoleLink.user_id == db_user.id))
-        session.flush()
-        for role_id in role_ids:
-            session.add(models.UserRoleLink(user_id=db_user.id, role_id=role_id))
+        roles_changed = links.set_links(session, models.UserRoleLink, "user_id", db_user.id, "role_id", role_ids).changed
 
     session.add(db_user)
-    session.commit()
+    if is_active is not None or member_id is not None or roles_changed:
+        permission.bump_version(session)
+    commit(session)
+    on_commit(session, principals.invalidate_user, db_user.id)
     session.refresh(db_user)
     return db_user
 
 
+def update_user_roles(session: Session, db_user: models.User, *, add: Iterable[int] = (),
+                      remove: Iterable[int] = ()) -> links.LinkChanges:
+    """Assign ``add`` and unassign ``remove`` without touching the user's other roles."""
+
+    changes = links.LinkChanges(
+        removed=links.remove_links(session, models.UserRoleLink, "user_id", db_user.id, "role_id", remove),
+        added=links.add_links(session, models.UserRoleLink, "user_id", db_user.id, "role_id", add),
+    )
+    if changes.changed:
+        permission.bump_version(session)
+    commit(session)
+    if changes.changed:
+        on_commit(session, principals.invalidate_user, db_user.id)
+    session.refresh(db_user)
+    return changes
+
+
+def delete_user(session: Session, db_user: models.User) -> None:
+    user_id = db_user.id
+    session.exec(delete(models.UserRoleLink).where(models.UserRoleLink.user_id == user_id))
+    session.delete(db_user)
+    permission.bump_version(session)
+    commit(session)
+    on_commit(session, principals.invalidate_user, user_id)
+
+
 def get_user_permissions(session: Session, user: models.User) -> List[str]:
     statement = (
         select(models.RolePermission.permission)
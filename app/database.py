@@ -1,28 +1,139 @@
 from contextlib import contextmanager
-from typing import Iterator
+from typing import Any, Callable, Dict, Iterator, List, Optional
 
 from pathlib import Path
 
+from sqlalchemy import DDL, event, inspect
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.sql.dml import Insert
 from sqlmodel import Session, SQLModel, create_engine
 
 from .config import get_settings
+from .core import metrics, profiling
 
 settings = get_settings()
 
-connect_args = {}
-if settings.database_url.startswith("sqlite:///"):
-    db_path = Path(settings.database_url.replace("sqlite:///", "", 1))
-    if db_path.parent:
-        db_path.parent.mkdir(parents=True, exist_ok=True)
-    connect_args = {"check_same_thread": False}
+PROFILES = ("default", "tuned")
 
-engine = create_engine(settings.database_url, echo=False, connect_args=connect_args)
+# Indexes of databases created by earlier versions that composites have since replaced.
+SUPERSEDED_INDEXES = ("ix_auditlog_action", "ix_auditlog_target_type", "ix_auditlog_created_at")
 
 
-def init_db() -> None:
-    """Create database tables."""
+def sqlite_pragmas() -> Dict[str, Any]:
+    """PRAGMAs applied to every new SQLite connection by the ``tuned`` profile."""
+
+    return {
+        "journal_mode": settings.sqlite_journal_mode.upper(),
+        "synchronous": settings.sqlite_synchronous.upper(),
+        "busy_timeout": settings.sqlite_busy_timeout_ms,
+        "mmap_size": settings.sqlite_mmap_size,
+        # Negative values are a size in KiB rather than a number of pages.
+        "cache_size": -settings.sqlite_cache_size_kib,
+    }
+
+
+def engine_options(database_url: str, profile: str = "tuned") -> Dict[str, Any]:
+    """Keyword arguments for ``create_engine`` under a database ``profile``.
+
+    ``default`` only sets what the application needs to work at all; ``tuned`` sizes the
+    connection pool from settings and, for PostgreSQL, applies a statement timeout.
+    """
+
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown database profile {profile!r}; expected one of {', '.join(PROFILES)}")
+    url = make_url(database_url)
+    options: Dict[str, Any] = {"echo": False, "connect_args": {}}
+    sqlite = url.get_backend_name() == "sqlite"
+    if sqlite:
+        options["connect_args"]["check_same_thread"] = False
+    if profile == "default":
+        return options
+
+    if not sqlite or url.database not in (None, "", ":memory:"):
+        options.update(
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout_seconds,
+        )
+    if not sqlite:
+        options.update(pool_pre_ping=settings.db_pool_pre_ping, pool_recycle=settings.db_pool_recycle_seconds)
+    if url.get_backend_name() == "postgresql" and settings.db_statement_timeout_ms > 0:
+        options["connect_args"]["options"] = f"-c statement_timeout={settings.db_statement_timeout_ms}"
+    return options
+
+
+def create_db_engine(database_url: str, profile: Optional[str] = None) -> Engine:
+    """Create an engine for ``database_url`` configured by ``profile`` (``DATABASE_PROFILE``)."""
+
+    profile = profile or settings.database_profile
+    if database_url.startswith("sqlite:///"):
+        db_path = Path(database_url.replace("sqlite:///", "", 1))
+        if db_path.parent:
+            db_path.parent.mkdir(parents=True, exist_ok=True)
+    db_engine = create_engine(database_url, **engine_options(database_url, profile))
+    if profile == "tuned" and db_engine.dialect.name == "sqlite":
+        pragmas = sqlite_pragmas()
+
+        @event.listens_for(db_engine, "connect")
+        def _apply_pragmas(dbapi_connection, _record) -> None:
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
+    if settings.metrics_enabled:
+        metrics.instrument_engine(db_engine)
+    if settings.profiling_enabled:
+        profiling.instrument_engine(db_engine)
+    return db_engine
+
+
+engine = create_db_engine(settings.database_url)
+
+
+def init_db() -> List[str]:
+    """Create database tables, and columns and indexes added to existing tables since they
+    were created, dropping indexes they replaced. Returns the added columns as ``table.column``, so callers can backfill them;
+    raises ``RuntimeError`` for a new NOT NULL column that has no server default.
+    """
 
     SQLModel.metadata.create_all(engine)
+    added = _add_missing_columns()
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    with engine.begin() as connection:
+        for name in SUPERSEDED_INDEXES:
+            connection.execute(DDL(f"DROP INDEX IF EXISTS {engine.dialect.identifier_preparer.quote(name)}"))
+    return added
+
+
+def _add_missing_columns() -> List[str]:
+    inspector = inspect(engine)
+    missing = []
+    for table in SQLModel.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        missing.extend((table, column) for column in table.columns if column.name not in existing)
+    # Rows already in the table need a value for the new column, so a NOT NULL column
+    # without a server default cannot be added; refuse before altering anything.
+    unaddable = [f"{table.name}.{column.name}" for table, column in missing
+                 if not column.nullable and column.server_default is None]
+    if unaddable:
+        raise RuntimeError(
+            f"Cannot add NOT NULL columns without a server default to existing tables: {', '.join(unaddable)}; "
+            "give them a server_default or make them nullable"
+        )
+
+    added = []
+    with engine.begin() as connection:
+        for table, column in missing:
+            connection.execute(DDL(
+                f"ALTER TABLE {engine.dialect.identifier_preparer.format_table(table)} "
+                f"ADD COLUMN {CreateColumn(column).compile(dialect=engine.dialect)}"
+            ))
+            added.append(f"{table.name}.{column.name}")
+    return added
 
 
 @contextmanager
@@ -31,3 +142,64 @@ def get_session() -> Iterator[Session]:
 
     with Session(engine) as session:
         yield session
+
+
+def upsert_insert(session: Session, model) -> Optional[Insert]:
+    """Return an INSERT supporting ``ON CONFLICT`` for the session's dialect, if any."""
+
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert(model)
+
+
+def commit(session: Session) -> None:
+    """Commit the session, or only flush it while an :func:`atomic` block is open.
+
+    CRUD functions call this instead of ``session.commit()`` so several of them, plus the
+    audit entry describing the change, can share a single transaction.
+    """
+
+    if session.info.get("atomic"):
+        session.flush()
+    else:
+        session.commit()
+
+
+def on_commit(session: Session, callback: Callable[..., Any], *args: Any) -> None:
+    """Run ``callback`` once the current changes are committed.
+
+    Outside an :func:`atomic` block the changes were already committed by :func:`commit`,
+    so the callback runs immediately; inside one it is deferred until the block commits
+    and skipped if it rolls back.
+    """
+
+    if session.info.get("atomic"):
+        session.info.setdefault("on_commit", []).append((callback, args))
+    else:
+        callback(*args)
+
+
+@contextmanager
+def atomic(session: Session) -> Iterator[Session]:
+    """Unit of work: commit everything done inside the block at once, or roll it back."""
+
+    if session.info.get("atomic"):
+        yield session
+        return
+    session.info["atomic"] = True
+    try:
+        yield session
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        session.info.pop("atomic", None)
+        callbacks = session.info.pop("on_commit", [])
+    for callback, args in callbacks:
+        callback(*args)
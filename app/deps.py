@@ -1,14 +1,18 @@
 from __future__ import annotations
 
-from typing import Callable, Iterable, List
+import time
+from typing import Callable, Iterator
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from sqlmodel import Session
 
 from . import crud, models
 from .config import get_settings
+from .core.metrics import AUTH_SECONDS
+from .core.principals import Principal, permission_version, principal_cache
+from .core.replicas import replicas, writer_key
 from .database import get_session
 from .schemas import TokenPayload
 
@@ -16,47 +20,90 @@ settings = get_settings()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
 
-async def get_db() -> Iterable[Session]:
+def get_db() -> Iterator[Session]:
     with get_session() as session:
         yield session
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Depends(get_db)) -> models.User:
+def get_read_db(request: Request) -> Iterator[Session]:
+    """Read-only session for safe GETs, served by a replica when one is fresh enough.
+
+    Callers whose own write succeeded within the replica lag bound read from the primary.
+    """
+
+    primary = replicas.wrote_recently(writer_key(request.headers.get("authorization")))
+    with replicas.read_session(primary=primary) as session:
+        yield session
+
+
+def get_current_principal(token: str = Depends(oauth2_scheme), session: Session = Depends(get_db)) -> Principal:
+    """Resolve the caller once per request, serving repeat tokens from the principal cache."""
+
+    cached = principal_cache.get(token)
+    if cached is not None:
+        return cached
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        token_data = TokenPayload(**payload)
+        with AUTH_SECONDS.time("decode"):
+            payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+            token_data = TokenPayload(**payload)
     except JWTError as exc:
         raise credentials_exception from exc
 
-    user = crud.user.get_user_by_username(session, token_data.sub)
+    ttl_seconds = token_data.exp - time.time()
+    if settings.token_embed_permissions and token_data.carries_permissions:
+        current_version = permission_version.get(lambda: crud.permission.get_version(session))
+        if token_data.pv >= current_version:
+            principal = Principal.from_claims(token_data)
+            principal_cache.set(token, principal, ttl_seconds=ttl_seconds)
+            return principal
+
+    with AUTH_SECONDS.time("lookup"):
+        user = crud.user.get_user_by_username(session, token_data.sub)
+        if not user:
+            raise credentials_exception
+        principal = Principal.from_user(user, crud.user.get_user_permissions(session, user))
+    principal_cache.set(token, principal, ttl_seconds=ttl_seconds)
+    return principal
+
+
+def get_current_active_principal(principal: Principal = Depends(get_current_principal)) -> Principal:
+    if not principal.is_active:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user")
+    return principal
+
+
+def get_current_user(principal: Principal = Depends(get_current_principal),
+                     session: Session = Depends(get_db)) -> models.User:
+    user = crud.user.get_user(session, principal.id)
     if not user:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
 
 
-async def get_current_active_user(current_user: models.User = Depends(get_current_user)) -> models.User:
+def get_current_active_user(current_user: models.User = Depends(get_current_user)) -> models.User:
     if not current_user.is_active:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user")
     return current_user
 
 
 def require_permissions(*permissions: str) -> Callable:
-    async def dependency(
-        current_user: models.User = Depends(get_current_active_user),
-        session: Session = Depends(get_db),
-    ) -> models.User:
-        user_permissions: List[str] = crud.user.get_user_permissions(session, current_user)
-        missing = [perm for perm in permissions if perm not in user_permissions]
+    def dependency(principal: Principal = Depends(get_current_active_principal)) -> Principal:
+        missing = [perm for perm in permissions if not principal.has_permission(perm)]
         if missing:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail={"missing_permissions": missing},
             )
-        return current_user
+        return principal
 
     return dependency
@@ -1,13 +1,24 @@
 from __future__ import annotations
 
-from fastapi import FastAPI
+import asyncio
+
+from fastapi import Depends, FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 
 from . import crud
 from .config import get_settings
+from .core import metrics
+from .core.concurrency import configure_threadpool, run_blocking
+from .core.profiling import ProfilingMiddleware
+from .core.replicas import ReadYourWritesMiddleware, replicas, run_replica_monitor
 from .database import get_session, init_db
-from .routers import audit, auth, files, members, roles, settings as settings_router, users
-from .security import Permission
+from .deps import require_permissions
+from .routers import audit, auth, files, members, roles, settings as settings_router, uploads, users
+from .security import Permission, PasswordHasherBusy
+from .services.audit import audit_writer
+from .services.audit_retention import run_audit_retention
+from .services.uploads import run_upload_gc
 
 settings = get_settings()
 app = FastAPI(title=settings.app_name)
@@ -19,13 +30,52 @@ if settings.cors_origins:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor"],
+    )
+
+if replicas.enabled:
+    app.add_middleware(ReadYourWritesMiddleware, replica_set=replicas)
+
+if settings.metrics_enabled:
+    app.add_middleware(metrics.MetricsMiddleware)
+
+if settings.profiling_enabled:
+    app.add_middleware(ProfilingMiddleware)
+
+
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"},
     )
 
 
 @app.on_event("startup")
-def on_startup() -> None:
-    init_db()
+async def on_startup() -> None:
+    configure_threadpool()
+    added_columns = init_db()
+    with get_session() as session:
+        if "member.storage_used" in added_columns:
+            crud.member.recalculate_storage_used(session)
+        crud.member.ensure_portal_usage(session)
+        crud.audit_archive.create_missing_indexes(session)
     bootstrap_defaults()
+    audit_writer.start()
+    app.state.background_tasks = [asyncio.create_task(run_upload_gc())]
+    if settings.audit_retention_days > 0:
+        app.state.background_tasks.append(asyncio.create_task(run_audit_retention()))
+    if replicas.enabled:
+        app.state.background_tasks.append(asyncio.create_task(run_replica_monitor()))
+
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    for task in app.state.background_tasks:
+        task.cancel()
+    await asyncio.gather(*app.state.background_tasks, return_exceptions=True)
+    await run_blocking(audit_writer.stop)
 
 
 def bootstrap_defaults() -> None:
@@ -86,6 +136,7 @@ app.include_router(users.router)
 app.include_router(roles.router)
 app.include_router(members.router)
 app.include_router(files.router)
+app.include_router(uploads.router)
 app.include_router(audit.router)
 app.include_router(settings_router.router)
 
@@ -93,3 +144,13 @@ app.include_router(settings_router.router)
 @app.get("/health")
 async def health_check() -> dict[str, str]:
     return {"status": "ok"}
+
+
+if settings.metrics_enabled:
+    metrics_dependencies = (
+        [Depends(require_permissions(Permission.MANAGE_SETTINGS))] if settings.metrics_require_auth else []
+    )
+
+    @app.get("/metrics", include_in_schema=False, dependencies=metrics_dependencies)
+    async def read_metrics() -> Response:
+        return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
@@ -1,8 +1,7 @@
-from __future__ import annotations
-
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 
+from sqlalchemy import JSON, BigInteger, Column, Index
 from sqlmodel import Field, Relationship, SQLModel
 
 
@@ -38,6 +37,8 @@ class Member(SQLModel, table=True):
     description: Optional[str] = None
     api_key: Optional[str] = Field(default=None, index=True)
     security_server_ip: Optional[str] = Field(default=None, index=True)
+    # Sum of the member's FileAsset sizes, maintained by crud.file as files come and go.
+    storage_used: int = Field(default=0, sa_column=Column(BigInteger, nullable=False, server_default="0"))
 
     users: List["User"] = Relationship(back_populates="member")
     files: List["FileAsset"] = Relationship(back_populates="member")
@@ -57,13 +58,45 @@ class User(SQLModel, table=True):
     owned_files: List["FileAsset"] = Relationship(back_populates="owner")
 
 
+class PortalUsage(SQLModel, table=True):
+    """Single row holding the size of all stored files, so the portal quota is checked in one guarded update."""
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    storage_used: int = Field(default=0, sa_column=Column(BigInteger, nullable=False, server_default="0"))
+
+
+class StorageBlob(SQLModel, table=True):
+    """Content-addressed file body shared by every ``FileAsset`` with the same SHA-256."""
+
+    checksum: str = Field(primary_key=True)
+    path: str
+    size: int
+    ref_count: int = 0
+    # Compression of the stored object, see ``storage.codecs``; unset when stored as uploaded.
+    codec: Optional[str] = None
+    stored_size: Optional[int] = None
+    frame_size: Optional[int] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 class FileAsset(SQLModel, table=True):
+    __table_args__ = (
+        # Keyset pagination of a member's files, newest first.
+        Index("ix_fileasset_member_id_uploaded_at_id", "member_id", "uploaded_at", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     filename: str = Field(index=True)
     original_filename: str
     path: str
     size: int
     checksum: Optional[str] = Field(default=None, index=True)
+    # Every UPLOAD_DIGEST_ALGORITHMS digest computed while the file was written, by name.
+    digests: Optional[Dict[str, str]] = Field(default=None, sa_column=Column(JSON))
+    blob_checksum: Optional[str] = Field(default=None, foreign_key="storageblob.checksum", index=True)
+    codec: Optional[str] = None
+    stored_size: Optional[int] = None
+    frame_size: Optional[int] = None
     uploaded_at: datetime = Field(default_factory=datetime.utcnow)
     owner_id: int = Field(foreign_key="user.id")
     member_id: int = Field(foreign_key="member.id")
@@ -74,6 +107,9 @@ class FileAsset(SQLModel, table=True):
 
 
 class FileShare(SQLModel, table=True):
+    # The primary key starts with file_id; this index serves "files shared with member".
+    __table_args__ = (Index("ix_fileshare_member_id_file_id", "member_id", "file_id"),)
+
     file_id: Optional[int] = Field(default=None, foreign_key="fileasset.id", primary_key=True)
     member_id: Optional[int] = Field(default=None, foreign_key="member.id", primary_key=True)
     granted_by_id: int = Field(foreign_key="user.id")
@@ -83,11 +119,66 @@ class FileShare(SQLModel, table=True):
     member: Member = Relationship()
 
 
+class UploadSession(SQLModel, table=True):
+    """Resumable upload in progress; parts are written straight into a staged file."""
+
+    id: str = Field(primary_key=True)
+    owner_id: int = Field(foreign_key="user.id", index=True)
+    member_id: int = Field(foreign_key="member.id")
+    original_filename: str
+    size: int
+    part_size: int
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime = Field(index=True)
+    # Set by the request completing the upload, so only one of several can promote it.
+    completing_at: Optional[datetime] = None
+
+    parts: List["UploadPart"] = Relationship(back_populates="upload")
+
+
+class UploadPart(SQLModel, table=True):
+    upload_id: str = Field(foreign_key="uploadsession.id", primary_key=True)
+    part_number: int = Field(primary_key=True)
+    size: int
+    checksum: str
+    received_at: datetime = Field(default_factory=datetime.utcnow)
+
+    upload: UploadSession = Relationship(back_populates="parts")
+
+
 class AuditLog(SQLModel, table=True):
+    # Newest-first keyset pagination, alone or filtered by actor, action or target. The
+    # composites replace single-column indexes on action, target_type and created_at.
+    __table_args__ = (
+        Index("ix_auditlog_created_at_id", "created_at", "id"),
+        Index("ix_auditlog_actor_id_created_at_id", "actor_id", "created_at", "id"),
+        Index("ix_auditlog_action_created_at_id", "action", "created_at", "id"),
+        Index("ix_auditlog_target_created_at_id", "target_type", "target_id", "created_at", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     actor_id: Optional[int] = Field(default=None, foreign_key="user.id")
-    action: str = Field(index=True)
-    target_type: str = Field(index=True)
+    action: str
+    target_type: str
     target_id: Optional[int] = Field(default=None, index=True)
     details: Optional[str] = None
-    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class ReplicationHeartbeat(SQLModel, table=True):
+    """Single row the primary stamps periodically; its age on a replica is that replica's lag."""
+
+    id: Optional[int] = Field(default=1, primary_key=True)
+    beat_at: datetime
+
+
+class PermissionVersion(SQLModel, table=True):
+    """Single-row counter bumped whenever users, roles or role links change.
+
+    Access tokens carrying embedded permissions record the version they were issued at,
+    so any change to the underlying data can be detected with one cheap lookup.
+    """
+
+    id: Optional[int] = Field(default=1, primary_key=True)
+    version: int = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -1,21 +1,90 @@
-from typing import List
+from datetime import datetime, timezone
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session
 
 from .. import crud, models
-from ..deps import get_db, require_permissions
-from ..schemas import AuditLogRead
+from ..core.pagination import InvalidCursor
+from ..core.principals import Principal
+from ..deps import get_read_db, require_permissions
+from ..schemas import AuditExportFormat, AuditLogRead
 from ..security import Permission
+from ..services.audit_export import MEDIA_TYPES, export_audit_logs
 
 router = APIRouter(prefix="/audit", tags=["audit"])
 
 
+def audit_log_filter(
+    actor_id: Optional[int] = None,
+    action: Optional[str] = None,
+    target_type: Optional[str] = None,
+    target_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> crud.audit.AuditLogFilter:
+    """Audit query parameters; ``since`` is inclusive and ``until`` exclusive."""
+
+    return crud.audit.AuditLogFilter(
+        actor_id=actor_id,
+        action=action,
+        target_type=target_type,
+        target_id=target_id,
+        since=_naive_utc(since),
+        until=_naive_utc(until),
+    )
+
+
 @router.get("/", response_model=List[AuditLogRead])
-async def list_audit_logs(
-    skip: int = 0,
-    limit: int = 100,
-    session: Session = Depends(get_db),
-    _: models.User = Depends(require_permissions(Permission.VIEW_AUDIT_LOGS)),
+def list_audit_logs(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    include_archived: bool = False,
+    filters: crud.audit.AuditLogFilter = Depends(audit_log_filter),
+    session: Session = Depends(get_read_db),
+    _: Principal = Depends(require_permissions(Permission.VIEW_AUDIT_LOGS)),
 ) -> List[models.AuditLog]:
-    return list(crud.audit.list_logs(session, skip=skip, limit=limit))
+    """List audit entries newest first, optionally filtered.
+
+    Pass the ``X-Next-Cursor`` response header back as ``cursor`` to fetch the next page.
+    With ``include_archived`` the listing continues into archived entries.
+    """
+
+    try:
+        page = crud.audit.list_logs(session, filters, cursor=cursor, limit=limit, include_archived=include_archived)
+    except InvalidCursor as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+    if page.next_cursor:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+    return page.items
+
+
+@router.get("/export")
+def export_audit_logs_endpoint(
+    format: AuditExportFormat = AuditExportFormat.ndjson,
+    gzip: bool = False,
+    include_archived: bool = False,
+    filters: crud.audit.AuditLogFilter = Depends(audit_log_filter),
+    _: Principal = Depends(require_permissions(Permission.VIEW_AUDIT_LOGS)),
+) -> StreamingResponse:
+    """Stream every matching audit entry, oldest first, as NDJSON or CSV (optionally gzipped)."""
+
+    filename = f"audit-{datetime.utcnow():%Y%m%dT%H%M%SZ}.{format.value}"
+    media_type = MEDIA_TYPES[format.value]
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        export_audit_logs(filters, fmt=format.value, compress=gzip, include_archived=include_archived),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # Audit timestamps are stored as naive UTC.
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
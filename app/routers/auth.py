@@ -1,34 +1,68 @@
+import logging
+import time
 from datetime import timedelta
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlmodel import Session
 
 from .. import crud, models
 from ..config import get_settings
+from ..core.concurrency import run_blocking
 from ..deps import get_current_active_user, get_db
 from ..schemas import Token, UserRead
-from ..security import create_access_token, verify_password
+from ..security import create_access_token, permission_claims, verify_password_timed
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 
 @router.post("/token", response_model=Token)
 async def login_for_access_token(
+    response: Response,
     form_data: OAuth2PasswordRequestForm = Depends(),
     session: Session = Depends(get_db),
 ) -> Token:
-    user = crud.user.get_user_by_username(session, form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect username or password")
+    started = time.perf_counter()
+    user = await run_blocking(crud.user.get_user_by_username, session, form_data.username)
+    lookup_ms = (time.perf_counter() - started) * 1000
+
+    timings = [f"db;dur={lookup_ms:.1f}"]
+    valid = False
+    if user:
+        valid, hash_timing = await verify_password_timed(form_data.password, user.hashed_password)
+        timings.append(f"hash-queue;dur={hash_timing.queued_ms:.1f}")
+        timings.append(f"bcrypt;dur={hash_timing.compute_ms:.1f}")
+    total_ms = (time.perf_counter() - started) * 1000
+    timings.append(f"total;dur={total_ms:.1f}")
+    logger.info("login user=%s success=%s %s", form_data.username, valid, " ".join(timings))
+
+    if not valid:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password",
+            headers={"Server-Timing": ", ".join(timings)},
+        )
+
+    claims = None
+    if settings.token_embed_permissions and user.is_active:
+        claims = await run_blocking(_permission_claims, session, user)
 
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
-    access_token = create_access_token(subject=user.username, expires_delta=access_token_expires)
+    access_token = create_access_token(subject=user.username, expires_delta=access_token_expires, claims=claims)
+    response.headers["Server-Timing"] = ", ".join(timings)
     return Token(access_token=access_token)
 
 
 @router.get("/me", response_model=UserRead)
-async def read_users_me(current_user: models.User = Depends(get_current_active_user)) -> models.User:
+def read_users_me(current_user: models.User = Depends(get_current_active_user)) -> models.User:
     return current_user
+
+
+def _permission_claims(session: Session, user: models.User) -> dict:
+    # Read the version first so a concurrent change can only make the token look stale.
+    version = crud.permission.get_version(session)
+    permissions = crud.user.get_user_permissions(session, user)
+    return permission_claims(user.id, user.member_id, permissions, version)
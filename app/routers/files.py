@@ -1,72 +1,163 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import Response
 from sqlmodel import Session
 
 from .. import crud, models
-from ..deps import get_current_active_user, get_db
-from ..schemas import FileRead, FileShareCreate
+from ..core.concurrency import run_blocking
+from ..core.pagination import InvalidCursor
+from ..core.principals import Principal
+from ..database import atomic, on_commit
+from ..deps import get_current_active_principal, get_db, get_read_db
+from ..core.bulk import ItemOutcome
+from ..schemas import BulkResult, FileBulkShare, FileRead, FileScope, FileShareCreate, FileSharePatch
 from ..security import Permission
-from ..storage.file_service import FileService
+from ..services import quotas
+from ..services.uploads import purge_blob
+from ..storage import storage
+from ..storage.codecs import encoding_fields, encoding_of
+from ..storage.multipart import MalformedUpload, ReceivedFile, UploadTooLarge, check_content_length, receive_file
+from ..storage.responses import build_download_response
 
 router = APIRouter(prefix="/files", tags=["files"])
-file_service = FileService()
 
 
 @router.get("/", response_model=List[FileRead])
-async def list_files(
-    session: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user),
+def list_files(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    scope: FileScope = FileScope.all,
+    name_prefix: Optional[str] = None,
+    min_size: Optional[int] = Query(None, ge=0),
+    max_size: Optional[int] = Query(None, ge=0),
+    owner_id: Optional[int] = None,
+    session: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_active_principal),
 ) -> List[models.FileAsset]:
+    """List files of the caller's member, newest first.
+
+    Pass the ``X-Next-Cursor`` response header back as ``cursor`` to fetch the next page.
+    """
+
     if not current_user.member_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User not associated to a member")
-    files = crud.file.get_files_for_member(session, current_user.member_id)
-    return list(files)
+    try:
+        page = crud.file.get_files_for_member(
+            session,
+            current_user.member_id,
+            scope=scope.value,
+            name_prefix=name_prefix,
+            min_size=min_size,
+            max_size=max_size,
+            owner_id=owner_id,
+            cursor=cursor,
+            limit=limit,
+        )
+    except InvalidCursor as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+    if page.next_cursor:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+    return page.items
+
+
+# The form is parsed by the handler while it streams, so the body is described here.
+UPLOAD_REQUEST_BODY = {
+    "required": True,
+    "content": {
+        "multipart/form-data": {
+            "schema": {
+                "type": "object",
+                "properties": {"uploaded_file": {"type": "string", "format": "binary"}},
+                "required": ["uploaded_file"],
+            }
+        }
+    },
+}
 
 
-@router.post("/", response_model=FileRead, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/",
+    response_model=FileRead,
+    status_code=status.HTTP_201_CREATED,
+    openapi_extra={"requestBody": UPLOAD_REQUEST_BODY},
+)
 async def upload_file(
-    uploaded_file: UploadFile = File(...),
+    request: Request,
     session: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user),
-) -> models.FileAsset:
+    current_user: Principal = Depends(get_current_active_principal),
+) -> FileRead:
+    """Store the file sent as form field ``uploaded_file``.
+
+    The body is written to storage as it arrives. Uploads larger than the maximum file
+    size or the storage quota left are answered with 413, from ``Content-Length`` before
+    any of the body is read, otherwise as soon as the limit is crossed.
+    """
+
     if not current_user.member_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User not associated to a member")
 
-    if not uploaded_file.filename:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Filename is required")
+    limit = await run_blocking(quotas.upload_limit, session, current_user.member_id)
+    try:
+        check_content_length(request, limit.max_bytes, limit.detail)
+        received = await receive_file(request, storage, "uploaded_file", limit=limit.max_bytes,
+                                      limit_detail=limit.detail)
+    except UploadTooLarge as exc:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=exc.detail) from exc
+    except MalformedUpload as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
 
-    uploaded_file.file.seek(0)
-    saved_path = file_service.save(uploaded_file.file, uploaded_file.filename)
-    size = saved_path.stat().st_size
+    return await run_blocking(_record_upload, session, current_user, received)
 
-    file_record = crud.file.create_file(
-        session,
-        file_path=saved_path,
-        owner_id=current_user.id,
-        member_id=current_user.member_id,
-        original_filename=uploaded_file.filename,
-        size=size,
-    )
 
-    crud.audit.create_log(
-        session,
-        actor_id=current_user.id,
-        action="file.uploaded",
-        target_type="file",
-        target_id=file_record.id,
-        details=f"Uploaded file {uploaded_file.filename}",
-    )
-    return file_record
+def _record_upload(session: Session, current_user: Principal, received: ReceivedFile) -> FileRead:
+    stored = received.stored
+    key = storage.blob_key(stored.checksum) if storage.content_addressed else stored.key
+    try:
+        with atomic(session):
+            file_record = crud.file.create_file(
+                session,
+                key=key,
+                owner_id=current_user.id,
+                member_id=current_user.member_id,
+                original_filename=received.filename,
+                size=stored.size,
+                checksum=stored.checksum,
+                digests=stored.digests,
+                content_addressed=storage.content_addressed,
+                storage_quota=quotas.member_quota(),
+                total_storage_quota=quotas.total_quota(),
+                **encoding_fields(stored.encoding),
+            )
+            crud.audit.record(
+                session,
+                actor_id=current_user.id,
+                action="file.uploaded",
+                target_type="file",
+                target_id=file_record.id,
+                details=f"Uploaded file {received.filename}",
+            )
+            # Placed before the commit, so a recorded file always has its content. An existing
+            # blob recorded with another encoding is kept.
+            storage.place(stored, keep_existing=encoding_of(file_record) != stored.encoding)
+    except crud.member.StorageQuotaExceeded as exc:
+        storage.delete(stored.key)
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exc)) from exc
+    except BaseException:
+        storage.delete(stored.key)
+        raise
+    # Serialized here, on the worker thread, rather than by the async handler.
+    return FileRead.from_orm(file_record)
 
 
 @router.get("/{file_id}")
-async def download_file(
+def download_file(
     file_id: int,
-    session: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user),
-) -> StreamingResponse:
+    request: Request,
+    session: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_active_principal),
+) -> Response:
     file_record = crud.file.get_file(session, file_id)
     if not file_record:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
@@ -74,20 +165,28 @@ async def download_file(
     if not _user_can_access_file(session, current_user, file_record):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
 
-    file_handle = file_service.open(file_record.path)
-    return StreamingResponse(
-        file_handle,
-        media_type="application/octet-stream",
-        headers={"Content-Disposition": f"attachment; filename={file_record.original_filename}"},
+    path = storage.local_path(file_record.path)
+    if path is not None and not path.is_file():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File content missing")
+
+    return build_download_response(
+        request,
+        storage=storage,
+        key=file_record.path,
+        size=file_record.size,
+        filename=file_record.original_filename,
+        last_modified=file_record.uploaded_at,
+        etag=f'"{file_record.checksum}"' if file_record.checksum else None,
+        encoding=encoding_of(file_record),
     )
 
 
 @router.post("/{file_id}/share", response_model=FileRead)
-async def share_file(
+def share_file(
     file_id: int,
     share_in: FileShareCreate,
     session: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_principal),
 ) -> models.FileAsset:
     file_record = crud.file.get_file(session, file_id)
     if not file_record:
@@ -96,33 +195,110 @@ async def share_file(
     if not _user_can_manage_file(session, current_user, file_record):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
 
-    for member_id in share_in.member_ids:
-        if not crud.member.get_member(session, member_id):
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Member {member_id} not found")
+    _check_members_exist(session, share_in.member_ids)
 
-    updated_file = crud.file.share_file_with_members(
-        session,
-        file_record,
-        member_ids=share_in.member_ids,
-        granted_by=current_user.id,
-    )
+    with atomic(session):
+        updated_file = crud.file.share_file_with_members(
+            session,
+            file_record,
+            member_ids=share_in.member_ids,
+            granted_by=current_user.id,
+        )
 
-    crud.audit.create_log(
-        session,
-        actor_id=current_user.id,
-        action="file.shared",
-        target_type="file",
-        target_id=file_id,
-        details=f"Shared file {file_record.filename} with members {share_in.member_ids}",
-    )
-    return updated_file
+        crud.audit.record(
+            session,
+            actor_id=current_user.id,
+            action="file.shared",
+            target_type="file",
+            target_id=file_id,
+            details=f"Shared file {file_record.filename} with members {share_in.member_ids}",
+        )
+    return crud.file.get_file_for_read(session, updated_file.id)
+
+
+@router.patch("/{file_id}/shares", response_model=FileRead)
+def update_file_shares(
+    file_id: int,
+    patch_in: FileSharePatch,
+    session: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_active_principal),
+) -> models.FileAsset:
+    """Add and remove members from the file's shares; other shares are left untouched."""
+
+    file_record = crud.file.get_file(session, file_id)
+    if not file_record:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+
+    if not _user_can_manage_file(session, current_user, file_record):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
+
+    _check_members_exist(session, patch_in.add)
+
+    with atomic(session):
+        changes = crud.file.update_file_shares(
+            session, file_record, add=patch_in.add, remove=patch_in.remove, granted_by=current_user.id
+        )
+        if changes.changed:
+            crud.audit.record(
+                session,
+                actor_id=current_user.id,
+                action="file.shared",
+                target_type="file",
+                target_id=file_id,
+                details=f"Updated shares of file {file_record.filename}: "
+                        f"added members {changes.added}, removed members {changes.removed}",
+            )
+    return crud.file.get_file_for_read(session, file_id)
+
+
+@router.post("/share", response_model=BulkResult)
+def share_files_bulk(
+    share_in: FileBulkShare,
+    session: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_active_principal),
+) -> BulkResult:
+    """Share several files with several members, keeping their existing shares.
+
+    Results are reported per entry of ``file_ids``; unknown member ids reject the request.
+    """
+
+    _check_members_exist(session, share_in.member_ids)
+    files = crud.file.get_files(session, share_in.file_ids)
+    outcomes = []
+    for file_id in share_in.file_ids:
+        file_record = files.get(file_id)
+        if file_record is None:
+            outcomes.append(ItemOutcome(id=file_id, error="File not found"))
+        elif not _user_can_manage_file(session, current_user, file_record):
+            outcomes.append(ItemOutcome(id=file_id, error="Insufficient permissions"))
+        else:
+            outcomes.append(ItemOutcome(id=file_id))
+    allowed = [outcome.id for outcome in outcomes if outcome.ok]
+
+    with atomic(session):
+        granted = crud.file.grant_shares(session, allowed, share_in.member_ids, granted_by=current_user.id)
+        crud.audit.record_many(
+            session,
+            [
+                dict(
+                    actor_id=current_user.id,
+                    action="file.shared",
+                    target_type="file",
+                    target_id=file_id,
+                    details=f"Shared file {files[file_id].filename} with members {share_in.member_ids}",
+                )
+                for file_id, count in granted.items()
+                if count
+            ],
+        )
+    return BulkResult.from_outcomes(outcomes)
 
 
 @router.delete("/{file_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_file(
+def delete_file(
     file_id: int,
     session: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_principal),
 ) -> None:
     file_record = crud.file.get_file(session, file_id)
     if not file_record:
@@ -131,19 +307,33 @@ async def delete_file(
     if not _user_can_manage_file(session, current_user, file_record):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
 
-    file_service.remove(file_record.path)
-    crud.file.delete_file(session, file_record)
-    crud.audit.create_log(
-        session,
-        actor_id=current_user.id,
-        action="file.deleted",
-        target_type="file",
-        target_id=file_id,
-        details=f"Deleted file {file_record.filename}",
-    )
+    with atomic(session):
+        blob_checksum, path = file_record.blob_checksum, file_record.path
+        if crud.file.delete_file(session, file_record):
+            # A shared blob is purged under its row lock, so an upload acquiring it again
+            # meanwhile cannot lose its copy.
+            if blob_checksum:
+                on_commit(session, purge_blob, blob_checksum)
+            else:
+                on_commit(session, storage.delete, path)
+        crud.audit.record(
+            session,
+            actor_id=current_user.id,
+            action="file.deleted",
+            target_type="file",
+            target_id=file_id,
+            details=f"Deleted file {file_record.filename}",
+        )
+
+
+def _check_members_exist(session: Session, member_ids: List[int]) -> None:
+    missing = sorted(set(member_ids) - crud.member.get_existing_member_ids(session, member_ids))
+    if missing:
+        detail = f"Member {missing[0]} not found" if len(missing) == 1 else f"Members {missing} not found"
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
 
 
-def _user_can_access_file(session: Session, user: models.User, file: models.FileAsset) -> bool:
+def _user_can_access_file(session: Session, user: Principal, file: models.FileAsset) -> bool:
     if file.owner_id == user.id:
         return True
     if user.member_id == file.member_id:
@@ -153,8 +343,7 @@ def _user_can_access_file(session: Session, user: models.User, file: models.File
     return user.member_id in shared_members
 
 
-def _user_can_manage_file(session: Session, user: models.User, file: models.FileAsset) -> bool:
+def _user_can_manage_file(session: Session, user: Principal, file: models.FileAsset) -> bool:
     if file.owner_id == user.id:
         return True
-    permissions = set(crud.user.get_user_permissions(session, user))
-    return Permission.MANAGE_FILES in permissions
+    return user.has_permission(Permission.MANAGE_FILES)
@@ -1,16 +1,19 @@
-from fastapi import APIRouter, Depends
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, status
 
-from .. import models
 from ..config import get_settings
+from ..core.principals import Principal
+from ..core.profiling import profiles
 from ..deps import require_permissions
-from ..schemas import SettingsRead
+from ..schemas import ProfileRead, ProfileSummary, SettingsRead
 from ..security import Permission
 
 router = APIRouter(prefix="/settings", tags=["settings"])
 
 
 @router.get("/", response_model=SettingsRead)
-async def read_settings(_: models.User = Depends(require_permissions(Permission.MANAGE_SETTINGS))) -> SettingsRead:
+async def read_settings(_: Principal = Depends(require_permissions(Permission.MANAGE_SETTINGS))) -> SettingsRead:
     settings = get_settings()
     return SettingsRead(
         app_name=settings.app_name,
@@ -18,3 +21,26 @@ async def read_settings(_: models.User = Depends(require_permissions(Permission.
         upload_dir=str(settings.upload_dir),
         cors_origins=settings.cors_origins,
     )
+
+
+@router.get("/profiles", response_model=List[ProfileSummary])
+async def list_profiles(
+    _: Principal = Depends(require_permissions(Permission.MANAGE_SETTINGS)),
+) -> List[ProfileSummary]:
+    return [ProfileSummary.from_profile(profile) for profile in profiles.list()]
+
+
+@router.get("/profiles/{profile_id}", response_model=ProfileRead)
+async def read_profile(
+    profile_id: int,
+    _: Principal = Depends(require_permissions(Permission.MANAGE_SETTINGS)),
+) -> ProfileRead:
+    profile = profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return ProfileRead.from_profile(profile)
+
+
+@router.delete("/profiles", status_code=status.HTTP_204_NO_CONTENT)
+async def clear_profiles(_: Principal = Depends(require_permissions(Permission.MANAGE_SETTINGS))) -> None:
+    profiles.clear()
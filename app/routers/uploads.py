@@ -0,0 +1,256 @@
+import logging
+from datetime import timedelta
+from typing import Optional
+
+import anyio
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
+from sqlmodel import Session
+
+from .. import crud, models
+from ..config import get_settings
+from ..core.concurrency import run_blocking
+from ..core.principals import Principal
+from ..database import atomic
+from ..deps import get_current_active_principal, get_db
+from ..schemas import FileRead, UploadPartRead, UploadSessionCreate, UploadSessionRead
+from ..services import quotas
+from ..storage import StagingCorrupted, StoredFile, storage
+from ..storage.codecs import encoding_fields, encoding_of
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/uploads", tags=["uploads"])
+
+
+def _session_ttl() -> timedelta:
+    return timedelta(seconds=settings.upload_session_ttl_seconds)
+
+
+@router.post("/", response_model=UploadSessionRead, status_code=status.HTTP_201_CREATED)
+def create_upload(
+    upload_in: UploadSessionCreate,
+    session: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_active_principal),
+) -> UploadSessionRead:
+    if not current_user.member_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User not associated to a member")
+
+    part_size = upload_in.part_size or settings.upload_part_size
+    if part_size > settings.upload_max_part_size:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Part size may not exceed {settings.upload_max_part_size} bytes",
+        )
+    _check_upload_limit(session, current_user.member_id, upload_in.size)
+
+    upload = crud.upload.create_upload(
+        session,
+        owner_id=current_user.id,
+        member_id=current_user.member_id,
+        original_filename=upload_in.filename,
+        size=upload_in.size,
+        part_size=part_size,
+        ttl=_session_ttl(),
+    )
+    storage.create_staging(upload.id, upload.size)
+    return _upload_read(session, upload)
+
+
+@router.get("/{upload_id}", response_model=UploadSessionRead)
+def read_upload(
+    upload_id: str,
+    session: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_active_principal),
+) -> UploadSessionRead:
+    return _upload_read(session, _get_owned_upload(session, upload_id, current_user))
+
+
+@router.put("/{upload_id}/parts/{part_number}", response_model=UploadPartRead)
+async def upload_part(
+    upload_id: str,
+    part_number: int,
+    request: Request,
+    x_checksum_sha256: Optional[str] = Header(default=None),
+    session: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_active_principal),
+) -> UploadPartRead:
+    upload = await run_blocking(_get_owned_upload, session, upload_id, current_user)
+    if not 1 <= part_number <= crud.upload.part_count(upload):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Part number out of range")
+
+    if upload.completing_at is not None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Upload is being completed")
+
+    expected_size = crud.upload.expected_part_size(upload, part_number)
+    try:
+        writer = await run_blocking(storage.open_part, upload.id, (part_number - 1) * upload.part_size)
+    except FileNotFoundError as exc:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found") from exc
+    try:
+        try:
+            buffer = bytearray()
+            async for chunk in request.stream():
+                if writer.size + len(buffer) + len(chunk) > expected_size:
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Part is larger than expected")
+                buffer += chunk
+                if len(buffer) >= storage.buffer_size:
+                    await run_blocking(writer.write, bytes(buffer))
+                    buffer.clear()
+            if buffer:
+                await run_blocking(writer.write, bytes(buffer))
+        finally:
+            with anyio.CancelScope(shield=True):
+                size, checksum = await run_blocking(writer.close)
+
+        if size != expected_size:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Part {part_number} must be {expected_size} bytes, received {size}",
+            )
+        if x_checksum_sha256 and x_checksum_sha256.lower() != checksum:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Part checksum mismatch")
+
+        part = await run_blocking(
+            crud.upload.record_part,
+            session,
+            upload,
+            part_number=part_number,
+            size=size,
+            checksum=checksum,
+            ttl=_session_ttl(),
+        )
+    except crud.upload.UploadNotFound as exc:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found") from exc
+    except BaseException:
+        # The rejected bytes overwrote whatever copy of the part was staged before, so the
+        # part is missing again until it is sent successfully.
+        with anyio.CancelScope(shield=True):
+            try:
+                await run_blocking(crud.upload.forget_parts, session, upload, [part_number])
+            except Exception:
+                logger.exception("Failed to forget part %d of upload %s", part_number, upload.id)
+        raise
+    return UploadPartRead(part_number=part.part_number, size=part.size, checksum=part.checksum)
+
+
+@router.post("/{upload_id}/complete", response_model=FileRead, status_code=status.HTTP_201_CREATED)
+def complete_upload(
+    upload_id: str,
+    session: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_active_principal),
+) -> models.FileAsset:
+    upload = _get_owned_upload(session, upload_id, current_user)
+    missing = crud.upload.missing_parts(session, upload)
+    if missing:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail={"missing_parts": missing})
+
+    # Checked again before promoting: the quota left may have shrunk since the upload began.
+    _check_upload_limit(session, upload.member_id, upload.size)
+    if not crud.upload.claim_completion(session, upload):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Upload is already being completed")
+    try:
+        stored = storage.promote_staging(
+            upload.id, upload.original_filename, upload.part_size, crud.upload.part_checksums(session, upload)
+        )
+    except StagingCorrupted as exc:
+        # Rewritten since they were recorded, e.g. by a retry that failed; they are sent again.
+        crud.upload.forget_parts(session, upload, exc.parts)
+        crud.upload.release_completion(session, upload)
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail={"missing_parts": exc.parts}) from exc
+    except FileNotFoundError as exc:
+        # The staged file was removed by an abort or the garbage collector.
+        crud.upload.delete_upload(session, upload)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found") from exc
+    except BaseException:
+        try:
+            crud.upload.release_completion(session, upload)
+        except Exception:
+            logger.exception("Failed to release the completion claim of upload %s", upload.id)
+        raise
+    try:
+        with atomic(session):
+            file_record = crud.file.create_file(
+                session,
+                key=storage.blob_key(stored.checksum) if storage.content_addressed else stored.key,
+                owner_id=upload.owner_id,
+                member_id=upload.member_id,
+                original_filename=upload.original_filename,
+                size=stored.size,
+                checksum=stored.checksum,
+                digests=stored.digests,
+                content_addressed=storage.content_addressed,
+                storage_quota=quotas.member_quota(),
+                total_storage_quota=quotas.total_quota(),
+                **encoding_fields(stored.encoding),
+            )
+            crud.upload.delete_upload(session, upload)
+
+            crud.audit.record(
+                session,
+                actor_id=current_user.id,
+                action="file.uploaded",
+                target_type="file",
+                target_id=file_record.id,
+                details=f"Uploaded file {file_record.original_filename} in parts",
+            )
+            # An existing blob recorded with another encoding is kept.
+            storage.place(stored, keep_existing=encoding_of(file_record) != stored.encoding)
+    except crud.member.StorageQuotaExceeded as exc:
+        _discard_promoted(session, upload, stored)
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exc)) from exc
+    except BaseException:
+        try:
+            _discard_promoted(session, upload, stored)
+        except Exception:
+            logger.exception("Failed to discard upload %s after an error completing it", upload.id)
+        raise
+    return file_record
+
+
+def _discard_promoted(session: Session, upload: models.UploadSession, stored: StoredFile) -> None:
+    # Promotion consumed the staged file, so the session cannot be completed again; drop it
+    # with the promoted object so a retry gets a clean 404 rather than missing content.
+    storage.delete(stored.key)
+    crud.upload.delete_upload(session, upload)
+
+
+@router.delete("/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+def abort_upload(
+    upload_id: str,
+    session: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_active_principal),
+) -> Response:
+    upload = _get_owned_upload(session, upload_id, current_user)
+    storage.discard_staging(upload.id)
+    crud.upload.delete_upload(session, upload)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+def _check_upload_limit(session: Session, member_id: int, size: int) -> None:
+    limit = quotas.upload_limit(session, member_id)
+    if limit.max_bytes is not None and size > limit.max_bytes:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=limit.detail)
+
+
+def _get_owned_upload(session: Session, upload_id: str, user: Principal) -> models.UploadSession:
+    upload = crud.upload.get_upload(session, upload_id)
+    if not upload or upload.owner_id != user.id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+    return upload
+
+
+def _upload_read(session: Session, upload: models.UploadSession) -> UploadSessionRead:
+    received = crud.upload.received_parts(session, upload)
+    received_set = set(received)
+    count = crud.upload.part_count(upload)
+    return UploadSessionRead(
+        id=upload.id,
+        filename=upload.original_filename,
+        size=upload.size,
+        part_size=upload.part_size,
+        part_count=count,
+        received_parts=received,
+        missing_parts=[number for number in range(1, count + 1) if number not in received_set],
+        expires_at=upload.expires_at,
+    )
@@ -4,108 +4,172 @@ from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlmodel import Session
 
 from .. import crud, models
-from ..deps import get_db, require_permissions
-from ..schemas import UserCreate, UserRead, UserUpdate
+from ..core.principals import Principal
+from ..database import atomic
+from ..deps import get_db, get_read_db, require_permissions
+from ..schemas import BulkResult, UserBulkCreate, UserCreate, UserRead, UserRolePatch, UserUpdate
 from ..security import Permission
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 
 @router.get("/", response_model=List[UserRead])
-async def list_users(
+def list_users(
     skip: int = 0,
     limit: int = 100,
-    session: Session = Depends(get_db),
-    _: models.User = Depends(require_permissions(Permission.MANAGE_USERS)),
+    session: Session = Depends(get_read_db),
+    _: Principal = Depends(require_permissions(Permission.MANAGE_USERS)),
 ) -> List[models.User]:
     return list(crud.user.get_users(session, skip=skip, limit=limit))
 
 
 @router.post("/", response_model=UserRead, status_code=status.HTTP_201_CREATED)
-async def create_user(
+def create_user(
     user_in: UserCreate,
     session: Session = Depends(get_db),
-    current_user: models.User = Depends(require_permissions(Permission.MANAGE_USERS)),
+    current_user: Principal = Depends(require_permissions(Permission.MANAGE_USERS)),
 ) -> models.User:
-    try:
-        user = crud.user.create_user(
+    with atomic(session):
+        try:
+            user = crud.user.create_user(
+                session,
+                username=user_in.username,
+                email=user_in.email,
+                password=user_in.password,
+                full_name=user_in.full_name,
+                member_id=user_in.member_id,
+                role_ids=user_in.role_ids,
+            )
+        except ValueError as exc:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+
+        crud.audit.record(
             session,
-            username=user_in.username,
-            email=user_in.email,
-            password=user_in.password,
-            full_name=user_in.full_name,
-            member_id=user_in.member_id,
-            role_ids=user_in.role_ids,
+            actor_id=current_user.id,
+            action="user.created",
+            target_type="user",
+            target_id=user.id,
+            details=f"Created user {user.username}",
         )
-    except ValueError as exc:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
-
-    crud.audit.create_log(
-        session,
-        actor_id=current_user.id,
-        action="user.created",
-        target_type="user",
-        target_id=user.id,
-        details=f"Created user {user.username}",
-    )
     return user
 
 
+@router.post("/bulk", response_model=BulkResult)
+def create_users_bulk(
+    bulk_in: UserBulkCreate,
+    session: Session = Depends(get_db),
+    current_user: Principal = Depends(require_permissions(Permission.MANAGE_USERS)),
+) -> BulkResult:
+    """Create many users in one transaction, reporting the outcome of each item."""
+
+    users = [user_in.dict() for user_in in bulk_in.users]
+    with atomic(session):
+        outcomes = crud.user.create_users(session, users)
+        crud.audit.record_many(
+            session,
+            [
+                dict(
+                    actor_id=current_user.id,
+                    action="user.created",
+                    target_type="user",
+                    target_id=outcome.id,
+                    details=f"Created user {user['username']}",
+                )
+                for user, outcome in zip(users, outcomes)
+                if outcome.ok
+            ],
+        )
+    return BulkResult.from_outcomes(outcomes)
+
+
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_user(
+def delete_user(
     user_id: int,
     session: Session = Depends(get_db),
-    current_user: models.User = Depends(require_permissions(Permission.MANAGE_USERS)),
+    current_user: Principal = Depends(require_permissions(Permission.MANAGE_USERS)),
 ) -> Response:
     db_user = crud.user.get_user(session, user_id)
     if not db_user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
-    session.delete(db_user)
-    session.commit()
-
-    crud.audit.create_log(
-        session,
-        actor_id=current_user.id,
-        action="user.deleted",
-        target_type="user",
-        target_id=user_id,
-        details=f"Deleted user {db_user.username}",
-    )
+    with atomic(session):
+        crud.user.delete_user(session, db_user)
+
+        crud.audit.record(
+            session,
+            actor_id=current_user.id,
+            action="user.deleted",
+            target_type="user",
+            target_id=user_id,
+            details=f"Deleted user {db_user.username}",
+        )
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
 @router.put("/{user_id}", response_model=UserRead)
-async def update_user(
+def update_user(
     user_id: int,
     user_in: UserUpdate,
     session: Session = Depends(get_db),
-    current_user: models.User = Depends(require_permissions(Permission.MANAGE_USERS)),
+    current_user: Principal = Depends(require_permissions(Permission.MANAGE_USERS)),
 ) -> models.User:
     db_user = crud.user.get_user(session, user_id)
     if not db_user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
-    try:
-        user = crud.user.update_user(
+    with atomic(session):
+        try:
+            user = crud.user.update_user(
+                session,
+                db_user,
+                email=user_in.email,
+                full_name=user_in.full_name,
+                is_active=user_in.is_active,
+                password=user_in.password,
+                member_id=user_in.member_id,
+                role_ids=user_in.role_ids,
+            )
+        except ValueError as exc:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+
+        crud.audit.record(
             session,
-            db_user,
-            email=user_in.email,
-            full_name=user_in.full_name,
-            is_active=user_in.is_active,
-            password=user_in.password,
-            member_id=user_in.member_id,
-            role_ids=user_in.role_ids,
+            actor_id=current_user.id,
+            action="user.updated",
+            target_type="user",
+            target_id=user.id,
+            details=f"Updated user {user.username}",
         )
-    except ValueError as exc:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
-
-    crud.audit.create_log(
-        session,
-        actor_id=current_user.id,
-        action="user.updated",
-        target_type="user",
-        target_id=user.id,
-        details=f"Updated user {user.username}",
-    )
     return user
+
+
+@router.patch("/{user_id}/roles", response_model=UserRead)
+def update_user_roles(
+    user_id: int,
+    patch_in: UserRolePatch,
+    session: Session = Depends(get_db),
+    current_user: Principal = Depends(require_permissions(Permission.MANAGE_USERS)),
+) -> models.User:
+    """Assign and unassign individual roles; the user's other roles are left untouched."""
+
+    db_user = crud.user.get_user(session, user_id)
+    if not db_user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+
+    missing = sorted(set(patch_in.add) - crud.role.get_existing_role_ids(session, patch_in.add))
+    if missing:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Roles {missing} not found")
+
+    with atomic(session):
+        changes = crud.user.update_user_roles(session, db_user, add=patch_in.add, remove=patch_in.remove)
+        if changes.changed:
+            crud.audit.record(
+                session,
+                actor_id=current_user.id,
+                action="user.updated",
+                target_type="user",
+                target_id=user_id,
+                details=f"Updated roles of user {db_user.username}: "
+                        f"assigned {changes.added}, unassigned {changes.removed}",
+            )
+    return db_user
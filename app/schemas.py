@@ -1,9 +1,13 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import List, Optional
+from enum import Enum
+from typing import Dict, List, Optional
 
-from pydantic import AnyHttpUrl, BaseModel, EmailStr, Field
+from pydantic import AnyHttpUrl, BaseModel, EmailStr, Field, validator
+
+# Largest number of items accepted by one bulk request.
+BULK_MAX_ITEMS = 1000
 
 
 class Token(BaseModel):
@@ -14,6 +18,15 @@ class Token(BaseModel):
 class TokenPayload(BaseModel):
     sub: str
     exp: int
+    uid: Optional[int] = None
+    mid: Optional[int] = None
+    perm: Optional[int] = None
+    xperm: Optional[List[str]] = None
+    pv: Optional[int] = None
+
+    @property
+    def carries_permissions(self) -> bool:
+        return self.uid is not None and self.pv is not None
 
 
 class PermissionRead(BaseModel):
@@ -37,6 +50,20 @@ class RoleUpdate(BaseModel):
     permissions: Optional[List[str]] = None
 
 
+def _disjoint(cls, remove, values):
+    overlap = set(remove) & set(values.get("add", ()))
+    if overlap:
+        raise ValueError(f"{sorted(overlap)} cannot be both added and removed")
+    return remove
+
+
+class RolePermissionPatch(BaseModel):
+    add: List[str] = Field(default_factory=list)
+    remove: List[str] = Field(default_factory=list)
+
+    _disjoint = validator("remove", allow_reuse=True)(_disjoint)
+
+
 class RoleRead(RoleBase):
     id: int
     permissions: List[PermissionRead] = Field(default_factory=list)
@@ -59,6 +86,10 @@ class MemberCreate(MemberBase):
     pass
 
 
+class MemberBulkCreate(BaseModel):
+    members: List[MemberCreate] = Field(..., min_items=1, max_items=BULK_MAX_ITEMS)
+
+
 class MemberUpdate(BaseModel):
     description: Optional[str] = None
     api_key: Optional[str] = None
@@ -70,6 +101,7 @@ class MemberUpdate(BaseModel):
 
 class MemberRead(MemberBase):
     id: int
+    storage_used: int = 0
 
     class Config:
         orm_mode = True
@@ -89,6 +121,17 @@ class UserCreate(UserBase):
     role_ids: List[int] = Field(default_factory=list)
 
 
+class UserBulkCreate(BaseModel):
+    users: List[UserCreate] = Field(..., min_items=1, max_items=BULK_MAX_ITEMS)
+
+
+class UserRolePatch(BaseModel):
+    add: List[int] = Field(default_factory=list)
+    remove: List[int] = Field(default_factory=list)
+
+    _disjoint = validator("remove", allow_reuse=True)(_disjoint)
+
+
 class UserUpdate(BaseModel):
     email: Optional[EmailStr] = None
     full_name: Optional[str] = None
@@ -103,14 +146,37 @@ class UserRead(UserBase):
     member: Optional[MemberRead] = None
     roles: List[RoleRead] = Field(default_factory=list)
 
+    @validator("roles", pre=True)
+    def roles_from_links(cls, value):
+        # ``User.roles`` holds ``UserRoleLink`` rows; expose the linked roles themselves.
+        return [getattr(item, "role", item) for item in value or []]
+
     class Config:
         orm_mode = True
 
 
+class FileScope(str, Enum):
+    all = "all"
+    owned = "owned"
+    shared = "shared"
+
+
 class FileShareCreate(BaseModel):
     member_ids: List[int]
 
 
+class FileSharePatch(BaseModel):
+    add: List[int] = Field(default_factory=list)
+    remove: List[int] = Field(default_factory=list)
+
+    _disjoint = validator("remove", allow_reuse=True)(_disjoint)
+
+
+class FileBulkShare(BaseModel):
+    file_ids: List[int] = Field(..., min_items=1, max_items=BULK_MAX_ITEMS)
+    member_ids: List[int] = Field(..., min_items=1, max_items=BULK_MAX_ITEMS)
+
+
 class FileShareRead(BaseModel):
     member_id: int
     member: Optional[MemberRead] = None
@@ -130,12 +196,38 @@ class FileRead(BaseModel):
     owner_id: int
     member_id: int
     checksum: Optional[str] = None
+    digests: Optional[Dict[str, str]] = None
+    codec: Optional[str] = None
+    stored_size: Optional[int] = None
     shares: List[FileShareRead] = Field(default_factory=list)
 
     class Config:
         orm_mode = True
 
 
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int = Field(ge=0)
+    part_size: Optional[int] = Field(default=None, gt=0)
+
+
+class UploadSessionRead(BaseModel):
+    id: str
+    filename: str
+    size: int
+    part_size: int
+    part_count: int
+    received_parts: List[int] = Field(default_factory=list)
+    missing_parts: List[int] = Field(default_factory=list)
+    expires_at: datetime
+
+
+class UploadPartRead(BaseModel):
+    part_number: int
+    size: int
+    checksum: str
+
+
 class AuditLogRead(BaseModel):
     id: int
     actor_id: Optional[int]
@@ -149,8 +241,110 @@ class AuditLogRead(BaseModel):
         orm_mode = True
 
 
+class AuditExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
 class SettingsRead(BaseModel):
     app_name: str
     access_token_expire_minutes: int
     upload_dir: str
     cors_origins: List[AnyHttpUrl] = Field(default_factory=list)
+
+
+class ProfileSummary(BaseModel):
+    id: int
+    method: str
+    path: str
+    route: str
+    status_code: int
+    reason: str
+    started_at: datetime
+    duration_ms: float
+    query_count: int
+    query_ms: float
+    sample_count: int
+
+    @classmethod
+    def from_profile(cls, profile) -> "ProfileSummary":
+        return cls(
+            id=profile.id,
+            method=profile.method,
+            path=profile.path,
+            route=profile.route,
+            status_code=profile.status_code,
+            reason=profile.reason,
+            started_at=profile.started_at,
+            duration_ms=profile.duration_ms,
+            query_count=len(profile.queries) + profile.dropped_queries,
+            query_ms=round(profile.query_ms, 3),
+            sample_count=profile.sample_count,
+        )
+
+
+class ProfileQuery(BaseModel):
+    statement: str
+    started_ms: float
+    duration_ms: float
+
+    class Config:
+        orm_mode = True
+
+
+class ProfileFunction(BaseModel):
+    function: str
+    self_samples: int
+    total_samples: int
+
+
+class ProfileRead(ProfileSummary):
+    """A profile with its SQL statements in execution order and its stack samples.
+
+    ``stacks`` uses the collapsed format (``frame;frame;frame count``) that flame graph
+    tools such as flamegraph.pl and speedscope read.
+    """
+
+    sample_interval_ms: float
+    dropped_queries: int
+    queries: List[ProfileQuery]
+    top_functions: List[ProfileFunction]
+    stacks: List[str]
+
+    @classmethod
+    def from_profile(cls, profile) -> "ProfileRead":
+        return cls(
+            **ProfileSummary.from_profile(profile).dict(),
+            sample_interval_ms=profile.sample_interval_ms,
+            dropped_queries=profile.dropped_queries,
+            queries=[ProfileQuery.from_orm(query) for query in profile.queries],
+            top_functions=[
+                ProfileFunction(function=function, self_samples=own, total_samples=total)
+                for function, own, total in profile.top_functions()
+            ],
+            stacks=profile.collapsed_stacks(),
+        )
+
+
+class BulkItemResult(BaseModel):
+    index: int
+    ok: bool
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class BulkResult(BaseModel):
+    """Per-item outcome of a bulk request, in request order."""
+
+    succeeded: int
+    failed: int
+    results: List[BulkItemResult]
+
+    @classmethod
+    def from_outcomes(cls, outcomes) -> "BulkResult":
+        results = [
+            BulkItemResult(index=index, ok=outcome.ok, id=outcome.id, error=outcome.error)
+            for index, outcome in enumerate(outcomes)
+        ]
+        succeeded = sum(result.ok for result in results)
+        return cls(succeeded=succeeded, failed=len(results) - succeeded, results=results)
@@ -1,14 +1,28 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Iterable, Optional
+from typing import Any, Callable, Deque, Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple, TypeVar
 
 from jose import jwt
 from passlib.context import CryptContext
 
 from .config import get_settings
+from .core.metrics import PASSWORD_HASH_SECONDS
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 settings = get_settings()
 
+T = TypeVar("T")
+
+# bcrypt releases the GIL while hashing, so a small dedicated thread pool gives real
+# parallelism without competing with the general worker pool used for database access.
+_hash_executor = ThreadPoolExecutor(max_workers=settings.password_hash_workers, thread_name_prefix="password-hash")
+_hash_slots = threading.BoundedSemaphore(settings.password_hash_workers + settings.password_hash_queue_size)
+
 
 class Permission:
     MANAGE_USERS = "manage:users"
@@ -18,21 +32,122 @@ class Permission:
     MANAGE_FILES = "manage:files"
     VIEW_AUDIT_LOGS = "view:audit_logs"
 
+    # Bit positions used for permission bitmasks in access tokens. Append only: reordering
+    # would change the meaning of tokens that are already issued.
+    BITS = (
+        MANAGE_USERS,
+        MANAGE_ROLES,
+        MANAGE_MEMBERS,
+        MANAGE_SETTINGS,
+        MANAGE_FILES,
+        VIEW_AUDIT_LOGS,
+    )
+
+
+def encode_permissions(permissions: Iterable[str]) -> Tuple[int, List[str]]:
+    """Pack known permissions into a bitmask; unknown ones are returned separately."""
+
+    mask = 0
+    extra = []
+    for permission in set(permissions):
+        if permission in Permission.BITS:
+            mask |= 1 << Permission.BITS.index(permission)
+        else:
+            extra.append(permission)
+    return mask, sorted(extra)
+
+
+def decode_permissions(mask: int, extra: Iterable[str] = ()) -> FrozenSet[str]:
+    known = {permission for bit, permission in enumerate(Permission.BITS) if mask & (1 << bit)}
+    return frozenset(known.union(extra))
+
+
+class PasswordHasherBusy(RuntimeError):
+    """Raised when the password hashing pool and its queue are full."""
+
+
+@dataclass
+class HashTiming:
+    queued_ms: float
+    compute_ms: float
+
+
+def _submit(func: Callable[..., T], *args) -> "Future[Tuple[T, HashTiming]]":
+    if not _hash_slots.acquire(blocking=False):
+        raise PasswordHasherBusy("Too many concurrent password hashing requests")
+
+    submitted = time.perf_counter()
+    operation = func.__name__
+
+    def run() -> Tuple[T, HashTiming]:
+        started = time.perf_counter()
+        result = func(*args)
+        finished = time.perf_counter()
+        PASSWORD_HASH_SECONDS.observe(started - submitted, operation, "queued")
+        PASSWORD_HASH_SECONDS.observe(finished - started, operation, "compute")
+        return result, HashTiming(queued_ms=(started - submitted) * 1000, compute_ms=(finished - started) * 1000)
+
+    try:
+        future = _hash_executor.submit(run)
+    except BaseException:
+        # E.g. the executor was shut down; the slot would otherwise never be returned.
+        _hash_slots.release()
+        raise
+    future.add_done_callback(lambda _: _hash_slots.release())
+    return future
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return _submit(pwd_context.verify, plain_password, hashed_password).result()[0]
 
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return _submit(pwd_context.hash, password).result()[0]
+
+
+def get_password_hashes(passwords: Sequence[str]) -> List[str]:
+    """Hash many passwords in parallel on the hashing pool, preserving order.
+
+    At most ``PASSWORD_HASH_WORKERS`` hashes are in flight at a time, so the queue keeps
+    room for interactive logins while a bulk import runs.
+    """
+
+    hashes: List[str] = [""] * len(passwords)
+    in_flight: Deque[Tuple[int, "Future[Tuple[str, HashTiming]]"]] = deque()
+    for index, password in enumerate(passwords):
+        if len(in_flight) >= settings.password_hash_workers:
+            done, future = in_flight.popleft()
+            hashes[done] = future.result()[0]
+        in_flight.append((index, _submit(pwd_context.hash, password)))
+    for done, future in in_flight:
+        hashes[done] = future.result()[0]
+    return hashes
 
 
-def create_access_token(subject: str, expires_delta: Optional[timedelta] = None) -> str:
+async def verify_password_timed(plain_password: str, hashed_password: str) -> Tuple[bool, HashTiming]:
+    """Verify a password on the hashing pool without blocking the event loop."""
+
+    return await asyncio.wrap_future(_submit(pwd_context.verify, plain_password, hashed_password))
+
+
+def create_access_token(subject: str, expires_delta: Optional[timedelta] = None,
+                        claims: Optional[Dict[str, Any]] = None) -> str:
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=settings.access_token_expire_minutes))
-    payload = {"exp": expire, "sub": str(subject)}
+    payload = {**(claims or {}), "exp": expire, "sub": str(subject)}
     encoded_jwt = jwt.encode(payload, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
 
 def has_permission(user_permissions: Iterable[str], required: str) -> bool:
     return required in set(user_permissions)
+
+
+def permission_claims(user_id: int, member_id: Optional[int], permissions: Iterable[str],
+                      version: int) -> Dict[str, Any]:
+    """Claims that let a token be authorized without a database lookup."""
+
+    mask, extra = encode_permissions(permissions)
+    claims: Dict[str, Any] = {"uid": user_id, "mid": member_id, "perm": mask, "pv": version}
+    if extra:
+        claims["xperm"] = extra
+    return claims
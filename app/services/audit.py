@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from .. import models
+from ..config import get_settings
+from ..core import metrics
+from ..database import get_session
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+AuditEntry = Dict[str, Any]
+
+_STOP = object()
+
+
+class AuditWriter:
+    """Buffers audit entries in memory and bulk-inserts them from a background thread.
+
+    Entries are written in batches of up to ``batch_size`` rows, each batch in one
+    transaction, at least every ``flush_interval`` seconds. When the queue is full the
+    caller waits up to ``enqueue_timeout`` seconds and then writes its entry itself, so
+    a slow database pushes back on request handlers instead of entries being dropped.
+    Entries still queued at shutdown are written by :meth:`stop`.
+    """
+
+    def __init__(self, *, queue_size: int | None = None, batch_size: int | None = None,
+                 flush_interval: float | None = None, enqueue_timeout: float | None = None) -> None:
+        self.batch_size = batch_size or settings.audit_batch_size
+        self.flush_interval = settings.audit_flush_interval_seconds if flush_interval is None else flush_interval
+        self.enqueue_timeout = (
+            settings.audit_enqueue_timeout_seconds if enqueue_timeout is None else enqueue_timeout
+        )
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size or settings.audit_queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        # Guards the counters, which request threads writing directly also update.
+        self._lock = threading.Lock()
+        self.written = 0
+        self.direct_writes = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 30.0) -> None:
+        """Write everything still queued and stop the writer thread."""
+
+        if not self.running:
+            return
+        deadline = time.monotonic() + timeout
+        self._stopping.set()
+        try:
+            # Wakes a writer waiting on an empty queue; with a full one it is busy writing
+            # and sees the flag before taking its next batch.
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(max(0.0, deadline - time.monotonic()))
+        if self._thread.is_alive():
+            logger.error("Audit writer did not finish within %.0fs; %d entries pending", timeout, self.pending)
+        else:
+            # Entries, or the stop marker, that arrived after the writer's last drain.
+            self._drain()
+        self._thread = None
+
+    def submit(self, entry: AuditEntry) -> None:
+        if not self.running:
+            self._write([entry])
+            return
+        try:
+            self._queue.put(entry, timeout=self.enqueue_timeout)
+        except queue.Full:
+            self._count("direct_writes", 1)
+            self._write([entry])
+
+    def submit_many(self, entries: List[AuditEntry]) -> None:
+        """Queue several entries; any that do not fit in time are written as one batch."""
+
+        if not self.running:
+            self._write(entries)
+            return
+        for index, entry in enumerate(entries):
+            try:
+                self._queue.put(entry, timeout=self.enqueue_timeout)
+            except queue.Full:
+                self._count("direct_writes", len(entries) - index)
+                self._write(entries[index:])
+                return
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping and not self._stopping.is_set():
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch: List[AuditEntry] = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(batch)
+        self._drain()
+
+    def _drain(self) -> None:
+        """Write every entry still queued, e.g. those enqueued concurrently with a stop request."""
+
+        remaining = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                remaining.append(item)
+        for start in range(0, len(remaining), self.batch_size):
+            self._write(remaining[start:start + self.batch_size])
+
+    def _write(self, batch: List[AuditEntry], attempts: int = 3) -> None:
+        for attempt in range(1, attempts + 1):
+            try:
+                with get_session() as session:
+                    session.execute(insert(models.AuditLog), batch)
+                    session.commit()
+            except Exception:
+                if attempt == attempts:
+                    self._count("failed", len(batch))
+                    logger.exception("Failed to write %d audit entries: %r", len(batch), batch)
+                    return
+                time.sleep(0.1 * 2 ** attempt)
+            else:
+                self._count("written", len(batch))
+                return
+
+    def _count(self, counter: str, amount: int) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+
+audit_writer = AuditWriter()
+
+
+def _collect_audit_metrics():
+    yield metrics.counter_family(
+        "audit_entries_total", "Audit entries handled by the background writer, by outcome",
+        [
+            ("audit_entries_total", {"outcome": "written"}, audit_writer.written),
+            ("audit_entries_total", {"outcome": "direct"}, audit_writer.direct_writes),
+            ("audit_entries_total", {"outcome": "failed"}, audit_writer.failed),
+        ],
+    )
+    yield metrics.gauge("audit_queue_pending", "Audit entries waiting to be written",
+                        [("audit_queue_pending", {}, audit_writer.pending)])
+
+
+metrics.register_collector(_collect_audit_metrics)
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from .. import crud
+from ..config import get_settings
+from ..core.concurrency import run_blocking
+from ..database import get_session
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+def archive_expired_logs(batch_size: Optional[int] = None, pause_seconds: float = 0.05) -> int:
+    """Move audit entries older than ``AUDIT_RETENTION_DAYS`` into the monthly archives.
+
+    Works in batches of ``batch_size`` rows, one short transaction each, pausing between
+    batches so concurrent audit inserts are not starved of the write lock.
+    """
+
+    if settings.audit_retention_days <= 0:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(days=settings.audit_retention_days)
+    batch_size = batch_size or settings.audit_archive_batch_size
+    moved = 0
+    with get_session() as session:
+        while True:
+            count = crud.audit_archive.archive_batch(session, cutoff, batch_size)
+            moved += count
+            if count < batch_size:
+                return moved
+            time.sleep(pause_seconds)
+
+
+async def run_audit_retention() -> None:
+    while True:
+        try:
+            moved = await run_blocking(archive_expired_logs)
+        except Exception:  # pragma: no cover - keep the loop alive
+            logger.exception("Failed to archive expired audit entries")
+        else:
+            if moved:
+                logger.info("Archived %d audit entries", moved)
+        await asyncio.sleep(settings.audit_archive_interval_seconds)
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlmodel import Session
+
+from .. import crud
+from ..config import get_settings
+
+settings = get_settings()
+
+
+@dataclass
+class UploadLimit:
+    """Most bytes an upload may store right now, and why (``None`` is unlimited)."""
+
+    max_bytes: Optional[int] = None
+    detail: str = ""
+
+    def tighten(self, max_bytes: int, detail: str) -> None:
+        max_bytes = max(max_bytes, 0)
+        if self.max_bytes is None or max_bytes < self.max_bytes:
+            self.max_bytes, self.detail = max_bytes, detail
+
+
+def member_quota() -> Optional[int]:
+    return settings.member_storage_quota_bytes or None
+
+
+def total_quota() -> Optional[int]:
+    return settings.total_storage_quota_bytes or None
+
+
+def upload_limit(session: Session, member_id: int) -> UploadLimit:
+    """Limit for a new upload by ``member_id``: the maximum file size or the quota left.
+
+    The quotas are enforced again when the file is recorded (``crud.file.create_file``),
+    where concurrent uploads are accounted for; this early limit lets an upload that can
+    never fit be rejected before or while it is received.
+    """
+
+    limit = UploadLimit()
+    if settings.upload_max_file_size:
+        limit.tighten(settings.upload_max_file_size,
+                      f"File exceeds the maximum upload size of {settings.upload_max_file_size} bytes")
+    if member_quota() is not None:
+        used = crud.member.get_storage_used(session, member_id)
+        limit.tighten(member_quota() - used,
+                      f"Member storage quota of {member_quota()} bytes exceeded ({used} bytes used)")
+    if total_quota() is not None:
+        limit.tighten(total_quota() - crud.member.get_total_storage_used(session),
+                      f"Portal storage quota of {total_quota()} bytes exceeded")
+    return limit
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from .. import crud
+from ..config import get_settings
+from ..core.concurrency import run_blocking
+from ..database import get_session
+from ..storage import storage
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+def purge_expired_uploads(batch_size: int = 100) -> int:
+    """Delete resumable uploads whose sessions expired, including their staged data."""
+
+    removed = 0
+    with get_session() as session:
+        while True:
+            expired = crud.upload.get_expired_uploads(session, limit=batch_size)
+            if not expired:
+                break
+            for upload in expired:
+                storage.discard_staging(upload.id)
+                crud.upload.delete_upload(session, upload)
+                removed += 1
+    return removed
+
+
+def purge_blob(checksum: str) -> bool:
+    """Remove a content-addressed blob left without references, unless it was acquired again.
+
+    A failure is logged and the blob left to :func:`purge_unreferenced_blobs`.
+    """
+
+    try:
+        with get_session() as session:
+            return crud.blob.purge_blob(session, checksum, storage.delete)
+    except Exception:
+        logger.exception("Failed to purge blob %s", checksum)
+        return False
+
+
+def purge_unreferenced_blobs(batch_size: int = 100) -> int:
+    """Remove blobs whose purge after their last file was deleted did not run or failed."""
+
+    removed = 0
+    with get_session() as session:
+        while True:
+            checksums = crud.blob.get_unreferenced_blobs(session, limit=batch_size)
+            if not checksums:
+                break
+            for checksum in checksums:
+                removed += crud.blob.purge_blob(session, checksum, storage.delete)
+    return removed
+
+
+async def run_upload_gc() -> None:
+    while True:
+        await asyncio.sleep(settings.upload_session_gc_interval_seconds)
+        try:
+            removed = await run_blocking(purge_expired_uploads)
+            blobs = await run_blocking(purge_unreferenced_blobs)
+        except Exception:  # pragma: no cover - keep the loop alive
+            logger.exception("Failed to purge expired uploads or unreferenced blobs")
+            continue
+        if removed:
+            logger.info("Purged %d abandoned uploads", removed)
+        if blobs:
+            logger.info("Purged %d unreferenced blobs", blobs)
@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+from ..config import get_settings
+from .base import StagingCorrupted, StorageBackend, StoredFile
+
+
+def create_storage(backend: str | None = None) -> StorageBackend:
+    """Instantiate the storage backend selected by ``STORAGE_BACKEND``."""
+
+    backend = (backend or get_settings().storage_backend).lower()
+    if backend == "local":
+        from .file_service import FileService
+
+        return FileService()
+    if backend == "s3":
+        from .s3 import S3Backend
+
+        return S3Backend()
+    raise RuntimeError(f"Unknown storage backend {backend!r}")
+
+
+storage = create_storage()
+
+__all__ = ["StagingCorrupted", "StorageBackend", "StoredFile", "create_storage", "storage"]
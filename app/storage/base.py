@@ -0,0 +1,412 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ..config import get_settings
+from ..core.metrics import STORAGE_BYTES, STORAGE_WRITE_SECONDS
+from .codecs import MIN_SAVINGS, Codec, Encoding, get_codec, pack_index
+
+settings = get_settings()
+
+
+@dataclass
+class StoredFile:
+    """Result of persisting an upload: its storage key and what was computed on the way."""
+
+    key: str
+    size: int
+    checksum: str
+    digests: Dict[str, str] = field(default_factory=dict)
+    # Set when the object is stored compressed; size and digests are of the original.
+    encoding: Optional[Encoding] = None
+
+
+@dataclass
+class ObjectStat:
+    key: str
+    size: int
+    modified_at: Optional[datetime] = None
+
+
+def digest_hashers(algorithms: Iterable[str]) -> dict:
+    """hashlib objects for ``algorithms``, by name; sha256 is always included."""
+
+    hashers = {name: hashlib.new(name) for name in algorithms}
+    hashers.setdefault("sha256", hashlib.sha256())
+    return hashers
+
+
+class ObjectWriter(ABC):
+    """Incremental writer that hashes and counts bytes while they are stored.
+
+    Data is hashed in the same pass as it is written, so a stored object never has to be
+    read back to compute its size or checksum.
+    """
+
+    # Writers wrapping another writer leave the storage metrics to it.
+    instrumented = True
+
+    def __init__(self, key: str, algorithms: Iterable[str]) -> None:
+        self.key = key
+        self.size = 0
+        self._opened = time.perf_counter()
+        self._hashers = digest_hashers(algorithms)
+
+    def write(self, chunk: bytes) -> None:
+        self._write(chunk)
+        for hasher in self._hashers.values():
+            hasher.update(chunk)
+        self.size += len(chunk)
+        if self.instrumented:
+            STORAGE_BYTES.inc(len(chunk), "write")
+
+    def commit(self) -> StoredFile:
+        self._finish()
+        if self.instrumented:
+            STORAGE_WRITE_SECONDS.observe(time.perf_counter() - self._opened)
+        digests = {name: hasher.hexdigest() for name, hasher in self._hashers.items()}
+        return StoredFile(key=self.key, size=self.size, checksum=digests["sha256"], digests=digests)
+
+    @abstractmethod
+    def _write(self, chunk: bytes) -> None:
+        ...
+
+    @abstractmethod
+    def _finish(self) -> None:
+        ...
+
+    @abstractmethod
+    def abort(self) -> None:
+        ...
+
+
+class EncodingWriter(ObjectWriter):
+    """Compresses an object frame by frame on its way to ``target``.
+
+    Every ``frame_size`` bytes written become one frame; the frame index is appended on
+    commit (see :mod:`.codecs`). When the first frame does not shrink by ``MIN_SAVINGS``
+    the content is passed through uncompressed. Size and digests are of the original bytes.
+    """
+
+    instrumented = False
+
+    def __init__(self, target: ObjectWriter, codec: Codec, frame_size: int, algorithms: Iterable[str]) -> None:
+        super().__init__(target.key, algorithms)
+        self._target = target
+        self._codec = codec
+        self._encoder = codec.encoder()
+        self._frame_size = frame_size
+        self._buffer = bytearray()
+        self._offsets: List[int] = []
+        self._stored_size = 0
+        self._compressing: Optional[bool] = None
+
+    def _write(self, chunk: bytes) -> None:
+        if self._compressing is False:
+            self._target.write(chunk)
+            return
+        self._buffer += chunk
+        while len(self._buffer) >= self._frame_size:
+            frame = bytes(self._buffer[:self._frame_size])
+            del self._buffer[:self._frame_size]
+            self._write_frame(frame)
+
+    def _write_frame(self, frame: bytes) -> None:
+        compressed = self._encoder.frame(frame)
+        if self._compressing is None:
+            self._compressing = len(compressed) <= len(frame) * (1 - MIN_SAVINGS)
+            if not self._compressing:
+                self._target.write(frame + bytes(self._buffer))
+                self._buffer.clear()
+                return
+            self._emit(self._encoder.start())
+            self._offsets.append(self._target.size)
+        self._emit(compressed)
+        self._offsets.append(self._target.size)
+
+    def _emit(self, data: bytes) -> None:
+        if data:
+            self._target.write(data)
+
+    def _finish(self) -> None:
+        if self._buffer and self._compressing is not False:
+            frame = bytes(self._buffer)
+            self._buffer.clear()
+            self._write_frame(frame)
+        if self._compressing:
+            self._emit(self._encoder.finish())
+            self._stored_size = self._target.size
+            self._target.write(pack_index(self._offsets))
+        self._target.commit()
+
+    def commit(self) -> StoredFile:
+        stored = super().commit()
+        if self._compressing:
+            stored.encoding = Encoding(self._codec.name, self._stored_size, self._frame_size)
+        return stored
+
+    def abort(self) -> None:
+        self._target.abort()
+
+
+class PartWriter:
+    """Writes one part of a staged upload at its offset while hashing it."""
+
+    def __init__(self, path: Path, offset: int) -> None:
+        self.offset = offset
+        self.size = 0
+        self._hasher = hashlib.sha256()
+        self._fd: Optional[int] = os.open(path, os.O_WRONLY)
+
+    def write(self, chunk: bytes) -> None:
+        if self._fd is None:
+            raise RuntimeError("Part writer is closed")
+        view = memoryview(chunk)
+        while view:
+            written = os.pwrite(self._fd, view, self.offset + self.size)
+            self.size += written
+            view = view[written:]
+        self._hasher.update(chunk)
+        STORAGE_BYTES.inc(len(chunk), "write")
+
+    def close(self) -> Tuple[int, str]:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        return self.size, self._hasher.hexdigest()
+
+
+class StagingCorrupted(ValueError):
+    """Parts of a staged upload no longer match the checksums they were received with."""
+
+    def __init__(self, parts: List[int]) -> None:
+        super().__init__(f"Staged parts {parts} do not match their checksums")
+        self.parts = parts
+
+
+class PartVerifier:
+    """Checks the parts of a staged upload against their recorded SHA-256 while it is read in order."""
+
+    def __init__(self, part_size: int, checksums: Dict[int, str]) -> None:
+        self.part_size = part_size
+        self.checksums = checksums
+        self.corrupted: List[int] = []
+        self._number = 1
+        self._remaining = part_size
+        self._hasher = hashlib.sha256()
+
+    def update(self, chunk: bytes) -> None:
+        view = memoryview(chunk)
+        while view:
+            taken = view[:self._remaining]
+            self._hasher.update(taken)
+            self._remaining -= len(taken)
+            view = view[len(taken):]
+            if not self._remaining:
+                self._end_part()
+
+    def _end_part(self) -> None:
+        if self._hasher.hexdigest() != self.checksums.get(self._number):
+            self.corrupted.append(self._number)
+        self._number += 1
+        self._remaining = self.part_size
+        self._hasher = hashlib.sha256()
+
+    def verify(self) -> None:
+        """Raise :class:`StagingCorrupted` if any part read differs from its checksum."""
+
+        if self._remaining != self.part_size:
+            self._end_part()
+        if self.corrupted:
+            raise StagingCorrupted(self.corrupted)
+
+
+class _VerifyingReader:
+    def __init__(self, source: BinaryIO, verifier: PartVerifier) -> None:
+        self._source = source
+        self._verifier = verifier
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._source.read(size)
+        self._verifier.update(chunk)
+        return chunk
+
+
+class StorageBackend(ABC):
+    """Interface every storage backend implements.
+
+    Objects are addressed by relative, ``/``-separated keys laid out with optional
+    hash-prefix fan-out. In content-addressed mode uploads are written under a temporary
+    key and moved to ``blobs/<sha256>``; reference counting is done by ``crud.blob``.
+    Resumable uploads are always staged on local disk so parts can be written at their
+    offsets, then handed to the backend on completion.
+    """
+
+    def __init__(self, *, staging_dir: Path | None = None, buffer_size: int | None = None,
+                 content_addressed: bool | None = None, fanout_levels: int | None = None,
+                 fanout_width: int | None = None, codec: str | None = None, codec_level: int | None = None,
+                 frame_size: int | None = None) -> None:
+        self.staging_dir = staging_dir or settings.upload_dir / ".staging"
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        self.buffer_size = buffer_size or settings.upload_buffer_size
+        self.content_addressed = (
+            settings.content_addressed_storage if content_addressed is None else content_addressed
+        )
+        self.fanout_levels = settings.storage_fanout_levels if fanout_levels is None else fanout_levels
+        self.fanout_width = settings.storage_fanout_width if fanout_width is None else fanout_width
+        self.codec = get_codec(
+            settings.storage_codec if codec is None else codec,
+            settings.storage_codec_level if codec_level is None else codec_level,
+        )
+        self.frame_size = frame_size or settings.storage_codec_frame_size
+
+    # Key layout -----------------------------------------------------------------------
+
+    def key_for(self, filename: str) -> str:
+        """Key of a uniquely named (non content-addressed) object under the current layout."""
+
+        return self._sharded(filename)
+
+    def blob_key(self, checksum: str) -> str:
+        return f"blobs/{self._sharded(checksum)}"
+
+    def _sharded(self, name: str) -> str:
+        # Names start with random or hash hex digits, so prefixes spread objects evenly.
+        parts = [name[level * self.fanout_width:(level + 1) * self.fanout_width] for level in range(self.fanout_levels)]
+        return str(PurePosixPath(*parts, name))
+
+    def _unique_key(self, original_filename: str) -> str:
+        return self.key_for(f"{uuid.uuid4().hex}{PurePosixPath(original_filename).suffix}")
+
+    # Backend primitives ---------------------------------------------------------------
+
+    @abstractmethod
+    def open_object_writer(self, key: str) -> ObjectWriter:
+        ...
+
+    @abstractmethod
+    def get_stream(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """Yield the bytes of ``key`` from ``start`` to ``end`` inclusive (the end if None)."""
+
+    @abstractmethod
+    def move(self, source_key: str, destination_key: str) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def stat(self, key: str) -> Optional[ObjectStat]:
+        ...
+
+    def presign(self, key: str, expires_in: int) -> Optional[str]:
+        """Return a time-limited URL for direct download, if the backend supports it."""
+
+        return None
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """Return a filesystem path for ``key`` when objects live on local disk."""
+
+        return None
+
+    # Uploads --------------------------------------------------------------------------
+
+    def _writer_key(self, original_filename: str) -> str:
+        if self.content_addressed:
+            return f".staging/{uuid.uuid4().hex}.upload"
+        return self._unique_key(original_filename)
+
+    def open_writer(self, original_filename: str) -> ObjectWriter:
+        writer = self.open_object_writer(self._writer_key(original_filename))
+        if self.codec is None:
+            return writer
+        return EncodingWriter(writer, self.codec, self.frame_size, settings.upload_digest_algorithms)
+
+    def place(self, stored: StoredFile, *, keep_existing: bool = False) -> StoredFile:
+        """Move a written object to its final key; a no-op unless content-addressed.
+
+        With ``keep_existing`` the blob already stored for the same content is kept, as it
+        may be encoded differently from the new copy, and the new copy is deleted.
+        """
+
+        if not self.content_addressed:
+            return stored
+        destination = self.blob_key(stored.checksum)
+        if keep_existing:
+            self.delete(stored.key)
+        else:
+            self.move(stored.key, destination)
+        return replace(stored, key=destination)
+
+    def write_stream(self, source: BinaryIO, original_filename: str) -> StoredFile:
+        """Copy ``source`` to storage, computing size and digests in a single pass.
+
+        The returned object has not been :meth:`placed <place>` yet.
+        """
+
+        writer = self.open_writer(original_filename)
+        try:
+            for chunk in iter(lambda: source.read(self.buffer_size), b""):
+                writer.write(chunk)
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.commit()
+
+    def put_stream(self, source: BinaryIO, original_filename: str) -> StoredFile:
+        """Copy ``source`` to storage and place it."""
+
+        return self.place(self.write_stream(source, original_filename))
+
+    # Resumable upload staging ---------------------------------------------------------
+
+    def staging_path(self, upload_id: str) -> Path:
+        return self.staging_dir / f"{upload_id}.part"
+
+    def create_staging(self, upload_id: str, size: int) -> Path:
+        """Preallocate the staged file so parts can be written at their offsets in any order."""
+
+        path = self.staging_path(upload_id)
+        with path.open("wb") as handle:
+            if size:
+                try:
+                    os.posix_fallocate(handle.fileno(), 0, size)
+                except (AttributeError, OSError):
+                    handle.truncate(size)
+        return path
+
+    def open_part(self, upload_id: str, offset: int) -> PartWriter:
+        return PartWriter(self.staging_path(upload_id), offset)
+
+    def promote_staging(self, upload_id: str, original_filename: str, part_size: int,
+                        part_checksums: Dict[int, str]) -> StoredFile:
+        """Store a fully received staged upload, hashing it while it is transferred.
+
+        Every part is checked against ``part_checksums`` in the same pass; on a mismatch
+        :class:`StagingCorrupted` is raised and the staged file is kept so those parts can
+        be sent again. The returned object has not been :meth:`placed <place>` yet.
+        """
+
+        staged = self.staging_path(upload_id)
+        verifier = PartVerifier(part_size, part_checksums)
+        with staged.open("rb") as source:
+            stored = self.write_stream(_VerifyingReader(source, verifier), original_filename)
+        try:
+            verifier.verify()
+        except StagingCorrupted:
+            self.delete(stored.key)
+            raise
+        staged.unlink()
+        return stored
+
+    def discard_staging(self, upload_id: str) -> None:
+        self.staging_path(upload_id).unlink(missing_ok=True)
@@ -0,0 +1,224 @@
+"""Compression codecs for stored files.
+
+An encoded object is a stream in the codec's HTTP content coding, made of independently
+decompressible frames that each hold ``frame_size`` bytes of the original file (the last
+one possibly fewer). It is followed by an index of little-endian 64-bit offsets: where
+the first frame starts and where each frame ends. The stream can be sent as is to clients
+accepting the coding; a byte range of the original is read by decompressing only the
+frames it covers.
+"""
+from __future__ import annotations
+
+import struct
+import zlib
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Callable, Iterator, List, Optional
+
+# The first frame of a file must shrink by this fraction for the file to be stored
+# compressed; already compressed formats are stored as uploaded.
+MIN_SAVINGS = 0.1
+
+_OFFSET_SIZE = 8
+
+# Member header without a file name or modification time, so identical content encodes
+# to identical bytes.
+_GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+
+
+@dataclass(frozen=True)
+class Encoding:
+    """How a stored object is compressed: the codec, the length of its stream and the original bytes per frame."""
+
+    codec: str
+    stored_size: int
+    frame_size: int
+
+
+def encoding_of(record) -> Optional[Encoding]:
+    """The encoding recorded on a ``FileAsset`` or ``StorageBlob``, if it is stored compressed."""
+
+    if not record.codec:
+        return None
+    return Encoding(record.codec, record.stored_size, record.frame_size)
+
+
+def encoding_fields(encoding: Optional[Encoding]) -> dict:
+    """``codec``, ``stored_size`` and ``frame_size`` keyword arguments for ``crud.file.create_file``."""
+
+    if encoding is None:
+        return {}
+    return {"codec": encoding.codec, "stored_size": encoding.stored_size, "frame_size": encoding.frame_size}
+
+
+class FrameEncoder(ABC):
+    """Compresses the frames of one object, in order."""
+
+    def start(self) -> bytes:
+        """Bytes of the stream preceding the first frame."""
+
+        return b""
+
+    @abstractmethod
+    def frame(self, data: bytes) -> bytes:
+        ...
+
+    def finish(self) -> bytes:
+        """Bytes of the stream following the last frame."""
+
+        return b""
+
+
+class Codec(ABC):
+    """Creates frame encoders and decompresses single frames."""
+
+    # Also the HTTP content coding of an encoded object's stream.
+    name: str
+
+    @abstractmethod
+    def encoder(self) -> FrameEncoder:
+        ...
+
+    @abstractmethod
+    def decompress(self, frame: bytes) -> bytes:
+        ...
+
+
+class _GzipEncoder(FrameEncoder):
+    def __init__(self, level: int) -> None:
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self._crc = 0
+        self._size = 0
+
+    def start(self) -> bytes:
+        return _GZIP_HEADER
+
+    def frame(self, data: bytes) -> bytes:
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        # A full flush byte-aligns the output and resets the dictionary, so inflating can
+        # start at any frame.
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FULL_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush() + struct.pack("<II", self._crc, self._size & 0xFFFFFFFF)
+
+
+class GzipCodec(Codec):
+    """A single gzip member whose deflate stream is fully flushed after every frame.
+
+    Clients decoding ``Content-Encoding: gzip`` do not all accept concatenated members, so
+    frames are flush points within one member rather than members of their own.
+    """
+
+    name = "gzip"
+
+    def __init__(self, level: Optional[int] = None) -> None:
+        self.level = 6 if level is None else level
+
+    def encoder(self) -> FrameEncoder:
+        return _GzipEncoder(self.level)
+
+    def decompress(self, frame: bytes) -> bytes:
+        return zlib.decompressobj(-zlib.MAX_WBITS).decompress(frame)
+
+
+class _ZstdEncoder(FrameEncoder):
+    def __init__(self, compressor) -> None:
+        self._compressor = compressor
+
+    def frame(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+
+class ZstdCodec(Codec):
+    """Each frame is a zstd frame; consecutive frames are a valid zstd stream. Requires ``zstandard``."""
+
+    name = "zstd"
+
+    def __init__(self, level: Optional[int] = None) -> None:
+        try:
+            import zstandard
+        except ImportError as exc:  # pragma: no cover - depends on the environment
+            raise RuntimeError("The zstd storage codec requires zstandard (pip install zstandard)") from exc
+        self._zstandard = zstandard
+        self.level = 3 if level is None else level
+
+    # Compressor and decompressor objects are not thread-safe, so none is shared.
+    def encoder(self) -> FrameEncoder:
+        return _ZstdEncoder(self._zstandard.ZstdCompressor(level=self.level))
+
+    def decompress(self, frame: bytes) -> bytes:
+        return self._zstandard.ZstdDecompressor().decompress(frame)
+
+
+CODECS = {"gzip": GzipCodec, "zstd": ZstdCodec}
+
+
+def get_codec(name: Optional[str], level: Optional[int] = None) -> Optional[Codec]:
+    """Instantiate the codec called ``name``; ``None`` for ``'none'`` or no name."""
+
+    name = (name or "none").lower()
+    if name == "none":
+        return None
+    if name not in CODECS:
+        raise RuntimeError(f"Unknown storage codec {name!r}")
+    return CODECS[name](level)
+
+
+def frame_count(size: int, frame_size: int) -> int:
+    return -(-size // frame_size)
+
+
+def pack_index(offsets: List[int]) -> bytes:
+    return struct.pack(f"<{len(offsets)}Q", *offsets)
+
+
+class FrameReader:
+    """Reads byte ranges of the original content of an encoded object.
+
+    ``read`` is the backend's ranged read, ``StorageBackend.get_stream``. The frame index
+    is loaded on first use and kept, so several ranges of one response share it.
+    """
+
+    def __init__(self, read: Callable[..., Iterator[bytes]], key: str, encoding: Encoding, size: int) -> None:
+        self._read = read
+        self.key = key
+        self.encoding = encoding
+        self.size = size
+        self.codec = get_codec(encoding.codec)
+        self._offsets: Optional[List[int]] = None
+
+    def offsets(self) -> List[int]:
+        if self._offsets is None:
+            count = frame_count(self.size, self.encoding.frame_size) + 1
+            start = self.encoding.stored_size
+            data = b"".join(self._read(self.key, start, start + count * _OFFSET_SIZE - 1))
+            self._offsets = list(struct.unpack(f"<{count}Q", data))
+        return self._offsets
+
+    def encoded(self) -> Iterator[bytes]:
+        """The stream as stored: the whole file in the codec's content coding."""
+
+        return self._read(self.key, 0, self.encoding.stored_size - 1)
+
+    def read(self, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """Yield original bytes ``start`` to ``end`` inclusive, decompressing frame by frame."""
+
+        end = self.size - 1 if end is None else end
+        if end < start:
+            return
+        frame_size = self.encoding.frame_size
+        offsets = self.offsets()
+        first, last = start // frame_size, end // frame_size
+        frame = first
+        buffer = bytearray()
+        for chunk in self._read(self.key, offsets[first], offsets[last + 1] - 1):
+            buffer += chunk
+            while frame <= last and len(buffer) >= offsets[frame + 1] - offsets[frame]:
+                length = offsets[frame + 1] - offsets[frame]
+                data = self.codec.decompress(bytes(buffer[:length]))
+                del buffer[:length]
+                base = frame * frame_size
+                yield data[max(start - base, 0):end - base + 1]
+                frame += 1
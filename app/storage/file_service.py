@@ -1,34 +1,113 @@
 from __future__ import annotations
 
-import shutil
-import uuid
+import os
+from datetime import datetime
 from pathlib import Path
-from typing import BinaryIO
+from typing import Dict, Iterable, Iterator, Optional
 
 from ..config import get_settings
+from .base import ObjectStat, ObjectWriter, PartVerifier, StorageBackend, StoredFile, digest_hashers
 
 settings = get_settings()
 
 
-class FileService:
-    """Utility class to manage file persistence on disk."""
+class UploadWriter(ObjectWriter):
+    """Writes an object to a local file."""
 
-    def __init__(self, base_dir: Path | None = None) -> None:
+    def __init__(self, key: str, destination: Path, algorithms: Iterable[str]) -> None:
+        super().__init__(key, algorithms)
+        self.destination = destination
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        self._handle = destination.open("wb")
+
+    def _write(self, chunk: bytes) -> None:
+        if self._handle.closed:
+            raise RuntimeError("Upload writer is closed")
+        self._handle.write(chunk)
+
+    def _finish(self) -> None:
+        self._handle.close()
+
+    def abort(self) -> None:
+        self._handle.close()
+        self.destination.unlink(missing_ok=True)
+
+
+class FileService(StorageBackend):
+    """Storage backend keeping objects on the local filesystem under ``base_dir``."""
+
+    def __init__(self, base_dir: Path | None = None, **options) -> None:
         self.base_dir = base_dir or settings.upload_dir
         self.base_dir.mkdir(parents=True, exist_ok=True)
+        options.setdefault("staging_dir", self.base_dir / ".staging")
+        super().__init__(**options)
+
+    def resolve(self, key: str) -> Path:
+        # Rows written before storage keys were introduced hold absolute paths.
+        path = Path(key)
+        return path if path.is_absolute() else self.base_dir / key
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return self.resolve(key)
+
+    def open_object_writer(self, key: str) -> ObjectWriter:
+        return UploadWriter(key, self.resolve(key), settings.upload_digest_algorithms)
+
+    def get_stream(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        with self.resolve(key).open("rb") as handle:
+            handle.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = handle.read(self.buffer_size if remaining is None else min(self.buffer_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def move(self, source_key: str, destination_key: str) -> None:
+        # Replacing an existing blob is safe because it holds the same bytes, and it leaves
+        # the blob in place even if a concurrent delete just unlinked the old copy.
+        destination = self.resolve(destination_key)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(self.resolve(source_key), destination)
+
+    def delete(self, key: str) -> None:
+        self.resolve(key).unlink(missing_ok=True)
+
+    def stat(self, key: str) -> Optional[ObjectStat]:
+        try:
+            result = self.resolve(key).stat()
+        except FileNotFoundError:
+            return None
+        return ObjectStat(key=key, size=result.st_size, modified_at=datetime.utcfromtimestamp(result.st_mtime))
+
+    def promote_staging(self, upload_id: str, original_filename: str, part_size: int,
+                        part_checksums: Dict[int, str]) -> StoredFile:
+        """Move a fully received staged file into storage without copying its content.
+
+        Parts may arrive in any order, so the whole-file digests still need one sequential
+        read of the staged file, which also checks every part against its checksum; the data
+        itself is renamed, never rewritten, unless it is to be stored compressed. The
+        returned object has not been placed yet.
+        """
 
-    def save(self, source: BinaryIO, original_filename: str) -> Path:
-        extension = Path(original_filename).suffix
-        filename = f"{uuid.uuid4().hex}{extension}"
-        destination = self.base_dir / filename
-        with destination.open("wb") as out_file:
-            shutil.copyfileobj(source, out_file)
-        return destination
-
-    def remove(self, path: str) -> None:
-        file_path = Path(path)
-        if file_path.exists():
-            file_path.unlink()
-
-    def open(self, path: str) -> BinaryIO:
-        return open(path, "rb")
+        if self.codec is not None:
+            return super().promote_staging(upload_id, original_filename, part_size, part_checksums)
+        staged = self.staging_path(upload_id)
+        hashers = digest_hashers(settings.upload_digest_algorithms)
+        verifier = PartVerifier(part_size, part_checksums)
+        size = 0
+        with staged.open("rb") as handle:
+            for chunk in iter(lambda: handle.read(self.buffer_size), b""):
+                for hasher in hashers.values():
+                    hasher.update(chunk)
+                verifier.update(chunk)
+                size += len(chunk)
+        verifier.verify()
+        digests = {name: hasher.hexdigest() for name, hasher in hashers.items()}
+        key = self._writer_key(original_filename)
+        destination = self.resolve(key)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(staged, destination)
+        return StoredFile(key=key, size=size, checksum=digests["sha256"], digests=digests)
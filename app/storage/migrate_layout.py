@@ -0,0 +1,98 @@
+"""Relocate stored files to the directory layout configured in the current settings.
+
+Run after changing ``STORAGE_FANOUT_LEVELS`` or ``STORAGE_FANOUT_WIDTH``::
+
+    python -m app.storage.migrate_layout [--dry-run] [--batch-size 500]
+
+Objects are moved with the backend's ``move`` (a rename on local disk, a server-side
+copy on S3) and ``FileAsset.path`` / ``StorageBlob.path`` are rewritten to the new keys
+batch by batch, so the command can be interrupted and re-run safely. Rows still holding
+absolute paths from before storage keys were introduced are converted as well.
+"""
+from __future__ import annotations
+
+import argparse
+
+from sqlmodel import Session, select, update
+
+from .. import models
+from ..database import get_session, init_db
+from . import storage
+from .base import StorageBackend
+
+
+def _move(service: StorageBackend, source: str, destination: str, dry_run: bool) -> bool:
+    if source == destination:
+        return False
+    if not dry_run and service.stat(source) is not None:
+        service.move(source, destination)
+    return True
+
+
+def migrate_blobs(session: Session, service: StorageBackend, batch_size: int, dry_run: bool) -> int:
+    moved = 0
+    last_checksum = ""
+    while True:
+        blobs = session.exec(
+            select(models.StorageBlob)
+            .where(models.StorageBlob.checksum > last_checksum)
+            .order_by(models.StorageBlob.checksum)
+            .limit(batch_size)
+        ).all()
+        if not blobs:
+            return moved
+        for blob in blobs:
+            destination = service.blob_key(blob.checksum)
+            if _move(service, blob.path, destination, dry_run):
+                moved += 1
+                blob.path = destination
+                session.add(blob)
+                session.exec(
+                    update(models.FileAsset)
+                    .where(models.FileAsset.blob_checksum == blob.checksum)
+                    .values(path=destination)
+                )
+        last_checksum = blobs[-1].checksum
+        if not dry_run:
+            session.commit()
+
+
+def migrate_files(session: Session, service: StorageBackend, batch_size: int, dry_run: bool) -> int:
+    moved = 0
+    last_id = 0
+    while True:
+        files = session.exec(
+            select(models.FileAsset)
+            .where(models.FileAsset.id > last_id, models.FileAsset.blob_checksum.is_(None))
+            .order_by(models.FileAsset.id)
+            .limit(batch_size)
+        ).all()
+        if not files:
+            return moved
+        for file in files:
+            destination = service.key_for(file.filename)
+            if _move(service, file.path, destination, dry_run):
+                moved += 1
+                file.path = destination
+                session.add(file)
+        last_id = files[-1].id
+        if not dry_run:
+            session.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="Report how many files would move")
+    args = parser.parse_args()
+
+    init_db()
+    with get_session() as session:
+        blobs = migrate_blobs(session, storage, args.batch_size, args.dry_run)
+        files = migrate_files(session, storage, args.batch_size, args.dry_run)
+    action = "Would move" if args.dry_run else "Moved"
+    print(f"{action} {blobs} blobs and {files} files")
+
+
+if __name__ == "__main__":
+    main()
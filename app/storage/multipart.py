@@ -0,0 +1,160 @@
+"""Streaming ``multipart/form-data`` upload straight into storage.
+
+Starlette parses a form completely, spooling every file to a temporary file, before a
+handler sees it. :func:`receive_file` instead parses the request body as it arrives and
+writes the file part to a storage writer chunk by chunk, so an upload over its size
+limit is rejected as soon as the limit is crossed and nothing is stored twice.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import anyio
+from multipart.exceptions import FormParserError
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import Request
+
+from ..core.concurrency import run_blocking
+from .base import ObjectWriter, StorageBackend, StoredFile
+
+# Bytes of multipart framing (boundaries and part headers) tolerated on top of the file
+# size when judging an upload by its Content-Length.
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds the byte limit it was received under."""
+
+    def __init__(self, detail: str) -> None:
+        super().__init__(detail)
+        self.detail = detail
+
+
+class MalformedUpload(ValueError):
+    """Raised for a body that is not a multipart form containing the expected file."""
+
+
+@dataclass
+class ReceivedFile:
+    filename: str
+    stored: StoredFile
+
+
+def check_content_length(request: Request, limit: Optional[int], detail: str) -> None:
+    """Reject a request whose declared length cannot fit ``limit`` before reading its body."""
+
+    content_length = request.headers.get("content-length")
+    if limit is not None and content_length and content_length.isdigit():
+        if int(content_length) > limit + MULTIPART_OVERHEAD:
+            raise UploadTooLarge(detail)
+
+
+class _Events:
+    """Collects parser callbacks; the data they carry is written asynchronously after each chunk."""
+
+    def __init__(self) -> None:
+        self.pending: List[Tuple[str, object]] = []
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": lambda: self.pending.append(("end", None)),
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+    def on_part_begin(self) -> None:
+        self._disposition = b""
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        self.pending.append(("data", data[start:end]))
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._disposition)
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        self.pending.append(("part", (name, None if filename is None else filename.decode("utf-8", "replace"))))
+
+
+def _parse(step, *args) -> None:
+    try:
+        step(*args)
+    except FormParserError as exc:
+        raise MalformedUpload(f"Malformed multipart body: {exc}") from exc
+
+
+async def receive_file(request: Request, storage: StorageBackend, field_name: str, *,
+                       limit: Optional[int] = None, limit_detail: str = "") -> ReceivedFile:
+    """Store the file sent in form field ``field_name`` of a multipart request.
+
+    Stops reading and discards what was written with :class:`UploadTooLarge` once the file
+    exceeds ``limit`` bytes, or with :class:`MalformedUpload` as soon as the body cannot be
+    parsed or the file part turns out to have no file name. The returned object has not been :meth:`placed
+    <StorageBackend.place>` yet, so the caller can still discard it with ``delete``.
+    """
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+        raise MalformedUpload("Expected a multipart/form-data body")
+
+    events = _Events()
+    parser = MultipartParser(params[b"boundary"], events.callbacks())
+    writer: Optional[ObjectWriter] = None
+    filename: Optional[str] = None
+    receiving = finished = False
+    received = 0
+    buffer = bytearray()
+    try:
+        async for chunk in request.stream():
+            _parse(parser.write, chunk)
+            for kind, value in events.pending:
+                if kind == "part":
+                    name, part_filename = value
+                    receiving = not finished and name == field_name and part_filename is not None
+                    if receiving:
+                        if not part_filename:
+                            raise MalformedUpload("Filename is required")
+                        filename = part_filename
+                        writer = await run_blocking(storage.open_writer, filename)
+                elif kind == "data" and receiving:
+                    received += len(value)
+                    if limit is not None and received > limit:
+                        raise UploadTooLarge(limit_detail)
+                    buffer += value
+                    if len(buffer) >= storage.buffer_size:
+                        await run_blocking(writer.write, bytes(buffer))
+                        buffer.clear()
+                elif kind == "end" and receiving:
+                    receiving, finished = False, True
+            events.pending.clear()
+        _parse(parser.finalize)
+        if writer is None or not finished:
+            raise MalformedUpload(f"Form field {field_name!r} with a file is required")
+        if buffer:
+            await run_blocking(writer.write, bytes(buffer))
+        stored = await run_blocking(writer.commit)
+    except BaseException:
+        if writer is not None:
+            # Shielded, so a disconnect or cancellation still removes the partial object.
+            with anyio.CancelScope(shield=True):
+                await run_blocking(writer.abort)
+        raise
+    return ReceivedFile(filename=filename, stored=stored)
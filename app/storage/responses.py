@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import uuid
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Callable, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi import Request, status
+from fastapi.responses import FileResponse, RedirectResponse, Response, StreamingResponse
+
+from ..config import get_settings
+from ..core.metrics import STORAGE_BYTES
+from .base import StorageBackend
+from .codecs import Encoding, FrameReader
+
+settings = get_settings()
+
+MAX_RANGES = 64
+
+ByteRange = Tuple[int, int]
+
+
+class RangeNotSatisfiable(ValueError):
+    """Raised when none of the requested byte ranges overlap the representation."""
+
+
+def parse_range_header(value: str, size: int) -> List[ByteRange]:
+    """Parse a ``Range`` header into sorted, coalesced inclusive ``(start, end)`` pairs.
+
+    Returns an empty list when the header is malformed or uses another unit, in which case
+    the caller should ignore it and send the full representation.
+    """
+
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return []
+
+    ranges: List[ByteRange] = []
+    for part in spec.split(","):
+        start_text, sep, end_text = part.strip().partition("-")
+        if not sep:
+            return []
+        try:
+            if start_text:
+                start = int(start_text)
+                end = int(end_text) if end_text else max(start, size - 1)
+            else:
+                suffix = int(end_text)
+                if suffix == 0:
+                    continue
+                start, end = max(size - suffix, 0), size - 1
+        except ValueError:
+            return []
+        if start < 0 or end < start:
+            return []
+        if start < size:
+            ranges.append((start, min(end, size - 1)))
+
+    if not ranges:
+        raise RangeNotSatisfiable(value)
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    if len(merged) > MAX_RANGES:
+        return []
+    return merged
+
+
+def _content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def _opaque_tag(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def _etag_matches(header: str, etag: str, *, weak: bool) -> bool:
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    if "*" in candidates:
+        return True
+    if weak:
+        return any(_opaque_tag(candidate) == _opaque_tag(etag) for candidate in candidates)
+    return etag in candidates
+
+
+def _parse_http_date(value: str) -> Optional[datetime]:
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _accepts_encoding(request: Request, coding: str) -> bool:
+    header = request.headers.get("accept-encoding")
+    if not header:
+        return False
+    qualities = {}
+    for item in header.split(","):
+        token, _, params = item.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[token.strip().lower()] = quality
+    return qualities.get(coding, qualities.get("*", 0.0)) > 0
+
+
+def _encoded_etag(etag: str, coding: str) -> str:
+    # Each content coding of a representation needs its own strong validator.
+    return f'{etag[:-1]}-{coding}"' if etag.endswith('"') else etag
+
+
+def _not_modified(request: Request, etag: Optional[str], last_modified: datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag is not None and _etag_matches(if_none_match, etag, weak=True)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        since = _parse_http_date(if_modified_since)
+        return since is not None and last_modified <= since
+    return False
+
+
+def _range_applies(request: Request, etag: Optional[str], last_modified: datetime) -> bool:
+    if_range = request.headers.get("if-range")
+    if if_range is None:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return etag is not None and _etag_matches(if_range, etag, weak=False)
+    since = _parse_http_date(if_range)
+    return since is not None and last_modified <= since
+
+
+def build_download_response(request: Request, *, storage: StorageBackend, key: str, size: int,
+                            filename: str, last_modified: datetime, etag: Optional[str] = None,
+                            media_type: str = "application/octet-stream",
+                            encoding: Optional[Encoding] = None) -> Response:
+    """Serve a stored object honouring conditional and ``Range`` requests.
+
+    With ``STORAGE_PRESIGNED_DOWNLOADS`` enabled, backends that can presign URLs redirect
+    the client to the object store. Full-body responses of local objects go through
+    ``FileResponse`` so servers supporting the ASGI path-send extension can use sendfile;
+    other backends stream the object, using ranged reads for partial content.
+
+    Objects stored compressed (``encoding``) are sent as stored, with ``Content-Encoding``,
+    to clients accepting the codec's coding that ask for the whole file. Otherwise they
+    are decompressed while streaming; ranges refer to the original bytes and only the
+    frames they cover are read.
+    """
+
+    last_modified = last_modified.replace(microsecond=0)
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+
+    headers = {"Accept-Ranges": "bytes", "Last-Modified": format_datetime(last_modified, usegmt=True)}
+    send_encoded = (
+        encoding is not None and "range" not in request.headers and _accepts_encoding(request, encoding.codec)
+    )
+    if encoding is not None:
+        headers["Vary"] = "Accept-Encoding"
+    if etag is not None:
+        headers["ETag"] = _encoded_etag(etag, encoding.codec) if send_encoded else etag
+
+    if _not_modified(request, headers.get("ETag"), last_modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if settings.storage_presigned_downloads and encoding is None:
+        url = storage.presign(key, settings.presign_expires_seconds)
+        if url is not None:
+            return RedirectResponse(url, status_code=status.HTTP_307_TEMPORARY_REDIRECT)
+
+    reader = FrameReader(storage.get_stream, key, encoding, size) if encoding is not None else None
+
+    def read(start: int, end: int) -> Iterator[bytes]:
+        if reader is not None:
+            return reader.read(start, end)
+        return storage.get_stream(key, start, end)
+
+    range_header = request.headers.get("range")
+    if range_header and request.method == "GET" and _range_applies(request, etag, last_modified):
+        try:
+            ranges = parse_range_header(range_header, size)
+        except RangeNotSatisfiable:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, headers=headers)
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(end - start + 1)
+            STORAGE_BYTES.inc(end - start + 1, "read")
+            return StreamingResponse(
+                read(start, end),
+                status_code=status.HTTP_206_PARTIAL_CONTENT,
+                media_type=media_type,
+                headers=headers,
+            )
+        if ranges:
+            return _multipart_response(read, size, ranges, media_type, headers)
+
+    if send_encoded:
+        headers["Content-Encoding"] = encoding.codec
+        headers["Content-Length"] = str(encoding.stored_size)
+        headers["Content-Disposition"] = _content_disposition(filename)
+        STORAGE_BYTES.inc(encoding.stored_size, "read")
+        return StreamingResponse(reader.encoded(), media_type=media_type, headers=headers)
+
+    STORAGE_BYTES.inc(size, "read")
+    path = storage.local_path(key) if reader is None else None
+    if path is not None:
+        return FileResponse(path, media_type=media_type, filename=filename, headers=headers)
+    headers["Content-Length"] = str(size)
+    headers["Content-Disposition"] = _content_disposition(filename)
+    body = reader.read() if reader is not None else storage.get_stream(key)
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+
+def _multipart_response(read: Callable[[int, int], Iterator[bytes]], size: int, ranges: List[ByteRange],
+                        media_type: str, headers: dict) -> StreamingResponse:
+    boundary = uuid.uuid4().hex
+    part_headers = [
+        (
+            f"--{boundary}\r\nContent-Type: {media_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode("latin-1")
+        for start, end in ranges
+    ]
+    closing = f"--{boundary}--\r\n".encode("latin-1")
+    content_length = sum(len(head) + (end - start + 1) + 2 for head, (start, end) in zip(part_headers, ranges))
+    headers["Content-Length"] = str(content_length + len(closing))
+    STORAGE_BYTES.inc(sum(end - start + 1 for start, end in ranges), "read")
+
+    def body() -> Iterator[bytes]:
+        for head, (start, end) in zip(part_headers, ranges):
+            yield head
+            yield from read(start, end)
+            yield b"\r\n"
+        yield closing
+
+    return StreamingResponse(
+        body(),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers,
+    )
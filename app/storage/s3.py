@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+from pathlib import PurePosixPath
+from typing import Any, Iterable, Iterator, List, Optional
+
+from ..config import get_settings
+from .base import ObjectStat, ObjectWriter, StorageBackend
+
+settings = get_settings()
+
+# S3 rejects multipart parts smaller than 5 MiB (except the last one).
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class S3Writer(ObjectWriter):
+    """Streams an object to S3, switching to a multipart upload once a part fills up.
+
+    At most one part is buffered in memory at a time.
+    """
+
+    def __init__(self, backend: "S3Backend", key: str, algorithms: Iterable[str]) -> None:
+        super().__init__(key, algorithms)
+        self._backend = backend
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts: List[dict] = []
+
+    def _write(self, chunk: bytes) -> None:
+        self._buffer += chunk
+        if len(self._buffer) >= self._backend.part_size:
+            self._flush_part()
+
+    def _flush_part(self) -> None:
+        client, bucket, object_key = self._backend.client, self._backend.bucket, self._backend.object_key(self.key)
+        if self._upload_id is None:
+            self._upload_id = client.create_multipart_upload(Bucket=bucket, Key=object_key)["UploadId"]
+        number = len(self._parts) + 1
+        response = client.upload_part(
+            Bucket=bucket,
+            Key=object_key,
+            UploadId=self._upload_id,
+            PartNumber=number,
+            Body=bytes(self._buffer),
+        )
+        self._parts.append({"PartNumber": number, "ETag": response["ETag"]})
+        self._buffer.clear()
+
+    def _finish(self) -> None:
+        client, bucket, object_key = self._backend.client, self._backend.bucket, self._backend.object_key(self.key)
+        if self._upload_id is None:
+            client.put_object(Bucket=bucket, Key=object_key, Body=bytes(self._buffer))
+            self._buffer.clear()
+            return
+        if self._buffer:
+            self._flush_part()
+        client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=object_key,
+            UploadId=self._upload_id,
+            MultipartUpload={"Parts": self._parts},
+        )
+
+    def abort(self) -> None:
+        self._buffer.clear()
+        if self._upload_id is not None:
+            self._backend.client.abort_multipart_upload(
+                Bucket=self._backend.bucket,
+                Key=self._backend.object_key(self.key),
+                UploadId=self._upload_id,
+            )
+            self._upload_id = None
+
+
+class S3Backend(StorageBackend):
+    """Storage backend for S3-compatible object stores (AWS S3, MinIO, Ceph RGW, ...).
+
+    Requires ``boto3``. Uploads and downloads are streamed; ranges map to ranged GETs and
+    content-addressed moves are server-side copies.
+    """
+
+    def __init__(self, bucket: str | None = None, *, prefix: str | None = None, client: Any = None,
+                 part_size: int | None = None, **options) -> None:
+        super().__init__(**options)
+        self.bucket = bucket or settings.s3_bucket
+        if not self.bucket:
+            raise RuntimeError("S3_BUCKET must be set to use the s3 storage backend")
+        self.prefix = (settings.s3_prefix if prefix is None else prefix).strip("/")
+        self.part_size = max(part_size or settings.s3_part_size, MIN_PART_SIZE)
+        self.client = client or self._create_client()
+
+    @staticmethod
+    def _create_client() -> Any:
+        try:
+            import boto3
+        except ImportError as exc:  # pragma: no cover - depends on the environment
+            raise RuntimeError("The s3 storage backend requires boto3 (pip install boto3)") from exc
+        return boto3.client(
+            "s3",
+            endpoint_url=settings.s3_endpoint_url,
+            region_name=settings.s3_region,
+            aws_access_key_id=settings.s3_access_key_id,
+            aws_secret_access_key=settings.s3_secret_access_key,
+        )
+
+    def object_key(self, key: str) -> str:
+        return str(PurePosixPath(self.prefix, key)) if self.prefix else key
+
+    def open_object_writer(self, key: str) -> ObjectWriter:
+        return S3Writer(self, key, settings.upload_digest_algorithms)
+
+    def get_stream(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        request = {"Bucket": self.bucket, "Key": self.object_key(key)}
+        if start or end is not None:
+            request["Range"] = f"bytes={start}-{'' if end is None else end}"
+        body = self.client.get_object(**request)["Body"]
+        try:
+            yield from body.iter_chunks(chunk_size=self.buffer_size)
+        finally:
+            body.close()
+
+    def move(self, source_key: str, destination_key: str) -> None:
+        source = {"Bucket": self.bucket, "Key": self.object_key(source_key)}
+        # Managed copy switches to multipart server-side copy for objects above 5 GiB.
+        self.client.copy(source, self.bucket, self.object_key(destination_key))
+        self.delete(source_key)
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+
+    def stat(self, key: str) -> Optional[ObjectStat]:
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+        except self.client.exceptions.ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return ObjectStat(key=key, size=response["ContentLength"], modified_at=response.get("LastModified"))
+
+    def presign(self, key: str, expires_in: int) -> Optional[str]:
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self.object_key(key)},
+            ExpiresIn=expires_in,
+        )
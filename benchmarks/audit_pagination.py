@@ -0,0 +1,103 @@
+"""Benchmark: audit log page latency by depth, keyset cursor versus OFFSET.
+
+Seeds ``--rows`` audit entries into a throw-away SQLite database (or ``--database-url``),
+then times fetching one page at increasing depths with ``crud.audit.list_logs`` (cursor)
+and with the equivalent ``OFFSET`` query. Cursor latency should stay flat while OFFSET
+grows with depth.
+
+Usage::
+
+    python -m benchmarks.audit_pagination --rows 1000000 --page-size 100
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List
+
+ACTIONS = ("file.uploaded", "file.shared", "file.deleted", "user.created", "user.updated", "role.updated")
+
+
+def seed(session, models, rows: int, batch_size: int = 10_000) -> None:
+    from sqlalchemy import insert
+
+    started = datetime.utcnow() - timedelta(seconds=rows)
+    for offset in range(0, rows, batch_size):
+        session.execute(
+            insert(models.AuditLog),
+            [
+                {
+                    "actor_id": random.randint(1, 50),
+                    "action": random.choice(ACTIONS),
+                    "target_type": "file",
+                    "target_id": random.randint(1, 10_000),
+                    "details": None,
+                    "created_at": started + timedelta(seconds=index),
+                }
+                for index in range(offset, min(offset + batch_size, rows))
+            ],
+        )
+        session.commit()
+
+
+def median_ms(call: Callable[[], object], repeat: int) -> float:
+    samples: List[float] = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - began) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--database-url", default=None, help="Use an existing (empty) database instead of SQLite")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="audit-pagination-"))
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{workdir / 'bench.db'}"
+    os.environ.setdefault("UPLOAD_DIR", str(workdir / "files"))
+
+    # Settings are read at import time, so the app is imported once the environment is set.
+    from sqlmodel import select
+
+    from app import crud, models
+    from app.core.pagination import encode_cursor
+    from app.database import get_session, init_db
+
+    init_db()
+    results: Dict[int, Dict[str, float]] = {}
+    with get_session() as session:
+        seed(session, models, args.rows)
+        log = models.AuditLog
+        ordered = select(log).order_by(log.created_at.desc(), log.id.desc())
+        depths = [depth for depth in (0, 1_000, 10_000, 100_000, 1_000_000) if depth < args.rows]
+        for depth in depths:
+            cursor = None
+            if depth:
+                anchor = session.exec(ordered.offset(depth - 1).limit(1)).one()
+                cursor = encode_cursor((anchor.created_at, anchor.id))
+            results[depth] = {
+                "cursor_ms": median_ms(
+                    lambda: crud.audit.list_logs(session, cursor=cursor, limit=args.page_size), args.repeat
+                ),
+                "offset_ms": median_ms(
+                    lambda: session.exec(ordered.offset(depth).limit(args.page_size)).all(), args.repeat
+                ),
+            }
+            session.expunge_all()
+    print(json.dumps({"rows": args.rows, "page_size": args.page_size, "depths": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
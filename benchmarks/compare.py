@@ -0,0 +1,87 @@
+"""Compare two ``benchmarks.portal`` result files scenario by scenario.
+
+Prints throughput and p50/p99 latency of both runs with the relative change, and flags a
+scenario as a regression when its p50 or p99 latency grows, or its throughput drops, by
+more than ``--threshold`` (10% by default). Scenarios with errors in the new run are
+flagged as well. Exits with status 1 when anything regressed, so it can gate CI.
+
+Usage::
+
+    python -m benchmarks.portal --output before.json
+    git checkout my-change
+    python -m benchmarks.portal --output after.json
+    python -m benchmarks.compare before.json after.json --threshold 0.15
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Metric, and whether a larger value is better.
+METRICS = (("throughput_rps", True), ("p50_ms", False), ("p99_ms", False))
+
+
+def change(before: float, after: float) -> Optional[float]:
+    return None if not before else (after - before) / before
+
+
+def compare(before: Dict[str, dict], after: Dict[str, dict], threshold: float) -> List[dict]:
+    rows = []
+    for name in sorted(set(before) | set(after)):
+        old, new = before.get(name), after.get(name)
+        row: Dict[str, object] = {"scenario": name, "regressions": []}
+        if old is None or new is None:
+            row["note"] = "only in before" if new is None else "only in after"
+            rows.append(row)
+            continue
+        for metric, higher_is_better in METRICS:
+            delta = change(old[metric], new[metric])
+            row[metric] = (old[metric], new[metric], delta)
+            if delta is not None and (-delta if higher_is_better else delta) > threshold:
+                row["regressions"].append(metric)
+        if new.get("errors"):
+            row["regressions"].append("errors")
+        rows.append(row)
+    return rows
+
+
+def format_cell(values) -> str:
+    old, new, delta = values
+    return f"{old:>9.2f} -> {new:>9.2f} ({'n/a' if delta is None else f'{delta:+.0%}':>5})"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before", type=Path)
+    parser.add_argument("after", type=Path)
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change treated as a regression")
+    args = parser.parse_args()
+
+    before, after = (json.loads(path.read_text()) for path in (args.before, args.after))
+    for label, report in (("before", before), ("after", after)):
+        meta = report.get("meta", {})
+        print(f"{label}: revision {meta.get('revision')}, scale {meta.get('scale')}, "
+              f"concurrency {meta.get('concurrency')}, {meta.get('database')}")
+    if before.get("meta", {}).get("volumes") != after.get("meta", {}).get("volumes"):
+        print("warning: the runs seeded different data volumes")
+
+    rows = compare(before["scenarios"], after["scenarios"], args.threshold)
+    print(f"\n{'scenario':<22} {'throughput (req/s)':<30}  {'p50 (ms)':<30}  {'p99 (ms)':<30}")
+    for row in rows:
+        if "note" in row:
+            print(f"{row['scenario']:<22} {row['note']}")
+            continue
+        cells = "  ".join(format_cell(row[metric]) for metric, _ in METRICS)
+        flag = f"  REGRESSED: {', '.join(row['regressions'])}" if row["regressions"] else ""
+        print(f"{row['scenario']:<22} {cells}{flag}")
+
+    regressed = [row["scenario"] for row in rows if row["regressions"]]
+    print(f"\n{len(regressed)} of {len(rows)} scenarios regressed beyond {args.threshold:.0%}")
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Benchmark: disk and bandwidth savings of compressed storage per codec.
+
+Generates a corpus of the formats members exchange (XML, JSON, CSV, WSDL) plus random
+binary data, ``--size-mib`` of each, and stores it with every available codec (``none``,
+``gzip`` and, with zstandard installed, ``zstd``). For each codec it reports the bytes on
+disk, upload throughput, and for downloads built by the real response code: bytes sent to
+clients accepting the codec, bytes and throughput of decompressing for those that do not,
+and latency of 4 KiB range reads.
+
+Usage::
+
+    python -m benchmarks.compression --size-mib 16 --frame-size 1048576
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import json
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from starlette.requests import Request
+
+from app.storage.codecs import CODECS
+from app.storage.file_service import FileService
+from app.storage.responses import build_download_response
+
+RANGE_READS = 200
+
+
+def generate(kind: str, size: int, rng: random.Random) -> bytes:
+    rows: List[str] = []
+    total = index = 0
+    while total < size:
+        index += 1
+        code, members = rng.randrange(10 ** 8), rng.randrange(1, 500)
+        if kind == "xml":
+            row = (f'<member id="{index}" class="GOV"><code>{code}</code><name>Organisation {index}</name>'
+                   f'<subsystems>{members}</subsystems></member>\n')
+        elif kind == "json":
+            row = json.dumps({"id": index, "code": code, "name": f"Organisation {index}",
+                              "subsystems": members}) + ",\n"
+        elif kind == "csv":
+            row = f"{index},{code},Organisation {index},{members},{rng.random():.6f}\n"
+        else:
+            row = (f'<wsdl:operation name="op{index}"><soap:operation soapAction="urn:op{code}"/>'
+                   f'<wsdl:input><soap:body use="literal"/></wsdl:input></wsdl:operation>\n')
+        rows.append(row)
+        total += len(row)
+    return "".join(rows).encode()[:size]
+
+
+def corpus(size: int, seed: int) -> Dict[str, bytes]:
+    rng = random.Random(seed)
+    files = {f"sample.{kind}": generate(kind, size, rng) for kind in ("xml", "json", "csv", "wsdl")}
+    files["sample.bin"] = rng.randbytes(size)
+    return files
+
+
+def download(service: FileService, stored, filename: str, headers: Dict[str, str]):
+    """Build the download response the API would send and collect its body."""
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/files/1",
+        "query_string": b"",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+    }
+    response = build_download_response(
+        Request(scope), storage=service, key=stored.key, size=stored.size, filename=filename,
+        last_modified=datetime.utcnow(), etag=f'"{stored.checksum}"', encoding=stored.encoding,
+    )
+
+    async def body() -> bytes:
+        if hasattr(response, "body_iterator"):
+            return b"".join([chunk async for chunk in response.body_iterator])
+        return Path(response.path).read_bytes()
+
+    return response, asyncio.run(body())
+
+
+def run_codec(root: Path, codec: str, files: Dict[str, bytes], frame_size: int, level: Optional[int]) -> dict:
+    service = FileService(base_dir=root / codec, codec=codec, codec_level=level, frame_size=frame_size)
+    raw = sum(len(data) for data in files.values())
+    results: Dict[str, dict] = {}
+    write_seconds = decode_seconds = 0.0
+    range_samples: List[float] = []
+    rng = random.Random(0)
+    for filename, data in files.items():
+        began = time.perf_counter()
+        stored = service.put_stream(io.BytesIO(data), filename)
+        write_seconds += time.perf_counter() - began
+
+        encoded_response, encoded = download(service, stored, filename, {"Accept-Encoding": codec})
+        began = time.perf_counter()
+        _, identity = download(service, stored, filename, {"Accept-Encoding": "identity"})
+        decode_seconds += time.perf_counter() - began
+        assert identity == data, f"{codec} round trip of {filename} failed"
+        for _ in range(RANGE_READS):
+            start = rng.randrange(len(data) - 4096)
+            began = time.perf_counter()
+            _, part = download(service, stored, filename, {"Range": f"bytes={start}-{start + 4095}"})
+            range_samples.append((time.perf_counter() - began) * 1000)
+            assert part == data[start:start + 4096], f"{codec} range of {filename} failed"
+
+        results[filename] = {
+            "raw_bytes": len(data),
+            "stored_bytes": service.stat(stored.key).size,
+            "ratio": round(len(data) / service.stat(stored.key).size, 2),
+            "encoded": stored.encoding is not None,
+            "sent_bytes_accepting": len(encoded),
+            "content_encoding": encoded_response.headers.get("content-encoding"),
+        }
+
+    stored_total = sum(result["stored_bytes"] for result in results.values())
+    sent_total = sum(result["sent_bytes_accepting"] for result in results.values())
+    ordered = sorted(range_samples)
+    return {
+        "raw_bytes": raw,
+        "stored_bytes": stored_total,
+        "disk_savings": round(1 - stored_total / raw, 3),
+        "sent_bytes_accepting": sent_total,
+        "bandwidth_savings": round(1 - sent_total / raw, 3),
+        "upload_mib_s": round(raw / 2 ** 20 / write_seconds, 1),
+        "identity_download_mib_s": round(raw / 2 ** 20 / decode_seconds, 1),
+        "range_4k_p50_ms": round(statistics.median(ordered), 3),
+        "range_4k_p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 3),
+        "files": results,
+    }
+
+
+def available_codecs() -> List[str]:
+    codecs = ["none"]
+    for name, codec_class in CODECS.items():
+        try:
+            codec_class()
+        except RuntimeError:
+            continue
+        codecs.append(name)
+    return codecs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mib", type=float, default=4, help="Size of each generated file")
+    parser.add_argument("--frame-size", type=int, default=1024 * 1024, help="Original bytes per compressed frame")
+    parser.add_argument("--level", type=int, default=None, help="Compression level (codec default if unset)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    files = corpus(int(args.size_mib * 2 ** 20), args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        report = {
+            codec: run_codec(Path(tmp), codec, files, args.frame_size, args.level)
+            for codec in available_codecs()
+        }
+    print(json.dumps({"size_mib": args.size_mib, "frame_size": args.frame_size, "codecs": report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Benchmark: concurrent reads and writes under each database profile.
+
+For every profile (``default`` and ``tuned``, see ``app.database.engine_options``) a fresh
+SQLite database is created and ``--writers`` threads insert audit entries, one
+transaction each, while ``--readers`` threads page through the audit log, for
+``--seconds`` seconds. Reports throughput, p50/p99 latency and "database is locked"
+errors per profile.
+
+Usage::
+
+    python -m benchmarks.db_profiles --writers 8 --readers 8 --seconds 10
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 3)
+
+
+def summarize(samples: List[float], errors: int, seconds: float) -> Dict[str, float]:
+    return {
+        "ops_per_second": round(len(samples) / seconds, 1),
+        "p50_ms": round(statistics.median(samples), 3) if samples else 0.0,
+        "p99_ms": percentile(samples, 0.99),
+        "errors": errors,
+    }
+
+
+def run_profile(profile: str, workdir: Path, args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    from sqlalchemy import insert
+    from sqlalchemy.exc import OperationalError
+    from sqlmodel import Session, SQLModel
+
+    from app import crud, models
+    from app.database import create_db_engine
+
+    engine = create_db_engine(f"sqlite:///{workdir / f'{profile}.db'}", profile)
+    SQLModel.metadata.create_all(engine)
+    stop = threading.Event()
+    latencies: Dict[str, List[float]] = {"write": [], "read": []}
+    errors = {"write": 0, "read": 0}
+    lock = threading.Lock()
+
+    def write(session: Session) -> None:
+        session.execute(
+            insert(models.AuditLog),
+            {"actor_id": 1, "action": "file.uploaded", "target_type": "file", "target_id": 1,
+             "details": "x" * 200, "created_at": datetime.utcnow()},
+        )
+        session.commit()
+
+    def read(session: Session) -> None:
+        crud.audit.list_logs(session, limit=50)
+        session.rollback()
+
+    def worker(kind: str, operation) -> None:
+        with Session(engine) as session:
+            while not stop.is_set():
+                began = time.perf_counter()
+                try:
+                    operation(session)
+                except OperationalError:
+                    session.rollback()
+                    with lock:
+                        errors[kind] += 1
+                    continue
+                elapsed = (time.perf_counter() - began) * 1000
+                with lock:
+                    latencies[kind].append(elapsed)
+
+    threads = [threading.Thread(target=worker, args=("write", write)) for _ in range(args.writers)]
+    threads += [threading.Thread(target=worker, args=("read", read)) for _ in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    return {kind: summarize(latencies[kind], errors[kind], args.seconds) for kind in latencies}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--profiles", nargs="+", default=["default", "tuned"])
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="db-profiles-"))
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{workdir / 'app.db'}")
+    os.environ.setdefault("UPLOAD_DIR", str(workdir / "files"))
+
+    results = {profile: run_profile(profile, workdir, args) for profile in args.profiles}
+    print(json.dumps({"writers": args.writers, "readers": args.readers, "seconds": args.seconds,
+                      "profiles": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
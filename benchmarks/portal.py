@@ -0,0 +1,373 @@
+"""Benchmark suite: throughput and latency of the main portal endpoints on seeded data.
+
+Seeds a throw-away SQLite database (or an empty database given with ``--database-url``)
+with ``--scale`` times the reference volumes of 10k members, 100k users, 1M files and
+10M audit entries, boots ``app.main:app`` under uvicorn against it, and drives each
+scenario with ``--concurrency`` concurrent clients:
+
+* ``auth_token``: password logins of random seeded users,
+* ``members_me``, ``members_list``, ``users_list``: authenticated reads,
+* ``files_list``, ``files_list_shared``: a member's files, own and shared with it,
+* ``upload_<size>`` and ``download_<size>`` for every ``--file-sizes`` entry,
+* ``share`` and ``share_patch``: granting and revoking file shares,
+* ``audit_list``, ``audit_filtered``: audit log pages.
+
+Each scenario reports requests, errors, throughput and p50/p90/p99 latency. Results are
+printed as JSON, or written to ``--output``; ``python -m benchmarks.compare`` compares
+two result files, e.g. from before and after a change. Runs with the same ``--seed``
+and volumes seed identical data.
+
+Usage::
+
+    pip install httpx uvicorn
+    python -m benchmarks.portal --scale 0.01 --output before.json
+    python -m benchmarks.portal --scale 1 --requests 2000 --concurrency 32 --output full.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from .upload_concurrency import wait_until_ready
+
+ADMIN_USERNAME = "bench-admin"
+ADMIN_PASSWORD = "bench-password"
+USER_PASSWORD = "bench-user-password"
+
+# Volumes at --scale 1.
+VOLUMES = {"members": 10_000, "users": 100_000, "files": 1_000_000, "audit": 10_000_000}
+SHARED_FILE_RATIO = 0.1
+BATCH_SIZE = 10_000
+
+EXTENSIONS = ("pdf", "xml", "json", "csv", "zip", "txt")
+ACTIONS = ("file.uploaded", "file.shared", "file.downloaded", "file.deleted", "user.created", "user.updated")
+
+Scenario = Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+
+
+def volumes_for(scale: float) -> Dict[str, int]:
+    return {name: max(1, int(count * scale)) for name, count in VOLUMES.items()}
+
+
+def _insert(session, table, rows) -> None:
+    from sqlalchemy import insert
+
+    batch: List[dict] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            session.execute(insert(table), batch)
+            session.commit()
+            batch = []
+    if batch:
+        session.execute(insert(table), batch)
+        session.commit()
+
+
+def seed(volumes: Dict[str, int], rng: random.Random) -> Dict[str, float]:
+    """Insert the seeded rows in bulk, after the bootstrap roles and administrator."""
+
+    from sqlalchemy import select, text, update
+
+    from app import models
+    from app.database import get_session, init_db
+    from app.main import bootstrap_defaults
+    from app.security import get_password_hash
+
+    timings: Dict[str, float] = {}
+    init_db()
+    bootstrap_defaults()
+    members, users, files = volumes["members"], volumes["users"], volumes["files"]
+    now = datetime.utcnow()
+    # One bcrypt hash for every seeded user; hashing 100k passwords would dominate seeding.
+    hashed_password = get_password_hash(USER_PASSWORD)
+
+    with get_session() as session:
+        role_id = session.execute(select(models.Role.id).where(models.Role.name == "member")).scalar_one()
+        first_user = session.execute(select(models.User.id).order_by(models.User.id.desc())).scalars().first() + 1
+
+        started = time.perf_counter()
+        _insert(session, models.Member.__table__, (
+            {"id": index, "name": f"member-{index:06d}", "description": f"Seeded member {index}"}
+            for index in range(1, members + 1)
+        ))
+        # The administrator lists and uploads files as member 1.
+        session.execute(update(models.User).where(models.User.username == ADMIN_USERNAME).values(member_id=1))
+        session.commit()
+        timings["members"] = time.perf_counter() - started
+
+        # User i belongs to member i % members + 1, so members get users evenly.
+        started = time.perf_counter()
+        _insert(session, models.User.__table__, (
+            {
+                "id": first_user + index,
+                "username": f"user-{index:07d}",
+                "email": f"user-{index:07d}@example.com",
+                "full_name": f"Seeded User {index}",
+                "hashed_password": hashed_password,
+                "is_active": True,
+                "member_id": index % members + 1,
+            }
+            for index in range(users)
+        ))
+        _insert(session, models.UserRoleLink.__table__, (
+            {"user_id": first_user + index, "role_id": role_id} for index in range(users)
+        ))
+        timings["users"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+
+        def file_rows():
+            for index in range(1, files + 1):
+                owner = rng.randrange(users)
+                yield {
+                    "id": index,
+                    "filename": f"seed-{index:08d}",
+                    "original_filename": f"document-{index}.{rng.choice(EXTENSIONS)}",
+                    "path": f"seed/{index:08d}",
+                    # Mostly small documents with a long tail of large ones.
+                    "size": int(min(rng.lognormvariate(11, 2), 2 ** 31)),
+                    "uploaded_at": now - timedelta(seconds=rng.randrange(365 * 24 * 3600)),
+                    "owner_id": first_user + owner,
+                    "member_id": owner % members + 1,
+                }
+
+        _insert(session, models.FileAsset.__table__, file_rows())
+        shared = rng.sample(range(1, files + 1), int(files * SHARED_FILE_RATIO))
+        _insert(session, models.FileShare.__table__, (
+            {"file_id": file_id, "member_id": rng.randrange(1, members + 1), "granted_by_id": first_user,
+             "created_at": now}
+            for file_id in shared
+        ))
+        timings["files"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        audit_start = now - timedelta(seconds=volumes["audit"])
+        _insert(session, models.AuditLog.__table__, (
+            {
+                "actor_id": first_user + rng.randrange(users),
+                "action": rng.choice(ACTIONS),
+                "target_type": "file",
+                "target_id": rng.randrange(1, files + 1),
+                "details": None,
+                "created_at": audit_start + timedelta(seconds=index),
+            }
+            for index in range(volumes["audit"])
+        ))
+        timings["audit"] = time.perf_counter() - started
+
+        if session.get_bind().dialect.name == "postgresql":
+            # Rows were inserted with explicit ids; move the sequences past them.
+            for model in (models.Member, models.User, models.FileAsset):
+                table = model.__tablename__
+                session.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), (SELECT max(id) FROM \"{table}\"))"
+                ))
+            session.commit()
+    return {name: round(seconds, 2) for name, seconds in timings.items()}
+
+
+def start_server(port: int) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=dict(os.environ),
+    )
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, float]:
+    ordered = sorted(latencies)
+
+    def percentile(fraction: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 2)
+
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "throughput_rps": round(len(ordered) / elapsed, 2),
+        "mean_ms": round(statistics.fmean(ordered), 2),
+        "p50_ms": percentile(0.5),
+        "p90_ms": percentile(0.9),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(ordered[-1], 2),
+    }
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, requests: int, concurrency: int,
+                       warmup: int = 0) -> Dict[str, float]:
+    for index in range(warmup):
+        await scenario(client, index)
+    latencies: List[float] = []
+    errors = 0
+    indexes = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for index in indexes:
+            started = time.perf_counter()
+            try:
+                response = await scenario(client, index)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, requests))))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def benchmark(args: argparse.Namespace, volumes: Dict[str, int], rng: random.Random) -> Dict[str, dict]:
+    base_url = f"http://127.0.0.1:{args.port}"
+    results: Dict[str, dict] = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        await wait_until_ready(client)
+        token = await client.post("/auth/token", data={"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD})
+        token.raise_for_status()
+        headers = {"Authorization": f"Bearer {token.json()['access_token']}"}
+        members = volumes["members"]
+
+        def get(path: str, **params) -> Scenario:
+            return lambda client, index: client.get(path, params=params, headers=headers)
+
+        def login(client, index):
+            username = f"user-{rng.randrange(volumes['users']):07d}"
+            return client.post("/auth/token", data={"username": username, "password": USER_PASSWORD})
+
+        scenarios: Dict[str, tuple] = {
+            "auth_token": (login, args.auth_requests),
+            "members_me": (get("/members/me"), args.requests),
+            "members_list": (get("/members/", limit=100), args.requests),
+            "users_list": (get("/users/", limit=100), args.requests),
+            "files_list": (get("/files/", limit=100), args.requests),
+            "files_list_shared": (get("/files/", limit=100, scope="shared"), args.requests),
+            "audit_list": (get("/audit/", limit=100), args.requests),
+            "audit_filtered": (get("/audit/", limit=100, action="file.shared"), args.requests),
+        }
+        for name, (scenario, requests) in scenarios.items():
+            results[name] = await run_scenario(client, scenario, requests, args.concurrency, args.warmup)
+
+        uploaded: List[int] = []
+        for size_kib in args.file_sizes:
+            ids: List[int] = []
+
+            async def upload(client, index, size=size_kib * 1024, ids=ids):
+                # Random content, so storage deduplication does not skip the write.
+                payload = os.urandom(size)
+                response = await client.post(
+                    "/files/", files={"uploaded_file": (f"bench-{index}.bin", payload)}, headers=headers
+                )
+                if response.status_code < 400:
+                    ids.append(response.json()["id"])
+                return response
+
+            label = f"{size_kib}kib"
+            results[f"upload_{label}"] = await run_scenario(client, upload, args.upload_requests, args.concurrency)
+            if not ids:
+                continue
+            uploaded.extend(ids)
+            results[f"download_{label}"] = await run_scenario(
+                client, lambda client, index, ids=ids: client.get(f"/files/{ids[index % len(ids)]}", headers=headers),
+                args.requests, args.concurrency, args.warmup,
+            )
+
+        if uploaded:
+            def share(client, index):
+                file_id = uploaded[index % len(uploaded)]
+                member_ids = rng.sample(range(1, members + 1), min(5, members))
+                return client.post(f"/files/{file_id}/share", json={"member_ids": member_ids}, headers=headers)
+
+            def share_patch(client, index):
+                file_id = uploaded[index % len(uploaded)]
+                member_id = rng.randrange(1, members + 1)
+                patch = {"add": [member_id]} if index % 2 == 0 else {"remove": [member_id]}
+                return client.patch(f"/files/{file_id}/shares", json=patch, headers=headers)
+
+            results["share"] = await run_scenario(client, share, args.requests, args.concurrency)
+            results["share_patch"] = await run_scenario(client, share_patch, args.requests, args.concurrency)
+    return results
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=0.01, help="Fraction of the reference data volumes")
+    parser.add_argument("--database-url", default=None, help="Use an existing (empty) database instead of SQLite")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per read and share scenario")
+    parser.add_argument("--auth-requests", type=int, default=50, help="Logins measured (bcrypt-bound)")
+    parser.add_argument("--upload-requests", type=int, default=20, help="Uploads per file size")
+    parser.add_argument("--file-sizes", type=int, nargs="+", default=[4, 1024, 16 * 1024], help="Sizes in KiB")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured requests before each read scenario")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the seeded data and requests")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--output", type=Path, default=None, help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="portal-bench-"))
+    database_url = args.database_url or f"sqlite:///{workdir / 'bench.db'}"
+    os.environ.update(
+        DATABASE_URL=database_url,
+        UPLOAD_DIR=str(workdir / "files"),
+        INITIAL_ADMIN_USERNAME=ADMIN_USERNAME,
+        INITIAL_ADMIN_PASSWORD=ADMIN_PASSWORD,
+    )
+    rng = random.Random(args.seed)
+    volumes = volumes_for(args.scale)
+    # Settings are read at import time, so the app is imported (by seed) once the environment is set.
+    seed_seconds = seed(volumes, rng)
+
+    server = start_server(args.port)
+    try:
+        scenarios = asyncio.run(benchmark(args, volumes, rng))
+    finally:
+        server.terminate()
+        server.wait()
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "started_at": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "database": database_url.split(":", 1)[0],
+            "scale": args.scale,
+            "volumes": volumes,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+        },
+        "seed_seconds": seed_seconds,
+        "scenarios": scenarios,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
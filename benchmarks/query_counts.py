@@ -0,0 +1,137 @@
+"""Check: SQL queries issued by list endpoints stay fixed as the number of rows grows.
+
+Runs the app in-process against a throw-away SQLite database, seeds members, users with
+roles, roles with permissions and shared files, and counts the statements each list
+endpoint executes at two data sizes. An endpoint fails when it exceeds its budget or
+when its count changes with the number of rows (an N+1 lazy load). Exits with status 1
+on failure, so it can run in CI.
+
+Usage::
+
+    pip install httpx
+    python -m benchmarks.query_counts --small 5 --large 50 [--show-sql]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+
+# Queries per request once the caller's principal is cached.
+BUDGETS = {
+    "/members/": 1,
+    "/roles/": 2,
+    "/users/": 3,
+    "/files/": 2,
+}
+
+
+def seed(session, models, *, home_member_id: int, admin_id: int, start: int, stop: int) -> None:
+    for index in range(start, stop):
+        member = models.Member(name=f"bench-member-{index}")
+        role = models.Role(name=f"bench-role-{index}")
+        session.add(member)
+        session.add(role)
+        session.flush()
+        for permission in ("view:audit_logs", "manage:files", "manage:members"):
+            session.add(models.RolePermission(role_id=role.id, permission=permission))
+
+        user = models.User(
+            username=f"bench-user-{index}",
+            email=f"bench-user-{index}@example.com",
+            hashed_password="!",
+            member_id=member.id,
+        )
+        session.add(user)
+        session.flush()
+        session.add(models.UserRoleLink(user_id=user.id, role_id=role.id))
+
+        # Alternate between files owned by the caller's member and files shared with it.
+        owner_member = home_member_id if index % 2 else member.id
+        file = models.FileAsset(
+            filename=f"bench-{index}.bin",
+            original_filename=f"bench-{index}.bin",
+            path=f"bench-{index}.bin",
+            size=0,
+            owner_id=admin_id,
+            member_id=owner_member,
+        )
+        session.add(file)
+        session.flush()
+        shared_with = {member.id, home_member_id} - {owner_member}
+        for member_id in shared_with:
+            session.add(models.FileShare(file_id=file.id, member_id=member_id, granted_by_id=admin_id))
+    session.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--small", type=int, default=5, help="Rows of each kind in the first measurement")
+    parser.add_argument("--large", type=int, default=50, help="Rows of each kind in the second measurement")
+    parser.add_argument("--show-sql", action="store_true", help="Print the statements of failing endpoints")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="query-counts-"))
+    os.environ.update(DATABASE_URL=f"sqlite:///{workdir / 'bench.db'}", UPLOAD_DIR=str(workdir / "files"))
+
+    # Settings are read at import time, so the app is imported once the environment is set.
+    from fastapi.testclient import TestClient
+
+    from app import crud, models
+    from app.config import get_settings
+    from app.core.queries import count_queries
+    from app.database import engine, get_session
+    from app.main import app
+
+    settings = get_settings()
+    counts: Dict[str, Dict[int, int]] = {path: {} for path in BUDGETS}
+    statements: Dict[str, List[str]] = {}
+    with TestClient(app) as client:
+        with get_session() as session:
+            admin = crud.user.get_user_by_username(session, settings.initial_admin_username)
+            home = models.Member(name="bench-home")
+            session.add(home)
+            session.flush()
+            admin.member_id = home.id
+            session.add(admin)
+            session.commit()
+            admin_id, home_member_id = admin.id, home.id
+
+        response = client.post(
+            "/auth/token",
+            data={"username": settings.initial_admin_username, "password": settings.initial_admin_password},
+        )
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        seeded = 0
+        for size in (args.small, args.large):
+            with get_session() as session:
+                seed(session, models, home_member_id=home_member_id, admin_id=admin_id, start=seeded, stop=size)
+            seeded = size
+            for path in BUDGETS:
+                client.get(path, headers=headers).raise_for_status()  # warm the principal cache
+                with count_queries(engine) as counter:
+                    client.get(path, headers=headers).raise_for_status()
+                counts[path][size] = counter.count
+                statements[path] = counter.statements
+
+    results = {}
+    failed = False
+    for path, budget in BUDGETS.items():
+        observed = counts[path]
+        ok = len(set(observed.values())) == 1 and max(observed.values()) <= budget
+        failed |= not ok
+        results[path] = {"budget": budget, "queries": observed, "ok": ok}
+        if not ok and args.show_sql:
+            print(f"-- {path}", *statements[path], sep="\n", file=sys.stderr)
+    print(json.dumps({"results": results}, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
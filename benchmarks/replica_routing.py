@@ -0,0 +1,122 @@
+"""Check: GET endpoints read from a replica only while that is safe.
+
+Runs the app in-process with a SQLite primary and a SQLite replica kept in sync by
+copying the primary with the SQLite backup API, then verifies that:
+
+* reads go to the replica once it has caught up,
+* a caller reads its own write from the primary right after making it,
+* reads fall back to the primary when the replica lags more than
+  ``REPLICA_MAX_LAG_SECONDS`` or cannot be opened.
+
+PostgreSQL streaming replicas are routed the same way; point ``DATABASE_URL`` and
+``DATABASE_REPLICA_URLS`` at them to exercise the app manually. Exits with status 1
+on failure, so it can run in CI.
+
+Usage::
+
+    pip install httpx
+    python -m benchmarks.replica_routing
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict
+
+
+def sync(primary: Path, replica: Path) -> None:
+    source = sqlite3.connect(primary)
+    target = sqlite3.connect(replica)
+    with target:
+        source.backup(target)
+    source.close()
+    target.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-lag", type=float, default=1.0, help="REPLICA_MAX_LAG_SECONDS used for the check")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="replica-routing-"))
+    primary, replica = workdir / "primary.db", workdir / "replica.db"
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{primary}",
+        DATABASE_REPLICA_URLS=json.dumps([f"sqlite:///{replica}"]),
+        REPLICA_MAX_LAG_SECONDS=str(args.max_lag),
+        # Lag is measured explicitly below rather than by the background monitor.
+        REPLICA_CHECK_INTERVAL_SECONDS="3600",
+        UPLOAD_DIR=str(workdir / "files"),
+    )
+
+    # Settings are read at import time, so the app is imported once the environment is set.
+    from fastapi.testclient import TestClient
+
+    from app.config import get_settings
+    from app.core.replicas import replicas
+    from app.main import app
+
+    settings = get_settings()
+    credentials = {"username": settings.initial_admin_username, "password": settings.initial_admin_password}
+    results: Dict[str, bool] = {}
+
+    def served_by(client: TestClient, headers: dict) -> str:
+        before = replicas.replica_reads
+        client.get("/members/", headers=headers).raise_for_status()
+        return "replica" if replicas.replica_reads > before else "primary"
+
+    def catch_up() -> None:
+        # Replicate the latest heartbeat, as a streaming replica would within a check interval.
+        replicas.check()
+        sync(primary, replica)
+        replicas.check()
+
+    def names(client: TestClient, headers: dict) -> set:
+        return {member["name"] for member in client.get("/members/", headers=headers).json()}
+
+    with TestClient(app) as client:
+        writer = {"Authorization": f"Bearer {client.post('/auth/token', data=credentials).json()['access_token']}"}
+        time.sleep(1.1)  # tokens are issued per second; make the second one differ
+        reader = {"Authorization": f"Bearer {client.post('/auth/token', data=credentials).json()['access_token']}"}
+        client.get("/members/", headers=writer)  # cache both principals
+        client.get("/members/", headers=reader)
+
+        catch_up()
+        results["reads use a caught-up replica"] = served_by(client, reader) == "replica"
+
+        client.post("/members/", json={"name": "written-after-sync"}, headers=writer).raise_for_status()
+        results["writer reads its own write from the primary"] = (
+            served_by(client, writer) == "primary" and "written-after-sync" in names(client, writer)
+        )
+        results["other callers keep reading the replica"] = served_by(client, reader) == "replica"
+
+        time.sleep(args.max_lag + 0.2)
+        replicas.check()
+        results["lagging replica is skipped"] = served_by(client, reader) == "primary"
+
+        catch_up()
+        results["replica used again after catching up"] = (
+            served_by(client, reader) == "replica" and "written-after-sync" in names(client, reader)
+        )
+
+        # A directory in place of the database file makes every new connection fail.
+        for path in workdir.glob("replica.db*"):
+            path.unlink()
+        replica.mkdir()
+        replicas.replicas[0].engine.dispose()
+        results["unavailable replica falls back to the primary"] = served_by(client, reader) == "primary"
+        replicas.check()
+        results["unavailable replica stays out of rotation"] = served_by(client, reader) == "primary"
+
+    print(json.dumps({"results": results}, indent=2))
+    sys.exit(0 if all(results.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
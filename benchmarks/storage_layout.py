@@ -0,0 +1,88 @@
+"""Benchmark: file create/open latency in a flat directory versus a fanned-out layout.
+
+Creates ``--files`` small files in each layout under a temporary directory (use a path
+on the same filesystem as ``UPLOAD_DIR`` for meaningful numbers) and reports create
+latency over the whole run plus open latency for random lookups once the directory is
+full. Creating 1M files needs a few GB of inodes and several minutes per layout.
+
+Usage::
+
+    python -m benchmarks.storage_layout --files 1000000 --levels 2 --width 2
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List
+
+from app.storage.file_service import FileService
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "p50_us": round(statistics.median(ordered), 2),
+        "p99_us": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 2),
+        "max_us": round(ordered[-1], 2),
+    }
+
+
+def run_layout(root: Path, files: int, lookups: int, levels: int, width: int) -> Dict[str, object]:
+    service = FileService(base_dir=root, fanout_levels=levels, fanout_width=width)
+    payload = b"x" * 128
+    names: List[str] = []
+    create_samples: List[float] = []
+    started = time.perf_counter()
+    for _ in range(files):
+        name = uuid.uuid4().hex
+        path = service.resolve(service.key_for(name))
+        began = time.perf_counter()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("wb") as handle:
+            handle.write(payload)
+        create_samples.append((time.perf_counter() - began) * 1e6)
+        names.append(name)
+    create_seconds = time.perf_counter() - started
+
+    open_samples: List[float] = []
+    for name in random.sample(names, min(lookups, len(names))):
+        path = service.resolve(service.key_for(name))
+        began = time.perf_counter()
+        with path.open("rb") as handle:
+            handle.read(1)
+        open_samples.append((time.perf_counter() - began) * 1e6)
+
+    return {
+        "levels": levels,
+        "width": width,
+        "create_total_s": round(create_seconds, 2),
+        "create": percentiles(create_samples),
+        "create_last_10pct": percentiles(create_samples[-max(1, files // 10):]),
+        "open": percentiles(open_samples),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=10_000)
+    parser.add_argument("--levels", type=int, default=2, help="Fan-out levels of the sharded layout")
+    parser.add_argument("--width", type=int, default=2, help="Hex characters per fan-out level")
+    parser.add_argument("--dir", type=Path, default=None, help="Parent directory for the temporary trees")
+    args = parser.parse_args()
+
+    results = {}
+    for label, levels in (("flat", 0), ("sharded", args.levels)):
+        with tempfile.TemporaryDirectory(dir=args.dir) as workdir:
+            results[label] = run_layout(Path(workdir), args.files, args.lookups, levels, args.width)
+    print(json.dumps({"files": args.files, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
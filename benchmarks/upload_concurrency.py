@@ -0,0 +1,149 @@
+"""Load test: latency of light requests while large uploads are in flight.
+
+Boots ``app.main:app`` under uvicorn against a throw-away SQLite database and upload
+directory, then measures ``GET /health`` and ``GET /files/`` latency first on an idle
+server and again while several large uploads run concurrently. With blocking work kept
+off the event loop both series should stay roughly flat.
+
+Usage::
+
+    pip install httpx
+    python -m benchmarks.upload_concurrency --uploads 4 --upload-mb 256
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+ADMIN_USERNAME = "bench-admin"
+ADMIN_PASSWORD = "bench-password"
+
+
+def start_server(workdir: Path, port: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update(
+        DATABASE_URL=f"sqlite:///{workdir / 'bench.db'}",
+        UPLOAD_DIR=str(workdir / "files"),
+        INITIAL_ADMIN_USERNAME=ADMIN_USERNAME,
+        INITIAL_ADMIN_PASSWORD=ADMIN_PASSWORD,
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Server did not start in time")
+
+
+async def authenticate(client: httpx.AsyncClient) -> Dict[str, str]:
+    response = await client.post("/auth/token", data={"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD})
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    member = await client.post("/members/", json={"name": "bench-member"}, headers=headers)
+    member.raise_for_status()
+    # The bootstrap administrator is the first row of the fresh benchmark database.
+    await client.put("/users/1", json={"member_id": member.json()["id"]}, headers=headers)
+    return headers
+
+
+async def sample_latency(client: httpx.AsyncClient, path: str, headers: Dict[str, str], stop: asyncio.Event,
+                         interval: float) -> List[float]:
+    samples: List[float] = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.get(path, headers=headers)
+        response.raise_for_status()
+        samples.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(interval)
+    return samples
+
+
+async def upload(client: httpx.AsyncClient, headers: Dict[str, str], size: int) -> None:
+    with tempfile.TemporaryFile() as payload:
+        chunk = os.urandom(1024 * 1024)
+        for _ in range(size // len(chunk)):
+            payload.write(chunk)
+        payload.seek(0)
+        response = await client.post(
+            "/files/", files={"uploaded_file": ("payload.bin", payload)}, headers=headers, timeout=None
+        )
+        response.raise_for_status()
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(statistics.median(ordered), 2),
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 2),
+        "max_ms": round(ordered[-1], 2),
+    }
+
+
+async def measure(client: httpx.AsyncClient, headers: Dict[str, str], args: argparse.Namespace,
+                  during_uploads: bool) -> Dict[str, Dict[str, float]]:
+    stop = asyncio.Event()
+    samplers = [
+        asyncio.create_task(sample_latency(client, path, headers, stop, args.interval))
+        for path in ("/health", "/files/")
+    ]
+    if during_uploads:
+        await asyncio.gather(*(upload(client, headers, args.upload_mb * 1024 * 1024) for _ in range(args.uploads)))
+    else:
+        await asyncio.sleep(args.idle_seconds)
+    stop.set()
+    health, files = await asyncio.gather(*samplers)
+    return {"health": summarize(health), "files": summarize(files)}
+
+
+async def run(args: argparse.Namespace) -> Dict[str, object]:
+    with tempfile.TemporaryDirectory() as workdir:
+        server = start_server(Path(workdir), args.port)
+        try:
+            base_url = f"http://127.0.0.1:{args.port}"
+            async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+                await wait_until_ready(client)
+                headers = await authenticate(client)
+            async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+                idle = await measure(client, headers, args, during_uploads=False)
+                loaded = await measure(client, headers, args, during_uploads=True)
+        finally:
+            server.terminate()
+            server.wait()
+    return {"uploads": args.uploads, "upload_mb": args.upload_mb, "idle": idle, "during_uploads": loaded}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=4, help="Concurrent uploads")
+    parser.add_argument("--upload-mb", type=int, default=256, help="Size of each upload in MiB")
+    parser.add_argument("--idle-seconds", type=float, default=5.0, help="Duration of the idle baseline")
+    parser.add_argument("--interval", type=float, default=0.05, help="Delay between latency probes")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# Settings are read when ``app`` is first imported, so point it at a scratch database and
+# upload directory before any test module imports it.
+_scratch = tempfile.mkdtemp(prefix="xroad-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_scratch}/test.db")
+os.environ.setdefault("UPLOAD_DIR", f"{_scratch}/files")
@@ -0,0 +1,31 @@
+import threading
+import time
+
+from app.services.audit import AuditWriter
+
+
+def test_stop_returns_when_the_queue_stays_full() -> None:
+    writer = AuditWriter(queue_size=1, batch_size=1, flush_interval=0, enqueue_timeout=0)
+    release = threading.Event()
+    written = []
+
+    def slow_write(batch, attempts=3) -> None:
+        release.wait(5)
+        written.extend(batch)
+
+    writer._write = slow_write
+    writer.start()
+    writer.submit({"action": "first"})
+    time.sleep(0.1)
+    writer._queue.put({"action": "queued"})
+
+    began = time.monotonic()
+    writer.stop(timeout=0.2)
+    assert time.monotonic() - began < 1
+
+    # The writer still finishes what was queued once the database responds again.
+    release.set()
+    deadline = time.monotonic() + 2
+    while len(written) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert written == [{"action": "first"}, {"action": "queued"}]
@@ -0,0 +1,57 @@
+from pathlib import Path
+
+import pytest
+from sqlalchemy import inspect, text
+from sqlmodel import Session, SQLModel
+
+from app import crud, database, models
+from app.database import create_db_engine
+
+
+@pytest.fixture
+def engine(tmp_path: Path, monkeypatch):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'migrate.db'}")
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE member DROP COLUMN storage_used"))
+    monkeypatch.setattr(database, "engine", engine)
+    yield engine
+    engine.dispose()
+
+
+def _member_columns(engine) -> set:
+    return {column["name"] for column in inspect(engine).get_columns("member")}
+
+
+def test_new_columns_are_added_to_existing_tables(engine) -> None:
+    assert database.init_db() == ["member.storage_used"]
+    assert "storage_used" in _member_columns(engine)
+
+
+def test_new_not_null_column_without_server_default_is_refused(engine, monkeypatch) -> None:
+    monkeypatch.setattr(models.Member.__table__.c.storage_used, "server_default", None)
+
+    with pytest.raises(RuntimeError, match="member.storage_used"):
+        database.init_db()
+    assert "storage_used" not in _member_columns(engine)
+
+
+def test_superseded_audit_indexes_are_dropped(engine) -> None:
+    with engine.begin() as connection:
+        connection.execute(text("CREATE INDEX ix_auditlog_action ON auditlog (action)"))
+
+    database.init_db()
+    assert "ix_auditlog_action" not in {index["name"] for index in inspect(engine).get_indexes("auditlog")}
+
+
+def test_archive_tables_get_indexes_added_since_they_were_created(engine) -> None:
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE auditlog_archive_202001 (id INTEGER NOT NULL, actor_id INTEGER, action VARCHAR NOT NULL, "
+            "target_type VARCHAR NOT NULL, target_id INTEGER, details VARCHAR, created_at DATETIME NOT NULL)"
+        ))
+
+    with Session(engine) as session:
+        crud.audit_archive.create_missing_indexes(session)
+    indexes = {index["name"] for index in inspect(engine).get_indexes("auditlog_archive_202001")}
+    assert "ix_auditlog_archive_202001_action_created_at_id" in indexes
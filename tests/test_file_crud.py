@@ -0,0 +1,129 @@
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from sqlalchemy import event
+from sqlmodel import Session, SQLModel, select
+
+from app import crud, models
+from app.database import create_db_engine
+
+
+@pytest.fixture
+def session(tmp_path: Path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'fk.db'}")
+
+    @event.listens_for(engine, "connect")
+    def _enforce_foreign_keys(dbapi_connection, _record) -> None:
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        member = models.Member(name="member")
+        session.add(member)
+        session.flush()
+        session.add(models.User(username="owner", email="owner@example.org", hashed_password="x",
+                                member_id=member.id))
+        session.commit()
+        crud.member.ensure_portal_usage(session)
+        yield session
+    engine.dispose()
+
+
+def _create(session: Session, name: str, **options) -> models.FileAsset:
+    owner = session.exec(select(models.User)).one()
+    options.setdefault("content_addressed", True)
+    return crud.file.create_file(
+        session, key=f"blobs/{'a' * 64}", owner_id=owner.id, member_id=owner.member_id,
+        original_filename=name, size=10, checksum="a" * 64, **options,
+    )
+
+
+def test_deleting_last_file_of_blob_with_foreign_keys_enforced(session: Session) -> None:
+    first, second = _create(session, "first.txt"), _create(session, "second.txt")
+
+    assert crud.file.delete_file(session, first) is False
+    assert crud.blob.get_blob(session, "a" * 64).ref_count == 1
+    assert crud.file.delete_file(session, second) is True
+    assert crud.blob.get_blob(session, "a" * 64).ref_count == 0
+
+    removed = []
+    assert crud.blob.purge_blob(session, "a" * 64, removed.append) is True
+    assert removed == [f"blobs/{'a' * 64}"]
+    assert crud.blob.get_blob(session, "a" * 64) is None
+
+
+def test_blob_referenced_again_before_its_purge_is_kept(session: Session) -> None:
+    crud.file.delete_file(session, _create(session, "first.txt", codec="gzip", stored_size=5, frame_size=8))
+    _create(session, "again.txt")
+
+    removed = []
+    assert crud.blob.purge_blob(session, "a" * 64, removed.append) is False
+    assert removed == []
+    stored_blob = crud.blob.get_blob(session, "a" * 64)
+    # The tombstone's object may be gone, so it takes the encoding of the copy placed now.
+    assert (stored_blob.ref_count, stored_blob.codec) == (1, None)
+
+
+def test_acquiring_a_blob_being_purged_waits_for_the_purge(session: Session) -> None:
+    crud.file.delete_file(session, _create(session, "first.txt"))
+    engine = session.get_bind()
+    removing, proceed = threading.Event(), threading.Event()
+    events = []
+
+    def remove(path: str) -> None:
+        removing.set()
+        proceed.wait(5)
+        events.append("removed")
+
+    def purge() -> None:
+        with Session(engine) as purging:
+            crud.blob.purge_blob(purging, "a" * 64, remove)
+
+    def upload() -> None:
+        with Session(engine) as uploading:
+            _create(uploading, "again.txt")
+            events.append("acquired")
+
+    purger = threading.Thread(target=purge)
+    purger.start()
+    assert removing.wait(5)
+    uploader = threading.Thread(target=upload)
+    uploader.start()
+    time.sleep(0.2)
+    assert uploader.is_alive()
+    proceed.set()
+    purger.join(5)
+    uploader.join(5)
+
+    # The upload placing its copy after acquiring cannot have it removed by the purge.
+    assert events == ["removed", "acquired"]
+    session.expire_all()
+    assert crud.blob.get_blob(session, "a" * 64).ref_count == 1
+
+
+def test_concurrent_uploads_cannot_overshoot_the_portal_quota(session: Session) -> None:
+    engine = session.get_bind()
+    start = threading.Barrier(6)
+    outcomes = []
+
+    def upload(number: int) -> None:
+        with Session(engine) as uploading:
+            start.wait(5)
+            try:
+                _create(uploading, f"{number}.txt", content_addressed=False, total_storage_quota=30)
+            except crud.member.StorageQuotaExceeded:
+                outcomes.append(False)
+            else:
+                outcomes.append(True)
+
+    threads = [threading.Thread(target=upload, args=(number,)) for number in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert sorted(outcomes) == [False] * 3 + [True] * 3
+    session.expire_all()
+    assert crud.member.get_total_storage_used(session) == 30
@@ -0,0 +1,29 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.metrics import statement_operation
+from app.main import app
+
+
+@pytest.mark.parametrize("statement, operation", [
+    ("SELECT 1", "select"),
+    ("\n  select id FROM member", "select"),
+    ("INSERT INTO auditlog VALUES (?)", "insert"),
+    ("UPDATE member SET storage_used = 0", "update"),
+    ("DELETE FROM fileshare", "delete"),
+    ("UPDATES", "other"),
+    ("PRAGMA journal_mode=WAL", "other"),
+    ("WITH recent AS (SELECT 1) SELECT * FROM recent", "other"),
+    ("", "other"),
+])
+def test_statement_operation(statement: str, operation: str) -> None:
+    assert statement_operation(statement) == operation
+
+
+def test_metrics_require_manage_settings() -> None:
+    with TestClient(app) as client:
+        assert client.get("/metrics").status_code == 401
+        token = client.post("/auth/token", data={"username": "admin", "password": "admin"}).json()["access_token"]
+        response = client.get("/metrics", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200
+        assert 'operation="select"' in response.text
@@ -0,0 +1,7 @@
+from sqlalchemy.orm import configure_mappers
+
+
+def test_app_imports_and_mappers_configure() -> None:
+    import app.main  # noqa: F401
+
+    configure_mappers()
@@ -0,0 +1,61 @@
+from pathlib import Path
+
+import anyio
+import pytest
+from starlette.requests import Request
+
+from app.storage.file_service import FileService
+from app.storage.multipart import MalformedUpload, receive_file
+
+BOUNDARY = "boundary"
+
+
+def _stalled_request(head: bytes) -> Request:
+    """A request sending ``head`` and then nothing more, as a slow or stuck client would."""
+
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": head, "more_body": True}
+        await anyio.sleep_forever()
+
+    return Request({
+        "type": "http",
+        "method": "POST",
+        "headers": [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())],
+    }, receive)
+
+
+def test_cancelled_upload_removes_partial_object(tmp_path: Path) -> None:
+    storage = FileService(base_dir=tmp_path, buffer_size=4, codec="none")
+    head = (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"uploaded_file\"; filename=\"a.txt\"\r\n"
+            f"\r\n").encode() + b"partial content"
+    request = _stalled_request(head)
+
+    async def upload() -> None:
+        with anyio.move_on_after(0.5):
+            await receive_file(request, storage, "uploaded_file")
+
+    anyio.run(upload)
+    assert not [path for path in tmp_path.rglob("*") if path.is_file()]
+
+
+@pytest.mark.parametrize("head", [
+    # Rejected once the part headers are parsed, without waiting for the file content.
+    f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"uploaded_file\"; filename=\"\"\r\n\r\n".encode(),
+    b"--not-the-boundary\r\n",
+    f"--{BOUNDARY}\r\nContent-Disposition form-data\r\n\r\n".encode(),
+])
+def test_malformed_upload_is_rejected_early(tmp_path: Path, head: bytes) -> None:
+    storage = FileService(base_dir=tmp_path, codec="none")
+
+    async def upload() -> None:
+        with anyio.fail_after(5):
+            await receive_file(_stalled_request(head), storage, "uploaded_file")
+
+    with pytest.raises(MalformedUpload):
+        anyio.run(upload)
+    assert not [path for path in tmp_path.rglob("*") if path.is_file()]
@@ -0,0 +1,29 @@
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlmodel import Session, SQLModel
+
+from app import models
+from app.core.replicas import Replica, ReplicaSet
+
+
+def _stamped_engine(path: Path):
+    engine = create_engine(f"sqlite:///{path}")
+    SQLModel.metadata.create_all(engine, tables=[models.ReplicationHeartbeat.__table__])
+    with Session(engine) as session:
+        session.add(models.ReplicationHeartbeat(id=1, beat_at=datetime.utcnow()))
+        session.commit()
+    return engine
+
+
+def test_replicas_are_measured_when_stamping_the_primary_fails(tmp_path: Path) -> None:
+    unreachable = create_engine(f"sqlite:///{tmp_path / 'missing' / 'primary.db'}")
+    healthy = Replica(name="healthy", engine=_stamped_engine(tmp_path / "replica.db"))
+    broken = Replica(name="broken", engine=unreachable, lag_seconds=0.1)
+    replicas = ReplicaSet(unreachable, [healthy, broken])
+
+    replicas.check()
+
+    assert healthy.lag_seconds is not None and healthy.usable
+    assert broken.lag_seconds is None and not broken.usable
@@ -0,0 +1,31 @@
+from pathlib import Path
+
+import pytest
+from sqlmodel import Session, SQLModel
+
+from app import crud
+from app.core import principals
+from app.database import create_db_engine
+
+
+@pytest.fixture
+def session(tmp_path: Path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'roles.db'}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def test_update_role_invalidates_principals_only_when_permissions_change(session: Session, monkeypatch) -> None:
+    invalidations = []
+    monkeypatch.setattr(principals, "invalidate_all", lambda: invalidations.append(True))
+    role = crud.role.create_role(session, "auditor", None, ["view_audit_logs"])
+    version = crud.permission.get_version(session)
+
+    crud.role.update_role(session, role, "Reads the audit log", ["view_audit_logs"])
+    assert (invalidations, crud.permission.get_version(session)) == ([], version)
+
+    crud.role.update_role(session, role, None, ["view_audit_logs", "manage_files"])
+    assert invalidations == [True]
+    assert crud.permission.get_version(session) > version
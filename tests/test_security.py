@@ -0,0 +1,18 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app import security
+
+
+def test_failed_submit_returns_its_hashing_slot(monkeypatch) -> None:
+    executor = ThreadPoolExecutor(max_workers=1)
+    executor.shutdown()
+    monkeypatch.setattr(security, "_hash_executor", executor)
+    monkeypatch.setattr(security, "_hash_slots", threading.BoundedSemaphore(1))
+
+    # With the slot leaked, the second attempt would be refused as busy instead.
+    for _ in range(2):
+        with pytest.raises(RuntimeError, match="shutdown"):
+            security.get_password_hash("secret")
@@ -0,0 +1,127 @@
+import hashlib
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import crud
+from app.database import get_session
+from app.main import app
+from app.routers import uploads
+from app.services import quotas
+from app.storage import storage
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        token = client.post("/auth/token", data={"username": "admin", "password": "admin"}).json()["access_token"]
+        client.headers["Authorization"] = f"Bearer {token}"
+        member = client.post("/members/", json={"name": f"uploads-{uuid.uuid4().hex[:8]}"}).json()
+        client.put("/users/1", json={"member_id": member["id"]})
+        yield client
+
+
+def test_complete_over_quota_discards_the_session(client: TestClient, monkeypatch) -> None:
+    upload = client.post("/uploads/", json={"filename": "data.csv", "size": 10}).json()
+    assert client.put(f"/uploads/{upload['id']}/parts/1", content=b"0123456789").status_code < 300
+
+    # The quota shrinks after the pre-promotion check, e.g. through a concurrent upload.
+    monkeypatch.setattr(uploads, "_check_upload_limit", lambda *args: None)
+    monkeypatch.setattr(quotas.settings, "member_storage_quota_bytes", 5)
+
+    response = client.post(f"/uploads/{upload['id']}/complete")
+    assert response.status_code == 413
+    assert client.post(f"/uploads/{upload['id']}/complete").status_code == 404
+    assert not storage.staging_path(upload["id"]).exists()
+
+
+def _start(client: TestClient, data: bytes, part_size: int) -> str:
+    upload = client.post("/uploads/", json={"filename": "data.csv", "size": len(data), "part_size": part_size}).json()
+    for number, offset in enumerate(range(0, len(data), part_size), start=1):
+        part = data[offset:offset + part_size]
+        response = client.put(
+            f"/uploads/{upload['id']}/parts/{number}",
+            content=part,
+            headers={"X-Checksum-SHA256": hashlib.sha256(part).hexdigest()},
+        )
+        assert response.status_code == 200
+    return upload["id"]
+
+
+def _downloaded(client: TestClient, file_id: int) -> bytes:
+    response = client.get(f"/files/{file_id}", headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    return response.content
+
+
+def test_failed_part_retry_marks_the_part_missing(client: TestClient) -> None:
+    data = b"0123456789abcdef"
+    upload_id = _start(client, data, 8)
+
+    response = client.put(
+        f"/uploads/{upload_id}/parts/1", content=b"XXXXXXXX", headers={"X-Checksum-SHA256": "0" * 64}
+    )
+    assert response.status_code == 400
+    assert client.get(f"/uploads/{upload_id}").json()["missing_parts"] == [1]
+    assert client.post(f"/uploads/{upload_id}/complete").json()["detail"] == {"missing_parts": [1]}
+
+    assert client.put(f"/uploads/{upload_id}/parts/1", content=data[:8]).status_code == 200
+    response = client.post(f"/uploads/{upload_id}/complete")
+    assert response.status_code == 201
+    assert _downloaded(client, response.json()["id"]) == data
+
+
+def test_complete_resends_parts_changed_since_they_were_received(client: TestClient) -> None:
+    data = b"0123456789abcdef"
+    upload_id = _start(client, data, 8)
+    with storage.staging_path(upload_id).open("r+b") as staged:
+        staged.seek(10)
+        staged.write(b"!!")
+
+    response = client.post(f"/uploads/{upload_id}/complete")
+    assert response.status_code == 409
+    assert response.json()["detail"] == {"missing_parts": [2]}
+
+    assert client.put(f"/uploads/{upload_id}/parts/2", content=data[8:]).status_code == 200
+    response = client.post(f"/uploads/{upload_id}/complete")
+    assert response.status_code == 201
+    assert _downloaded(client, response.json()["id"]) == data
+
+
+def test_only_one_request_completes_an_upload(client: TestClient) -> None:
+    upload_id = _start(client, b"0123456789", 10)
+    with get_session() as session:
+        # Another request is between its claim and the promotion.
+        assert crud.upload.claim_completion(session, crud.upload.get_upload(session, upload_id))
+
+    assert client.post(f"/uploads/{upload_id}/complete").status_code == 409
+    assert client.put(f"/uploads/{upload_id}/parts/1", content=b"0123456789").status_code == 409
+    assert storage.staging_path(upload_id).exists()
+
+
+def test_parts_of_an_aborted_upload_are_not_found(client: TestClient) -> None:
+    upload = client.post("/uploads/", json={"filename": "data.csv", "size": 10}).json()
+    assert client.delete(f"/uploads/{upload['id']}").status_code == 204
+
+    assert client.put(f"/uploads/{upload['id']}/parts/1", content=b"0123456789").status_code == 404
+    assert client.post(f"/uploads/{upload['id']}/complete").status_code == 404
+
+
+def test_complete_after_the_staged_file_is_gone_is_not_found(client: TestClient) -> None:
+    upload_id = _start(client, b"0123456789", 10)
+    storage.discard_staging(upload_id)
+
+    assert client.post(f"/uploads/{upload_id}/complete").status_code == 404
+    assert client.get(f"/uploads/{upload_id}").status_code == 404
+
+
+def test_configured_digests_are_recorded(client: TestClient, monkeypatch) -> None:
+    monkeypatch.setattr(uploads.settings, "upload_digest_algorithms", ["sha256", "md5"])
+    data = b"0123456789abcdef"
+    expected = {"sha256": hashlib.sha256(data).hexdigest(), "md5": hashlib.md5(data).hexdigest()}
+
+    response = client.post(f"/uploads/{_start(client, data, 8)}/complete")
+    assert response.json()["digests"] == expected
+    response = client.post("/files/", files={"uploaded_file": ("data.csv", data)})
+    assert response.json()["digests"] == expected